@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+
+# Time everything against the simulated devices, so this runs anywhere and run_steer doesn't move the robot
+os.environ.setdefault("CATBOT_DEVICES", "sim")
+os.environ.setdefault("CATBOT_HEADLESS", "1")
+
+import cv2
+import numpy as np
+import helper_camerakit as ck
+import helper_evac as evac
+import helper_intersections
+import helper_synthetic
+import replay
+
+# Times the vision and decision hot paths of the follower on a fixed synthetic frame corpus,
+# and fails if any path has slowed down too much against a stored baseline.
+#
+# Usage:
+#   python3 benchmark.py [max regression %]          Run, save benchmark_results.json, and compare to benchmark_baseline.json
+#   python3 benchmark.py baseline                    Run, and save the results as the new benchmark_baseline.json
+#
+# Baselines are only comparable on the same machine, so make one on the robot and one on each dev machine.
+# Busy or shared machines can vary by 30% between runs, so give a higher max regression there.
+# The exit code is 1 if a path's median time regressed by more than the max regression (default MAX_REGRESSION).
+# The median of the fastest round is compared rather than the mean, since a slow call (a context switch, a GC pause)
+# or a slow stretch (another process, CPU throttling) moves the mean a lot. Rounds interleave the paths, so a slow stretch
+# only spoils one round of each.
+
+CORPUS_SIZE = 90                # Frames, cycling through every helper_synthetic kind
+CORPUS_SEED = 0
+ROUNDS = 3                      # Times every path is timed, interleaved
+REPEATS = 5                     # Timed calls of each case in a round, after one untimed warm up call
+MAX_REGRESSION = 20             # %
+
+RESULTS_PATH = "benchmark_results.json"
+BASELINE_PATH = "benchmark_baseline.json"
+
+# From the CONFIGURATION section of follower.py
+BLACK_CONTOUR_THRESHOLD = 5000
+BAND_DETECTOR = "contour"
+
+def time_cases(func, cases: list) -> list:
+    """
+    Times a function on every case.
+
+    Args:
+        func (callable): The function to time.
+        cases (list[tuple]): The arguments of each call.
+
+    Returns:
+        list[float]: The time of each call in microseconds.
+    """
+    times = []
+    for args in cases:
+        func(*args)
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            func(*args)
+            times.append((time.perf_counter() - start) * 1e6)
+    return times
+
+def summarise(rounds: list) -> dict:
+    """
+    Args:
+        rounds (list[list[float]]): The call times of each round.
+
+    Returns:
+        dict: {calls, mean_us, median_us (of the fastest round), p95_us, ops_per_sec}.
+    """
+    times = np.concatenate(rounds)
+    return {
+        "calls": len(times),
+        "mean_us": round(float(times.mean()), 1),
+        "median_us": round(float(min(np.median(times) for times in rounds)), 1),
+        "p95_us": round(float(np.percentile(times, 95)), 1),
+        "ops_per_sec": round(1e6 / float(times.mean()), 1),
+    }
+
+# -------------
+# INTERSECTIONS
+# -------------
+def three_way_cut(line: np.ndarray, white_contours: list, black_contours: list) -> list:
+    """
+    The 3 white contour intersection branch of follower.py, once the robot is in the intersection:
+    finds the split line, checks for the evac entrance, and cuts the line mask.
+
+    Returns:
+        list: The black contours of the cut line mask.
+    """
+    split = helper_intersections.three_way_split(white_contours, line.shape)
+    helper_intersections.is_evac_entrance(line, black_contours, split["edges_big"], BAND_DETECTOR)
+    cut_direction, _ = helper_intersections.three_way_cut_direction(split, "3-ng")
+    new_line = helper_intersections.three_way_cut(line.copy(), split, cut_direction)
+    return cv2.findContours(cv2.bitwise_not(new_line), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+
+def four_way_cut(line: np.ndarray, white_contours: list) -> list:
+    """
+    The 4 white contour intersection branch of follower.py.
+
+    Returns:
+        list: The black contours of the cut line mask.
+    """
+    new_line = helper_intersections.four_way_cut(line.copy(), white_contours)
+    return cv2.findContours(cv2.bitwise_not(new_line), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+
+# ---------
+# BENCHMARK
+# ---------
+def run_benchmarks() -> dict:
+    """
+    Builds the corpus, prepares the inputs of every path outside of the timed calls, and times each path.
+
+    Returns:
+        dict: The timings of each path, keyed by name.
+    """
+    import helper_camera
+    import helper_motorkit as m
+
+    generator = helper_synthetic.FrameGenerator(helper_synthetic.load_camera_geometry(), seed=CORPUS_SEED)
+    corpus = generator.corpus(CORPUS_SIZE)
+
+    # Load the config like replay.py does for a synth frames directory, with the calibration that matches the corpus
+    with tempfile.TemporaryDirectory() as frames_dir:
+        with open(os.path.join(frames_dir, "calibration.json"), "w") as json_file:
+            json.dump(generator.calibration_data(), json_file)
+        processing_conf, config_values = replay.load_config(frames_dir)
+
+    cam = helper_camera.CameraStream(0, processing_conf)
+
+    def process_frame(frame):
+        cam.frame = frame
+        cam.process_frame()
+
+    cases = {
+        "process_frame": [],
+        "find_best_contours": [],
+        "cut_mask_with_line": [],
+        "intersection_3way": [],
+        "intersection_4way": [],
+        "green_turn": [],
+        "evac_preprocess": [],
+        "evac_hough": [],
+        "run_steer": [],
+    }
+
+    for name, frame, truth in corpus:
+        cases["process_frame"].append((frame,))
+        processed = ck.processFrame(frame, processing_conf)
+        line = processed["line"]
+
+        if truth["kind"] == "evac":
+            cases["evac_preprocess"].append((processed["gray"], config_values["calibration_map_rescue"], config_values["black_rescue_threshold"]))
+            images = evac.preprocess(processed["gray"], config_values["calibration_map_rescue"], config_values["black_rescue_threshold"])
+            cases["evac_hough"].append((images["blurred"], config_values["rescue_circle_conf"]))
+            continue
+
+        black_contours = cv2.findContours(cv2.bitwise_not(line), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+        last_line_pos = np.array([truth["line_x"] if truth["line_x"] is not None else line.shape[1] / 2, line.shape[0] - 30])
+        cases["find_best_contours"].append((black_contours, BLACK_CONTOUR_THRESHOLD, last_line_pos))
+
+        white_contours = cv2.findContours(line, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+        white_contours = [c for c in white_contours if cv2.contourArea(c) > 1000]
+        if len(white_contours) == 3:
+            cases["intersection_3way"].append((line, white_contours, black_contours))
+        elif len(white_contours) == 4:
+            cases["intersection_4way"].append((line, white_contours))
+            for p1, p2, direction in helper_intersections.four_way_cut_points(white_contours, line.shape):
+                cases["cut_mask_with_line"].append((p1, p2, line.copy(), direction))
+
+        for white_contour in replay.followable_green_contours(processed):
+            cases["green_turn"].append((line, white_contour, True))
+
+    # Steering commands like the follower's, from hard left to hard right
+    for offset in np.linspace(-60, 60, 25):
+        cases["run_steer"].append((30, 100, float(offset)))
+
+    functions = {
+        "process_frame": process_frame,
+        "find_best_contours": ck.findBestContours,
+        "cut_mask_with_line": helper_intersections.CutMaskWithLine,
+        "intersection_3way": three_way_cut,
+        "intersection_4way": four_way_cut,
+        "green_turn": replay.green_turn_contours,
+        "evac_preprocess": evac.preprocess,
+        "evac_hough": evac.find_victims_hough,
+        "run_steer": m.run_steer,
+    }
+
+    rounds = {path: [] for path in functions if len(cases[path]) > 0}
+    for path in functions:
+        if path not in rounds:
+            print(f"[BENCHMARK] No cases for {path} in the corpus")
+    for _ in range(ROUNDS):
+        for path in rounds:
+            rounds[path].append(time_cases(functions[path], cases[path]))
+    m.stop_all()
+
+    return {path: summarise(path_rounds) for path, path_rounds in rounds.items()}
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Compares the median time of each path against the baseline.
+
+    Returns:
+        list[str]: The paths that regressed by more than max_regression %.
+    """
+    regressed = []
+    print(f"{'Path':<20}{'Mean':>10}{'Median':>10}{'p95':>10}{'Ops/s':>10}{'Baseline':>10}{'Change':>9}")
+    for path, result in results.items():
+        line = f"{path:<20}{result['mean_us']:>8.0f}us{result['median_us']:>8.0f}us{result['p95_us']:>8.0f}us{result['ops_per_sec']:>10.0f}"
+        base = baseline.get(path) if baseline is not None else None
+        if base is not None:
+            change = (result["median_us"] / base["median_us"] - 1) * 100
+            line += f"{base['median_us']:>8.0f}us{change:>+8.1f}%"
+            if change > max_regression:
+                regressed.append(f"{path} ({change:+.1f}%)")
+                line += "  REGRESSED"
+        print(line)
+    return regressed
+
+if __name__ == "__main__":
+    save_baseline = len(sys.argv) > 1 and sys.argv[1] == "baseline"
+    try:
+        max_regression = float(sys.argv[1]) if len(sys.argv) > 1 and not save_baseline else MAX_REGRESSION
+    except ValueError:
+        print("Usage: python3 benchmark.py [baseline|max regression %]")
+        sys.exit(2)
+
+    results = run_benchmarks()
+    report = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "corpus": {"size": CORPUS_SIZE, "seed": CORPUS_SEED, "rounds": ROUNDS, "repeats": REPEATS},
+        "results": results,
+    }
+
+    path = BASELINE_PATH if save_baseline else RESULTS_PATH
+    with open(path, "w") as json_file:
+        json.dump(report, json_file, indent=4)
+
+    baseline = None
+    if not save_baseline:
+        try:
+            with open(BASELINE_PATH, "r") as json_file:
+                baseline = json.load(json_file)
+        except FileNotFoundError:
+            print(f"[BENCHMARK] No {BASELINE_PATH}, run 'python3 benchmark.py baseline' to make one")
+        if baseline is not None and baseline.get("corpus") != report["corpus"]:
+            print("[BENCHMARK] The baseline used a different corpus, so it can't be compared")
+            baseline = None
+
+    regressed = compare(results, baseline["results"] if baseline is not None else None, max_regression)
+    print(f"[BENCHMARK] Saved {path}")
+
+    if len(regressed) > 0:
+        print(f"[BENCHMARK] Regressed by more than {max_regression:.0f}%: {', '.join(regressed)}")
+        sys.exit(1)
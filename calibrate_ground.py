@@ -0,0 +1,81 @@
+import sys
+import json
+import time
+import cv2
+import gpiozero
+import helper_camera
+import numpy as np
+
+# Calibrates the image to floor homography used when steering on the ground plane (see helper_camerakit.groundHomography)
+#
+# Place a rectangular sheet of paper flat on the floor in front of the robot, square to it and centred,
+# then click its corners in the order: near left, near right, far right, far left.
+#
+# Usage: python3 calibrate_ground.py <cam servo angle> <sheet width mm> <sheet length mm> <distance from camera to near edge mm>
+
+PORT_SERVO_CAM = 19
+
+if len(sys.argv) != 5:
+    print("Usage: python3 calibrate_ground.py <cam servo angle> <sheet width mm> <sheet length mm> <distance to near edge mm>")
+    sys.exit()
+
+cam_angle = int(sys.argv[1])
+sheet_width = float(sys.argv[2])
+sheet_length = float(sys.argv[3])
+near_distance = float(sys.argv[4])
+
+ground_points = [
+    [-sheet_width / 2, near_distance],
+    [sheet_width / 2, near_distance],
+    [sheet_width / 2, near_distance + sheet_length],
+    [-sheet_width / 2, near_distance + sheet_length],
+]
+image_points = []
+
+servo_cam = gpiozero.AngularServo(PORT_SERVO_CAM, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=cam_angle)
+
+cam = helper_camera.CameraStream()
+cam.start_stream()
+time.sleep(1)
+
+def click_callback(event, x, y, flags, param):
+    if event == cv2.EVENT_LBUTTONDOWN and len(image_points) < 4:
+        image_points.append([x, y])
+        print(f"Corner {len(image_points)}: ({x}, {y})")
+
+cv2.namedWindow("Ground Calibration")
+cv2.setMouseCallback("Ground Calibration", click_callback)
+
+while len(image_points) < 4:
+    img = cam.read_stream()
+    if img is None:
+        continue
+    img = img[0:429, 0:img.shape[1]]
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    for point in image_points:
+        cv2.circle(img, tuple(point), 5, (0, 0, 255), -1)
+    if len(image_points) > 1:
+        cv2.polylines(img, [np.array(image_points)], False, (0, 255, 0), 2)
+
+    cv2.imshow("Ground Calibration", img)
+    k = cv2.waitKey(1)
+    if (k & 0xFF == ord('q')):
+        cam.stop()
+        sys.exit()
+
+cam.stop()
+cv2.destroyAllWindows()
+
+with open("config.json", "r") as json_file:
+    config_data = json.load(json_file)
+
+config_data["camera_geometry"]["calibration_points"][str(cam_angle)] = {
+    "image": image_points,
+    "ground": ground_points,
+}
+
+with open("config.json", "w") as json_file:
+    json.dump(config_data, json_file, indent=4)
+
+print(f"Ground calibration for camera angle {cam_angle} saved to config.json")
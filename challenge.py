@@ -37,24 +37,23 @@
 # RoboCup Junior Rescue Line 2023 - Bordeaux, France
 # https://github.com/zmcwilliam/catbot-rcji
 
-import time
 import os
 import sys
 import json
 import traceback
-import board
 import math
 import cv2
 import signal
-import busio
-import gpiozero
 import numpy as np
-import adafruit_vl6180x
+import helper_clock as clock
+import helper_devices as devices
 import helper_camera
 import helper_camerakit as ck
 import helper_motorkit as m
 import helper_intersections
+from helper_i2c import arbiter
 from helper_cmps14 import CMPS14
+from helper_rotation import RotationController
 
 DEBUGGER = True # Should the debug switch actually work? This should be set to false if using the runner
 
@@ -90,16 +89,22 @@ KD = 0.08                           # Derivative gain
 
 follower_speed = 38                 # Base speed of the line follower
 obstacle_treshold = 9               # Minimum distance treshold for obstacles (cm)
+rotation_control_rate = 50          # Control rate of align_to_bearing (Hz)
 
 evac_cam_angle = 20                  # Angle of the camera when evacuating
 
 # ---------------------
 # LOAD STORED JSON DATA
 # ---------------------
-with open("calibration.json", "r") as json_file:
-    calibration_data = json.load(json_file)
-calibration_map = 255 / np.array(calibration_data["calibration_map_w"])
-calibration_map_rescue = 255 / np.array(calibration_data["calibration_map_rescue_w"])
+if devices.SIMULATED and not os.path.exists("calibration.json"):
+    print("[DEVICES] No calibration.json found, using a flat calibration map for the simulated camera")
+    calibration_map = np.ones((429, 640))
+    calibration_map_rescue = np.ones((429, 640))
+else:
+    with open("calibration.json", "r") as json_file:
+        calibration_data = json.load(json_file)
+    calibration_map = 255 / np.array(calibration_data["calibration_map_w"])
+    calibration_map_rescue = 255 / np.array(calibration_data["calibration_map_rescue_w"])
 
 with open("config.json", "r") as json_file:
     config_data = json.load(json_file)
@@ -131,7 +136,7 @@ last_green_time = 0
 initial_green_time = 0
 changed_black_contour = False
 current_linefollowing_state = None
-intersection_state_debug = ["", time.time()]
+intersection_state_debug = ["", clock.now()]
 red_stop_check = 0
 evac_detect_check = 0
 
@@ -139,8 +144,8 @@ pid_last_error = 0
 pid_integral = 0
 
 frames = 0
-current_time = time.time()
-fpsTime = time.time()
+current_time = clock.now()
+fpsTime = clock.now()
 fpsLoop = 0
 fpsCamera = 0
 
@@ -167,7 +172,7 @@ obstacle_dir = np.random.choice([-1, 1])
 # ------------------
 # INITIALISE DEVICES
 # ------------------
-i2c = busio.I2C(board.SCL, board.SDA)
+i2c = devices.i2c_bus()
 
 cam = helper_camera.CameraStream(
     camera_num = 0, 
@@ -181,23 +186,21 @@ cam = helper_camera.CameraStream(
 cam.start_stream()
 
 servo = {
-    "gate": gpiozero.AngularServo(PORT_SERVO_GATE, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-90),    # -90=Close, 90=Open
-    "claw": gpiozero.AngularServo(PORT_SERVO_CLAW, min_pulse_width=0.0005, max_pulse_width=0.002, initial_angle=-80),    # 0=Open, -90=Close
-    "lift": gpiozero.AngularServo(PORT_SERVO_LIFT, min_pulse_width=0.0005, max_pulse_width=0.0025, initial_angle=-88),   # -90=Up, 40=Down
-    "cam": gpiozero.AngularServo(PORT_SERVO_CAM, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-59)       # -90=Down, 90=Up
+    "gate": devices.servo(PORT_SERVO_GATE, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-90),    # -90=Close, 90=Open
+    "claw": devices.servo(PORT_SERVO_CLAW, min_pulse_width=0.0005, max_pulse_width=0.002, initial_angle=-80),    # 0=Open, -90=Close
+    "lift": devices.servo(PORT_SERVO_LIFT, min_pulse_width=0.0005, max_pulse_width=0.0025, initial_angle=-88),   # -90=Up, 40=Down
+    "cam": devices.servo(PORT_SERVO_CAM, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-59)       # -90=Down, 90=Up
 }
 
-debug_switch = gpiozero.DigitalInputDevice(PORT_DEBUG_SWITCH, pull_up=True) if DEBUGGER else None
+debug_switch = devices.digital_input(PORT_DEBUG_SWITCH, pull_up=True) if DEBUGGER else None
 
-USS = {
-    key: gpiozero.DistanceSensor(echo=USS_ECHO, trigger=USS_TRIG)
-    for key, USS_ECHO, USS_TRIG in zip(PORT_USS_ECHO.keys(), PORT_USS_ECHO.values(), PORT_USS_TRIG.values())
-}
+uss = devices.ultrasonic({key: (PORT_USS_TRIG[key], PORT_USS_ECHO[key]) for key in PORT_USS_TRIG.keys()})
 
 cmps = CMPS14(1, 0x61)
+rotation = RotationController(cmps, m, rate=rotation_control_rate)
 
-vl6180x = adafruit_vl6180x.VL6180X(i2c)
-vl6180x_gain = adafruit_vl6180x.ALS_GAIN_1 # See test_tof.py for more values
+vl6180x = devices.vl6180x(i2c)
+vl6180x_gain = devices.VL6180X_ALS_GAIN_1 # See test_tof.py for more values
 
 def exit_gracefully(signum = None, frame = None) -> None:
     """
@@ -217,10 +220,12 @@ def exit_gracefully(signum = None, frame = None) -> None:
     program_active = False
     m.stop_all()
     cam.stop()
-    cv2.destroyAllWindows()
+    if devices.SIMULATED:
+        print(devices.world.summary())
+    if not devices.HEADLESS:
+        cv2.destroyAllWindows()
 
-    for u in USS.values():
-        u.close()
+    uss.stop()
 
     for s in servo.values():
         s.detach()
@@ -238,6 +243,9 @@ def debug_state(mode=None) -> bool:
     Returns:
         bool: False for OFF, True for ON
     """
+    if devices.HEADLESS:
+        return False
+
     if mode == "rescue": 
         return True
     
@@ -252,32 +260,11 @@ def align_to_bearing(target_bearing: int, cutoff_error: int, timeout: int = 10,
         cutoff_error (int): The error threshold to stop aligning.
         timeout (int, optional): The timeout in seconds. Defaults to 10.
         debug_prefix (str, optional): The debug prefix to use. Defaults to "".
-    """
-    # Restrict target_bearing to 0-359
-    target_bearing = target_bearing % 360
-
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        current_bearing = cmps.read_bearing_16bit()
-        error = min(abs(current_bearing - target_bearing), abs(target_bearing - current_bearing + 360))
 
-        if error < cutoff_error:
-            print(f"{debug_prefix} FOUND Bearing: {current_bearing}\tTarget: {target_bearing}\tError: {error}")
-            m.stop_all()
-            return True
-        
-        max_speed = 50 # Speed to rotate when error is 180
-        min_speed = 25 # Speed to rotate when error is 0
-
-        rotate_speed = min_speed + ((max_speed - min_speed)/math.sqrt(180)) * math.sqrt(error)
-
-        # Rotate in the direction closest to the bearing
-        if (current_bearing - target_bearing) % 360 < 180:
-            m.run_tank(-rotate_speed, rotate_speed)
-        else:
-            m.run_tank(rotate_speed, -rotate_speed)
-
-        print(f"{debug_prefix}Bearing: {current_bearing}\tTarget: {target_bearing}\tError: {error}\tSpeed: {rotate_speed}")
+    Returns:
+        bool: True if the robot settled within cutoff_error, False if it timed out.
+    """
+    return rotation.rotate_to(target_bearing, cutoff_error, timeout, debug_prefix)
 
 # ------------------
 # OBSTACLE AVOIDANCE
@@ -295,12 +282,12 @@ def avoid_obstacle() -> None:
     frame_processed = cam.read_stream_processed()
     while (frame_processed is None or frame_processed["resized"] is None):
         print("Waiting for image...")
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
     while cam.is_halted():
         print("Camera is halted... Waiting")
         m.stop_all()
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
     img0_hsv = frame_processed["hsv"]
 
@@ -316,11 +303,11 @@ def avoid_obstacle() -> None:
         print("DETECTED EVAC")
         m.run_tank_for_time(-40, -40, 500)
         
-        time.sleep(2)
+        clock.sleep(2)
         # Random rotate dir
         evac_rotate_dir = np.random.choice([-1, 1])
         align_to_bearing(cmps.read_bearing_16bit() - (80 * evac_rotate_dir), 1, debug_prefix="EVAC ROTATE: ")
-        time.sleep(1)
+        clock.sleep(1)
         print("STARTING EVAC")
         run_evac()
 
@@ -329,17 +316,17 @@ def avoid_obstacle() -> None:
     obstacle_dir = -1 if obstacle_dir == 1 else 1
     m.run_tank_for_time(-40, -40, 900)
     align_to_bearing(cmps.read_bearing_16bit() - (70 * obstacle_dir), 1, debug_prefix="OBSTACLE ALIGN: ")
-    time.sleep(0.2)
+    clock.sleep(0.2)
     if obstacle_dir > 0: m.run_tank(100, 30)
     else: m.run_tank(30, 100)
-    time.sleep(1) # Threshold before accepting any possibility of a line
+    clock.sleep(1) # Threshold before accepting any possibility of a line
 
     # Start checking for a line while continuing to rotate around the obstacle
     while True:
         if cam.is_halted():
             print("[OBSTACLE] Camera is halted... Waiting")
             m.stop_all()
-            time.sleep(0.1)
+            clock.sleep(0.1)
             continue
         
         frame_processed = cam.read_stream_processed()
@@ -353,7 +340,7 @@ def avoid_obstacle() -> None:
             break
     
     m.stop_all()
-    time.sleep(0.2)
+    clock.sleep(0.2)
 
 # ----------
 # EVACUATION
@@ -361,33 +348,33 @@ def avoid_obstacle() -> None:
 def approach_victim(time_to_approach):
     global last_circle_pos
     global ball_found_qty
-    time.sleep(0.2)
+    clock.sleep(0.2)
     m.run_tank(40, 40)
-    time.sleep(time_to_approach - 0.1)
+    clock.sleep(time_to_approach - 0.1)
     servo["claw"].angle = -90
-    time.sleep(0.1)
+    clock.sleep(0.1)
     m.stop_all()
-    time.sleep(0.2)
+    clock.sleep(0.2)
     servo["cam"].angle = -80 # Ensure cam is out of the way before we do lifting actions
     m.run_tank_for_time(-40, -40, 800)
     
     if check_found_ball():
         print("Successful capture, lifting")
         servo["lift"].angle = -80
-        time.sleep(0.8)
+        clock.sleep(0.8)
         servo["claw"].angle = -45
     else:
         print("Did not capture a ball.")
 
     print("Total balls found: " + str(sum(ball_found_qty)))
     if sum(ball_found_qty) < 3:
-        time.sleep(0.5)
+        clock.sleep(0.5)
         servo["lift"].angle = 40
         servo["claw"].angle = 0
 
-    time.sleep(0.2)
+    clock.sleep(0.2)
     servo["cam"].angle = evac_cam_angle
-    time.sleep(0.7)
+    clock.sleep(0.7)
 
     last_circle_pos = None
 
@@ -395,8 +382,8 @@ def check_found_ball():
     global ball_found_qty
 
     try:
-        range_mm = vl6180x.range
-        light_lux = vl6180x.read_lux(adafruit_vl6180x.ALS_GAIN_1)
+        range_mm = arbiter.run("vl6180x", lambda: vl6180x.range)
+        light_lux = arbiter.run("vl6180x", lambda: vl6180x.read_lux(vl6180x_gain))
         
         # TODO: Check ball type (However as we don't handle this differently, there's currently no point)
         print(f"Ball: {range_mm}mm, {light_lux}lux")
@@ -422,24 +409,24 @@ def run_evac():
     global circle_check_counter
     global bottom_block_approach_counter
 
-    evac_start = time.time()
+    evac_start = clock.now()
 
     while True:
-        if int(time.time() - evac_start) % 10 == 0:
-            print("EVAC TIME: " + str(int(time.time() - evac_start)))
+        if int(clock.now() - evac_start) % 10 == 0:
+            print("EVAC TIME: " + str(int(clock.now() - evac_start)))
 
-        if time.time() - evac_start > 100 and rescue_mode == "victim":
+        if clock.now() - evac_start > 100 and rescue_mode == "victim":
             print("VICTIMS TOOK TOO LONG - SKIPPING TO BLOCK")
             rescue_mode = "block"
-        # time.sleep(program_sleep_time)
+        # clock.sleep(program_sleep_time)
         frames += 1
 
         if frames % 20 == 0 and frames != 0:
-            fpsLoop = int(frames/(time.time()-fpsTime))
+            fpsLoop = int(frames/(clock.now()-fpsTime))
             fpsCamera = cam.get_fps()
 
             if frames > 500:
-                fpsTime = time.time()
+                fpsTime = clock.now()
                 frames = 0
             print(f"Processing FPS: {fpsLoop} | Camera FPS: {cam.get_fps()} | Sleep time: {int(program_sleep_time*1000)}")
 
@@ -447,15 +434,15 @@ def run_evac():
         frame_processed = cam.read_stream_processed()
         if (frame_processed is None or frame_processed["resized"] is None):
             print("Waiting for image...")
-            time.sleep(0.1)
-            fpsTime = time.time()
+            clock.sleep(0.1)
+            fpsTime = clock.now()
             frames = 0
             continue
 
         if cam.is_halted():
             print("Camera is halted... Waiting")
             m.stop_all()
-            time.sleep(0.1)
+            clock.sleep(0.1)
             continue
 
         img0 = frame_processed["resized"]
@@ -509,7 +496,7 @@ def run_evac():
             align_to_bearing(cmps.read_bearing_16bit() - 180, 7, debug_prefix="EVAC Align - ")
             align_to_bearing(cmps.read_bearing_16bit() - 90, 7, debug_prefix="EVAC Align - ")
 
-            front_dist = USS["front"].distance * 100
+            front_dist = uss.distance("front")
 
             if front_dist < 10:
                 m.run_tank_for_time(-60, -60, 2500)
@@ -518,9 +505,9 @@ def run_evac():
             servo["cam"].angle = -80
             servo["lift"].angle = 40
             servo["claw"].angle = 0
-            time.sleep(0.5)
+            clock.sleep(0.5)
             servo["cam"].angle = evac_cam_angle
-            time.sleep(0.5)
+            clock.sleep(0.5)
             m.run_tank_for_time(60, 60, 1000)
 
             ball_found_qty = [0, 0]
@@ -646,14 +633,14 @@ def run_evac():
                     if circle_check_counter < 3:
                         print("Circle may have vanished, double checking")
                         circle_check_counter += 1
-                        time.sleep(0.3)
+                        clock.sleep(0.3)
                         continue
                     else:
                         print("Circle vanished")
                 last_circle_pos = None
                 print("Rotating")
                 m.run_tank_for_time(60, -60, 200)
-                time.sleep(0.2)
+                clock.sleep(0.2)
 
         # ------------------------
         # BLOCK FINDING AND RESCUE
@@ -705,7 +692,7 @@ def run_evac():
 
                 cv2.circle(img0, (int(cx), int(cy)), 5, (0, 0, 255), -1)
 
-                front_dist = USS["front"].distance * 100
+                front_dist = uss.distance("front")
                 if front_dist <= 5 and front_dist != 0:
                     bottom_block_approach_counter += 5
 
@@ -716,19 +703,19 @@ def run_evac():
                     if bottom_block_approach_counter > 30:
                         print("Finished approach")
                         m.run_tank_for_time(-40, -40, 1400)
-                        time.sleep(0.1)
+                        clock.sleep(0.1)
                         start_bearing = cmps.read_bearing_16bit()
                         align_to_bearing(start_bearing - 180, 10, debug_prefix="EVAC Align - ")
-                        time.sleep(0.1)
+                        clock.sleep(0.1)
                         m.run_tank_for_time(-35, -35, 1000)
                         servo["gate"].angle = 70
-                        time.sleep(0.5)
+                        clock.sleep(0.5)
                         for i in range(12):
                             m.run_tank_for_time(100, 100, 150)
                             m.run_tank_for_time(-100, -100, 250)
                         servo["gate"].angle = -90
                         m.run_tank_for_time(35, 35, 1000)
-                        time.sleep(1)
+                        clock.sleep(1)
 
                         rescue_mode = "exit"
                         continue
@@ -764,7 +751,7 @@ def run_evac():
                 # If the lift was down, give a bit of time before the camera moves
                 servo["cam"].angle = -80
                 servo["lift"].angle = -80
-                time.sleep(0.5)
+                clock.sleep(0.5)
                 servo["cam"].angle = evac_cam_angle
             else:
                 servo["lift"].angle = -80
@@ -794,13 +781,13 @@ def run_evac():
             align_to_bearing(cmps.read_bearing_16bit() - 90, 1, debug_prefix="EVAC EXIT B: ")
 
             m.stop_all()
-            time.sleep(1)
+            clock.sleep(1)
 
-            start_exit_time = time.time()
-            while time.time() - start_exit_time < 8:
+            start_exit_time = clock.now()
+            while clock.now() - start_exit_time < 8:
                 m.run_tank(40, 40)
                 
-                front_dist = USS["front"].distance * 100
+                front_dist = uss.distance("front")
                 print(front_dist)
 
                 if front_dist < 5:
@@ -813,7 +800,7 @@ def run_evac():
             # Janky solution to reduce the chance of a lack of progress by just halting the program here. 
             # We will still get exit points, hence no point continuing.
             while True:
-                time.sleep(1)
+                clock.sleep(1)
 
             rescue_mode = "init"
             break
@@ -825,11 +812,11 @@ def run_evac():
 m.stop_all()
 os.system("cat motd-challenge.txt")
 while cam.is_halted():
-    time.sleep(0.1)
+    clock.sleep(0.1)
 
 for i in range(3, 0, -1):
     print(f"Starting in {i}...", end="\r")
-    time.sleep(1)
+    clock.sleep(1)
 
 # Clear the countdown line
 print("\033[K")
@@ -839,7 +826,7 @@ print()
 if cam.read_stream_processed()["raw"] is None:
     print("Waiting for first frame")
     while cam.read_stream_processed()["raw"] is None:
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
 current_side = None
 current_stage = 0
@@ -858,11 +845,11 @@ while program_active:
         # ---------------
         # FRAME BALANCING
         # ---------------
-        time.sleep(program_sleep_time)
+        clock.sleep(program_sleep_time)
         frames += 1
 
         if frames % 30 == 0 and frames != 0:
-            fpsLoop = int(frames/(time.time()-fpsTime))
+            fpsLoop = int(frames/(clock.now()-fpsTime))
             fpsCamera = cam.get_fps()
 
             # Try to balance out the processing time and the camera FPS
@@ -875,28 +862,28 @@ while program_active:
                 program_sleep_time -= sleep_adjustment_amt
 
             if frames > 500:
-                fpsTime = time.time()
+                fpsTime = clock.now()
                 frames = 0
             print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)}")
 
         # ------------------
         # OBSTACLE AVOIDANCE
         # ------------------
-        front_dist = USS["front"].distance * 100
+        front_dist = uss.distance("front")
         if front_dist < obstacle_treshold:
             print(f"Obstacle detected at {front_dist}cm... ", end="")
             m.stop_all()
-            time.sleep(0.7)
-            if USS["front"].distance * 100 < obstacle_treshold + 1:
+            clock.sleep(0.7)
+            if uss.distance("front") < obstacle_treshold + 1:
                 print("Confirmed.")
 
                 # No obstacles exist in the super team challenge, so this is definitely evac. Run janky evac entry program:
                 m.run_tank_for_time(-40, -40, 500)
-                time.sleep(2)
+                clock.sleep(2)
                 # Random rotate dir
                 evac_rotate_dir = np.random.choice([-1, 1])
                 align_to_bearing(cmps.read_bearing_16bit() - (80 * evac_rotate_dir), 1, debug_prefix="EVAC ROTATE: ")
-                time.sleep(1)
+                clock.sleep(1)
                 print("STARTING EVAC")
                 run_evac()
             else:
@@ -909,7 +896,7 @@ while program_active:
         if cam.is_halted():
             print("Camera is halted... Waiting")
             m.stop_all()
-            time.sleep(0.1)
+            clock.sleep(0.1)
             continue
         
         changed_black_contour = False
@@ -973,7 +960,7 @@ while program_active:
 
         # Check if there is a significant amount of green pixels
         followable_green = []
-        if is_there_green > 4000: #and len(white_contours) > 2: #((is_there_green > 1000 or time.time() - last_green_found_time < 0.5) and (len(white_contours) > 2 or greenCenter is not None)):
+        if is_there_green > 4000: #and len(white_contours) > 2: #((is_there_green > 1000 or clock.now() - last_green_found_time < 0.5) and (len(white_contours) > 2 or greenCenter is not None)):
             changed_img0_line = None
 
             unfiltered_green_contours, green_hierarchy = cv2.findContours(cv2.bitwise_not(img0_green), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
@@ -1014,7 +1001,7 @@ while program_active:
 
         # Check if there is a significant amount of red pixels
         followable_red = []
-        if is_there_red > 4000: #and len(white_contours) > 2: #((is_there_red > 1000 or time.time() - last_red_found_time < 0.5) and (len(white_contours) > 2 or redCenter is not None)):
+        if is_there_red > 4000: #and len(white_contours) > 2: #((is_there_red > 1000 or clock.now() - last_red_found_time < 0.5) and (len(white_contours) > 2 or redCenter is not None)):
             changed_img0_line = None
 
             unfiltered_red_contours, red_hierarchy = cv2.findContours(cv2.bitwise_not(img0_red), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
@@ -1131,7 +1118,7 @@ while program_active:
                 if "4-ng" in current_linefollowing_state:
                     current_linefollowing_state = "3-ng-4-ex"
                 
-                intersection_state_debug = ["3-ng", time.time()]
+                intersection_state_debug = ["3-ng", clock.now()]
                 # Get the center of each contour
                 white_contours_filtered_with_center = [(contour, ck.centerOfContour(contour)) for contour in white_contours_filtered]
 
@@ -1246,7 +1233,7 @@ while program_active:
                     "right_silver": "F-STRAIGHT",
                 }
 
-                is_currently_turning = time.time() - turning_timeout <= 3
+                is_currently_turning = clock.now() - turning_timeout <= 3
 
                 if is_currently_turning or int_t_type != "none":
                     instruct = instructs[f"{int_t_type}_{int_t_col}"] if not is_currently_turning else "C-TURN"
@@ -1316,10 +1303,10 @@ while program_active:
                         # Erode the line image to remove slight inconsistencies we don't want
                         img0_line_new = cv2.erode(img0_line_new, np.ones((3,3), np.uint8), iterations=2)
 
-                        last_green_time = time.time()
+                        last_green_time = clock.now()
 
-                        if time.time() - turning_timeout > 3:
-                            turning_timeout = time.time() + 3
+                        if clock.now() - turning_timeout > 3:
+                            turning_timeout = clock.now() + 3
                             turning_dir = target_turn_dir
                             
                             if current_turn_dir == "left" and turning_dir == "right":
@@ -1474,7 +1461,7 @@ while program_active:
         # PID stuff
         error = -current_position
 
-        timeDiff = time.time() - current_time
+        timeDiff = clock.now() - current_time
         if (timeDiff == 0):
             timeDiff = 1/10
         proportional = KP*(error)
@@ -1483,34 +1470,34 @@ while program_active:
         current_steering = -(proportional + pid_integral + derivative)
         
         pid_last_error = error
-        current_time = time.time()
+        current_time = clock.now()
 
         current_pitch = cmps.read_pitch()
 
         if current_pitch > 180 and current_pitch < 240:
             if time_since_ramp_start == 0:
-                time_since_ramp_start = time.time()
-            print(f"RAMP ({int(time.time() - time_since_ramp_start)})") 
-            if time.time() - time_since_ramp_start > 18:
+                time_since_ramp_start = clock.now()
+            print(f"RAMP ({int(clock.now() - time_since_ramp_start)})") 
+            if clock.now() - time_since_ramp_start > 18:
                 motor_vals = m.run_steer(100, 100, 0)
-            if time.time() - time_since_ramp_start > 10:
+            if clock.now() - time_since_ramp_start > 10:
                 motor_vals = m.run_steer(80, 100, current_steering, ramp=True)
             else:
                 motor_vals = m.run_steer(follower_speed, 100, current_steering, ramp=True)
         else:
             if time_since_ramp_start > 3:
-                time_ramp_end = time.time() + 2
+                time_ramp_end = clock.now() + 2
 
             time_since_ramp_start = 0
-            if time.time() < time_ramp_end:
+            if clock.now() < time_ramp_end:
                 print("END RAMP")
-                last_significant_bearing_change = time.time()
+                last_significant_bearing_change = clock.now()
                 motor_vals = m.run_steer(follower_speed, 100, current_steering, ramp=True)
             else:
                 new_bearing = cmps.read_bearing_16bit()
 
                 if current_bearing is None:
-                    last_significant_bearing_change = time.time()
+                    last_significant_bearing_change = clock.now()
                     current_bearing = new_bearing
                 
                 bearing_diff = abs(new_bearing - current_bearing)
@@ -1518,12 +1505,12 @@ while program_active:
                     
                 # Check if the absolute difference is within the specified range or if it wraps around 360
                 bearing_min_err = 6
-                if (bearing_diff <= bearing_min_err or bearing_diff >= (360 - bearing_min_err)) and int(time.time() - last_significant_bearing_change) > 10:
+                if (bearing_diff <= bearing_min_err or bearing_diff >= (360 - bearing_min_err)) and int(clock.now() - last_significant_bearing_change) > 10:
                     print("SAME BEARING FOR 10 SECONDS")
                     m.run_tank_for_time(100, 100, 400)
-                    last_significant_bearing_change = time.time()
+                    last_significant_bearing_change = clock.now()
                 elif not (bearing_diff <= bearing_min_err or bearing_diff >= (360 - bearing_min_err)):
-                    last_significant_bearing_change = time.time()
+                    last_significant_bearing_change = clock.now()
                     
                 motor_vals = m.run_steer(follower_speed, 100, current_steering)
 
@@ -1531,7 +1518,7 @@ while program_active:
         # DEBUG INFO
         # ----------
 
-        print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)} \tSteer: {int(current_steering)} \t{str(motor_vals)}\tUSS: {round(front_dist, 1)}\tPit: {int(current_pitch)}\tBear: {current_bearing} LSB: {int(time.time() - last_significant_bearing_change)}")
+        print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)} \tSteer: {int(current_steering)} \t{str(motor_vals)}\tUSS: {round(front_dist, 1)}\tPit: {int(current_pitch)}\tBear: {current_bearing} LSB: {int(clock.now() - last_significant_bearing_change)}")
         if debug_state():
             # cv2.drawContours(img0, [chosen_black_contour[2]], -1, (0,255,0), 3) # DEBUG
             # cv2.drawContours(img0, [black_bounding_box], 0, (255, 0, 255), 2)
@@ -1593,7 +1580,7 @@ while program_active:
                 cv2.putText(preview_image_img0_contours, f"Big Turn", (10, 250), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
 
             cv2.putText(preview_image_img0_contours, f"LF State: {current_linefollowing_state}", (10, 330), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
-            cv2.putText(preview_image_img0_contours, f"INT Debug: {intersection_state_debug[0]} - {int(time.time() - intersection_state_debug[1])}", (10, 360), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
+            cv2.putText(preview_image_img0_contours, f"INT Debug: {intersection_state_debug[0]} - {int(clock.now() - intersection_state_debug[1])}", (10, 360), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
 
             cv2.putText(preview_image_img0_contours, f"FPS: {fpsLoop} | {fpsCamera}", (10, 390), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 100, 0), 2)
 
@@ -1622,6 +1609,6 @@ while program_active:
         traceback.print_exc()
         print("Returning to start of loop in 5 seconds...")
         m.stop_all()
-        time.sleep(5)
+        clock.sleep(5)
 
 exit_gracefully()
\ No newline at end of file
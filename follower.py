@@ -8,24 +8,30 @@
 # RoboCup Junior Rescue Line 2023 - Bordeaux, France
 # https://github.com/zmcwilliam/catbot-rcji
 
-import time
 import os
 import sys
 import json
 import traceback
-import board
 import math
 import cv2
 import signal
-import busio
-import gpiozero
 import numpy as np
-import adafruit_vl6180x
+import helper_clock as clock
+import helper_devices as devices
 import helper_camera
 import helper_camerakit as ck
 import helper_motorkit as m
 import helper_intersections
-from helper_cmps14 import CMPS14
+import helper_evac as evac
+from helper_i2c import arbiter
+from helper_cmps14 import CMPS14, CMPS14Sampler
+from helper_linetracker import LineTracker
+from helper_speed import SpeedScheduler
+from helper_victimtracker import VictimTracker
+from helper_evacmap import EvacMap
+from helper_vl6180x import VL6180XSampler
+from helper_choreo import Choreographer, Sequence
+from helper_rotation import RotationController
 
 DEBUGGER = False # Should the debug switch actually work? This should be set to false if using the runner
 
@@ -54,23 +60,49 @@ max_angle = 90                      # Maximum angle value when calculating a per
 error_weight = 0.5                  # Weight of the error value when calculating the PID input
 angle_weight = 1-error_weight       # Weight of the angle value when calculating the PID input
 black_contour_threshold = 5000      # Minimum area of a contour to be considered valid
+line_roi_margin = 60                # Padding around the predicted line position when searching for black contours (px)
+line_roi_full_search_interval = 15  # Force a full-frame black contour search every N frames
+steering_estimator = "rect"         # Source of the line error and angle: "rect" (minAreaRect of the contour) or "scanline"
+scanline_count = 12                 # Number of rows sampled by the scanline estimator
+steering_ground_plane = False       # Measure the line error and angle on the floor (see camera_geometry in config.json) instead of in the image
+max_error_ground = 60               # Maximum error value on the floor (mm), scaled to max_error when steering_ground_plane is enabled
+band_detector = "contour"           # Red stop line and evac entrance detection: "contour", or "profile" (row projection of a downscaled mask, check with replay.py bands first)
 
 KP = 1.3                            # Proportional gain
 KI = 0                              # Integral gain
 KD = 0.08                           # Derivative gain
 
 follower_speed = 45                 # Base speed of the line follower
+follower_speed_max = 60             # Base speed on long straights, when the speed scheduler is enabled
+speed_scheduler_enabled = True      # Raise the base speed on straights, and brake back to follower_speed before curves and intersections
+motor_writer_enabled = True         # Write motor commands from a background thread (latest command wins), instead of in the main loop
+compass_sampler_enabled = True      # Read the compass at a fixed rate in a background thread, so reading it never waits on the I2C bus
+compass_sample_rate = 50            # Compass sample rate when the sampler is enabled (Hz)
+rotation_control_rate = 50          # Control rate of align_to_bearing (Hz)
 obstacle_treshold = 9               # Minimum distance treshold for obstacles (cm)
 
 evac_cam_angle = 7                  # Angle of the camera when evacuating
+victim_track_gate = 60              # Furthest a victim can move between frames and still be the same victim (px)
+victim_track_max_misses = 8         # Frames a victim can go undetected before it is forgotten
+victim_window_margin = 40           # Padding around a tracked victim when searching for it (px)
+victim_full_search_interval = 10    # Force a full-frame victim search every N frames
+evac_map_enabled = True             # Turn straight to known victims or unexplored bearings, instead of rotating blindly while searching
+evac_map_log = "evac_map.json"      # Where the evac map and its event log are saved when victim search ends
+victim_close_range = 25             # Close the claw as soon as the ToF sensor sees a victim this close during an approach (mm)
+victim_captured_range = 5           # ToF range with a victim held in the closed claw (mm)
 
 # ---------------------
 # LOAD STORED JSON DATA
 # ---------------------
-with open("calibration.json", "r") as json_file:
-    calibration_data = json.load(json_file)
-calibration_map = 255 / np.array(calibration_data["calibration_map_w"])
-calibration_map_rescue = 255 / np.array(calibration_data["calibration_map_rescue_w"])
+if devices.SIMULATED and not os.path.exists("calibration.json"):
+    print("[DEVICES] No calibration.json found, using a flat calibration map for the simulated camera")
+    calibration_map = np.ones((429, 640))
+    calibration_map_rescue = np.ones((429, 640))
+else:
+    with open("calibration.json", "r") as json_file:
+        calibration_data = json.load(json_file)
+    calibration_map = 255 / np.array(calibration_data["calibration_map_w"])
+    calibration_map_rescue = 255 / np.array(calibration_data["calibration_map_rescue_w"])
 
 with open("config.json", "r") as json_file:
     config_data = json.load(json_file)
@@ -84,7 +116,8 @@ config_values = {
     "obstacle_hsv_threshold": [np.array(bound) for bound in config_data["obstacle_hsv_threshold"]],
     "rescue_block_hsv_threshold": [np.array(bound) for bound in config_data["rescue_block_hsv_threshold"]],
     "rescue_circle_minradius_offset": config_data["rescue_circle_minradius_offset"],
-    "rescue_binary_gray_scale_multiplier": config_data["rescue_binary_gray_scale_multiplier"]
+    "rescue_binary_gray_scale_multiplier": config_data["rescue_binary_gray_scale_multiplier"],
+    "camera_geometry": config_data["camera_geometry"]
 }
 
 # ----------------
@@ -96,13 +129,22 @@ program_sleep_time = 0.01
 
 current_steering = 0
 last_line_pos = np.array([100,100])
+line_tracker = LineTracker(margin=line_roi_margin, full_search_interval=line_roi_full_search_interval)
+speed_scheduler = SpeedScheduler(follower_speed, follower_speed, follower_speed_max)
+victim_tracker = VictimTracker(
+    gate=victim_track_gate,
+    max_misses=victim_track_max_misses,
+    window_margin=victim_window_margin,
+    full_search_interval=victim_full_search_interval,
+)
+evac_map = EvacMap(hfov=config_values["camera_geometry"]["hfov"])
 
 turning = None
 last_green_time = 0
 initial_green_time = 0
 changed_black_contour = False
 current_linefollowing_state = None
-intersection_state_debug = ["", time.time()]
+intersection_state_debug = ["", clock.now()]
 red_stop_check = 0
 evac_detect_check = 0
 
@@ -110,8 +152,9 @@ pid_last_error = 0
 pid_integral = 0
 
 frames = 0
-current_time = time.time()
-fpsTime = time.time()
+frame_count = 0 # Never reset, used to match motor commands to frames
+current_time = clock.now()
+fpsTime = clock.now()
 fpsLoop = 0
 fpsCamera = 0
 
@@ -119,7 +162,6 @@ rescue_mode = "init"
 ball_found_qty = [0, 0] # Silver, Black
 
 last_circle_pos = None
-circle_check_counter = 0
 bottom_block_approach_counter = 0
 
 time_since_ramp_start = 0
@@ -138,7 +180,7 @@ obstacle_dir = np.random.choice([-1, 1])
 # ------------------
 # INITIALISE DEVICES
 # ------------------
-i2c = busio.I2C(board.SCL, board.SDA)
+i2c = devices.i2c_bus()
 
 cam = helper_camera.CameraStream(
     camera_num = 0, 
@@ -152,23 +194,31 @@ cam = helper_camera.CameraStream(
 cam.start_stream()
 
 servo = {
-    "gate": gpiozero.AngularServo(PORT_SERVO_GATE, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-90),    # -90=Close, 90=Open
-    "claw": gpiozero.AngularServo(PORT_SERVO_CLAW, min_pulse_width=0.0005, max_pulse_width=0.002, initial_angle=-80),    # 0=Open, -90=Close
-    "lift": gpiozero.AngularServo(PORT_SERVO_LIFT, min_pulse_width=0.0005, max_pulse_width=0.0025, initial_angle=-88),   # -90=Up, 40=Down
-    "cam": gpiozero.AngularServo(PORT_SERVO_CAM, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-64)       # -90=Down, 90=Up
+    "gate": devices.servo(PORT_SERVO_GATE, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-90),    # -90=Close, 90=Open
+    "claw": devices.servo(PORT_SERVO_CLAW, min_pulse_width=0.0005, max_pulse_width=0.002, initial_angle=-80),    # 0=Open, -90=Close
+    "lift": devices.servo(PORT_SERVO_LIFT, min_pulse_width=0.0005, max_pulse_width=0.0025, initial_angle=-88),   # -90=Up, 40=Down
+    "cam": devices.servo(PORT_SERVO_CAM, min_pulse_width=0.0006, max_pulse_width=0.002, initial_angle=-64)       # -90=Down, 90=Up
 }
 
-debug_switch = gpiozero.DigitalInputDevice(PORT_DEBUG_SWITCH, pull_up=True) if DEBUGGER else None
+choreo = Choreographer(servo, m)
+evac_sequence = None # The servo/motor sequence the evac zone code is waiting on, if any
 
-USS = {
-    key: gpiozero.DistanceSensor(echo=USS_ECHO, trigger=USS_TRIG)
-    for key, USS_ECHO, USS_TRIG in zip(PORT_USS_ECHO.keys(), PORT_USS_ECHO.values(), PORT_USS_TRIG.values())
-}
+debug_switch = devices.digital_input(PORT_DEBUG_SWITCH, pull_up=True) if DEBUGGER else None
+
+uss = devices.ultrasonic({key: (PORT_USS_TRIG[key], PORT_USS_ECHO[key]) for key in PORT_USS_TRIG.keys()})
 
 cmps = CMPS14(1, 0x61)
+cmps_sampler = CMPS14Sampler(cmps, rate=compass_sample_rate)
+if compass_sampler_enabled:
+    cmps_sampler.start()
+rotation = RotationController(cmps, m, cmps_sampler, rate=rotation_control_rate)
+
+if motor_writer_enabled:
+    m.start_writer()
 
-vl6180x = adafruit_vl6180x.VL6180X(i2c)
-vl6180x_gain = adafruit_vl6180x.ALS_GAIN_1 # See test_tof.py for more values
+vl6180x = devices.vl6180x(i2c)
+vl6180x_gain = devices.VL6180X_ALS_GAIN_1 # See test_tof.py for more values
+vl6180x_sampler = VL6180XSampler(vl6180x, lux_gain=vl6180x_gain)
 
 def exit_gracefully(signum = None, frame = None) -> None:
     """
@@ -185,13 +235,34 @@ def exit_gracefully(signum = None, frame = None) -> None:
         sys.exit()
 
     print("\n\nExiting Gracefully\n")
+    if speed_scheduler_enabled:
+        print(f"Speed scheduler: {speed_scheduler.summary()}")
     program_active = False
+    choreo.stop()
+    m.stop_writer()
     m.stop_all()
+    if motor_writer_enabled:
+        print(m.writer.summary())
+    if m.pwm_batch is not None:
+        print(m.pwm_batch.summary())
     cam.stop()
-    cv2.destroyAllWindows()
-
-    for u in USS.values():
-        u.close()
+    vl6180x_sampler.stop()
+    print(f"I2C:\n{arbiter.summary()}")
+    if len(rotation.history) > 0:
+        print(rotation.summary())
+    if cmps_sampler.running:
+        print(cmps_sampler.summary())
+    cmps_sampler.stop()
+    if len(choreo.stats) > 0:
+        print(f"Sequences:\n{choreo.summary()}")
+    if devices.SIMULATED:
+        print(devices.world.summary(frame_count))
+    if isinstance(clock.current, clock.VirtualClock):
+        print(clock.current.summary())
+    if not devices.HEADLESS:
+        cv2.destroyAllWindows()
+
+    uss.stop()
 
     for s in servo.values():
         s.detach()
@@ -209,6 +280,9 @@ def debug_state(mode=None) -> bool:
     Returns:
         bool: False for OFF, True for ON
     """
+    if devices.HEADLESS:
+        return False
+
     if mode == "rescue": 
         return True
     
@@ -223,32 +297,11 @@ def align_to_bearing(target_bearing: int, cutoff_error: int, timeout: int = 10,
         cutoff_error (int): The error threshold to stop aligning.
         timeout (int, optional): The timeout in seconds. Defaults to 10.
         debug_prefix (str, optional): The debug prefix to use. Defaults to "".
-    """
-    # Restrict target_bearing to 0-359
-    target_bearing = target_bearing % 360
-
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        current_bearing = cmps.read_bearing_16bit()
-        error = min(abs(current_bearing - target_bearing), abs(target_bearing - current_bearing + 360))
-
-        if error < cutoff_error:
-            print(f"{debug_prefix} FOUND Bearing: {current_bearing}\tTarget: {target_bearing}\tError: {error}")
-            m.stop_all()
-            return True
-        
-        max_speed = 50 # Speed to rotate when error is 180
-        min_speed = 25 # Speed to rotate when error is 0
-
-        rotate_speed = min_speed + ((max_speed - min_speed)/math.sqrt(180)) * math.sqrt(error)
 
-        # Rotate in the direction closest to the bearing
-        if (current_bearing - target_bearing) % 360 < 180:
-            m.run_tank(-rotate_speed, rotate_speed)
-        else:
-            m.run_tank(rotate_speed, -rotate_speed)
-
-        print(f"{debug_prefix}Bearing: {current_bearing}\tTarget: {target_bearing}\tError: {error}\tSpeed: {rotate_speed}")
+    Returns:
+        bool: True if the robot settled within cutoff_error, False if it timed out.
+    """
+    return rotation.rotate_to(target_bearing, cutoff_error, timeout, debug_prefix)
 
 # ------------------
 # OBSTACLE AVOIDANCE
@@ -266,12 +319,12 @@ def avoid_obstacle() -> None:
     frame_processed = cam.read_stream_processed()
     while (frame_processed is None or frame_processed["resized"] is None):
         print("Waiting for image...")
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
     while cam.is_halted():
         print("Camera is halted... Waiting")
         m.stop_all()
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
     img0_hsv = frame_processed["hsv"]
 
@@ -287,11 +340,11 @@ def avoid_obstacle() -> None:
         print("DETECTED EVAC")
         m.run_tank_for_time(-40, -40, 500)
         
-        time.sleep(2)
+        clock.sleep(2)
         # Random rotate dir
         evac_rotate_dir = np.random.choice([-1, 1])
         align_to_bearing(cmps.read_bearing_16bit() - (80 * evac_rotate_dir), 1, debug_prefix="EVAC ROTATE: ")
-        time.sleep(1)
+        clock.sleep(1)
         print("STARTING EVAC")
         run_evac()
 
@@ -300,17 +353,17 @@ def avoid_obstacle() -> None:
     obstacle_dir = -1 if obstacle_dir == 1 else 1
     m.run_tank_for_time(-40, -40, 900)
     align_to_bearing(cmps.read_bearing_16bit() - (70 * obstacle_dir), 1, debug_prefix="OBSTACLE ALIGN: ")
-    time.sleep(0.2)
+    clock.sleep(0.2)
     if obstacle_dir > 0: m.run_tank(100, 30)
     else: m.run_tank(30, 100)
-    time.sleep(1) # Threshold before accepting any possibility of a line
+    clock.sleep(1) # Threshold before accepting any possibility of a line
 
     # Start checking for a line while continuing to rotate around the obstacle
     while True:
         if cam.is_halted():
             print("[OBSTACLE] Camera is halted... Waiting")
             m.stop_all()
-            time.sleep(0.1)
+            clock.sleep(0.1)
             continue
         
         frame_processed = cam.read_stream_processed()
@@ -324,7 +377,7 @@ def avoid_obstacle() -> None:
             break
     
     m.stop_all()
-    time.sleep(0.2)
+    clock.sleep(0.2)
 
 # ----------
 # EVACUATION
@@ -332,46 +385,56 @@ def avoid_obstacle() -> None:
 def approach_victim(time_to_approach):
     global last_circle_pos
     global ball_found_qty
-    time.sleep(0.2)
+    global evac_sequence
+    clock.sleep(0.2)
     m.run_tank(40, 40)
-    time.sleep(time_to_approach - 0.1)
+    # Drive for at most time_to_approach, but close the claw as soon as the victim is in front of it
+    if not vl6180x_sampler.running:
+        clock.sleep(time_to_approach - 0.1)
+    elif vl6180x_sampler.wait_for_range(victim_close_range, time_to_approach - 0.1):
+        print(f"Victim in range, closing claw early ({vl6180x_sampler.latest()['range']}mm)")
     servo["claw"].angle = -90
-    time.sleep(0.1)
+    clock.sleep(0.1)
     m.stop_all()
-    time.sleep(0.2)
-    servo["cam"].angle = -80 # Ensure cam is out of the way before we do lifting actions
-    m.run_tank_for_time(-40, -40, 800)
+    clock.sleep(0.2)
+    captured = check_found_ball()
+
+    # Ensure cam is out of the way before we do lifting actions
+    sequence = Sequence("victim lift").servo("cam", -80).motors(-40, -40).wait(0.8).stop()
     
-    if check_found_ball():
+    if captured:
+        evac_map.record_rescue(cmps.read_bearing_16bit())
         print("Successful capture, lifting")
-        servo["lift"].angle = -80
-        time.sleep(0.8)
-        servo["claw"].angle = -45
+        sequence.servo("lift", -80).wait(0.8).servo("claw", -45)
     else:
         print("Did not capture a ball.")
 
     print("Total balls found: " + str(sum(ball_found_qty)))
     if sum(ball_found_qty) < 3:
-        time.sleep(0.5)
-        servo["lift"].angle = 40
-        servo["claw"].angle = 0
+        sequence.wait(0.5).servo("lift", 40).servo("claw", 0)
 
-    time.sleep(0.2)
-    servo["cam"].angle = evac_cam_angle
-    time.sleep(0.7)
+    sequence.wait(0.2).servo("cam", evac_cam_angle).wait(0.7)
+    evac_sequence = choreo.run(sequence)
 
     last_circle_pos = None
+    victim_tracker.reset()
+    evac_map.new_position()
 
 def check_found_ball():
     global ball_found_qty
 
     try:
-        range_mm = vl6180x.range
-        light_lux = vl6180x.read_lux(adafruit_vl6180x.ALS_GAIN_1)
+        if vl6180x_sampler.running:
+            # Use a sample taken after the claw closed, rather than one from before
+            reading = vl6180x_sampler.wait_for_sample(0.1)
+            range_mm, light_lux = reading["range"], reading["lux"]
+        else:
+            range_mm = arbiter.run("vl6180x", lambda: vl6180x.range)
+            light_lux = arbiter.run("vl6180x", lambda: vl6180x.read_lux(vl6180x_gain))
         
         # TODO: Check ball type (However as we don't handle this differently, there's currently no point)
         print(f"Ball: {range_mm}mm, {light_lux}lux")
-        if range_mm < 5:
+        if range_mm < victim_captured_range:
             ball_found_qty[0] += 1
             return True
         else:
@@ -390,43 +453,51 @@ def run_evac():
     global ball_found_qty
     global program_active
     global last_circle_pos
-    global circle_check_counter
     global bottom_block_approach_counter
+    global evac_map
+    global evac_sequence
 
-    evac_start = time.time()
+    evac_start = clock.now()
 
     while True:
-        if int(time.time() - evac_start) % 10 == 0:
-            print("EVAC TIME: " + str(int(time.time() - evac_start)))
+        if int(clock.now() - evac_start) % 10 == 0:
+            print("EVAC TIME: " + str(int(clock.now() - evac_start)))
 
-        if time.time() - evac_start > 120 and rescue_mode == "victim":
+        if clock.now() - evac_start > 120 and rescue_mode == "victim":
             print("VICTIMS TOOK TOO LONG - SKIPPING TO BLOCK")
             rescue_mode = "block"
-        # time.sleep(program_sleep_time)
+            evac_map.save(evac_map_log)
+            vl6180x_sampler.stop()
+        # clock.sleep(program_sleep_time)
         frames += 1
 
         if frames % 20 == 0 and frames != 0:
-            fpsLoop = int(frames/(time.time()-fpsTime))
+            fpsLoop = int(frames/(clock.now()-fpsTime))
             fpsCamera = cam.get_fps()
 
             if frames > 500:
-                fpsTime = time.time()
+                fpsTime = clock.now()
                 frames = 0
-            print(f"Processing FPS: {fpsLoop} | Camera FPS: {cam.get_fps()} | Sleep time: {int(program_sleep_time*1000)}")
+            print(f"Processing FPS: {fpsLoop} | Camera FPS: {cam.get_fps()} | Sleep time: {int(program_sleep_time*1000)} | {victim_tracker.summary()} | {evac_map.summary()} | {vl6180x_sampler.summary()}")
 
         changed_black_contour = False
         frame_processed = cam.read_stream_processed()
         if (frame_processed is None or frame_processed["resized"] is None):
             print("Waiting for image...")
-            time.sleep(0.1)
-            fpsTime = time.time()
+            clock.sleep(0.1)
+            fpsTime = clock.now()
             frames = 0
             continue
 
         if cam.is_halted():
             print("Camera is halted... Waiting")
             m.stop_all()
-            time.sleep(0.1)
+            clock.sleep(0.1)
+            continue
+
+        # Keep reading frames while a servo/motor sequence plays, but don't act on them until it has finished
+        if evac_sequence is not None and not evac_sequence.done():
+            clock.sleep(0.01)
             continue
 
         img0 = frame_processed["resized"]
@@ -439,33 +510,12 @@ def run_evac():
         img0_line = frame_processed["line"]
         
         
-        img0_gray_rescue_calibrated = calibration_map_rescue * img0_gray
-        img0_binary_rescue = ((img0_gray_rescue_calibrated > config_values["black_rescue_threshold"]) * 255).astype(np.uint8)
-        img0_binary_rescue = cv2.morphologyEx(img0_binary_rescue, cv2.MORPH_OPEN, np.ones((7,7),np.uint8))
-
-        img0_gray_rescue_scaled = img0_gray_rescue_calibrated * (config_values["rescue_binary_gray_scale_multiplier"] - 2.5)
-        img0_gray_rescue_scaled = np.clip(img0_gray_rescue_calibrated, 0, 255).astype(np.uint8)
-
-        img0_binary_rescue_clean = img0_binary_rescue.copy()
-
-        img0_blurred = cv2.medianBlur(img0_gray_rescue_scaled, 9)
-
-        segment_width = 40
-
-        for x in range(0, img0_binary_rescue.shape[1], segment_width):
-            segment = img0_binary_rescue[:, x:x+segment_width]
-
-            # Find the lowest point in the segment that has a full column of white pixels at least 10 pixels high
-            bottom_white_column = -1
-            for y in range(0, img0_binary_rescue.shape[0] - 10):
-                if np.all(segment[y:y+10, :] == 255):
-                    bottom_white_column = y
-                    break
-
-            # Set all pixels below this column to black
-            if bottom_white_column != -1:
-                img0_binary_rescue[:bottom_white_column:, x:x+segment_width] = 255
-                img0_blurred[:bottom_white_column:, x:x+segment_width] = 255
+        rescue_images = evac.preprocess(
+            img0_gray, calibration_map_rescue, config_values["black_rescue_threshold"],
+            blur=rescue_mode == "victim" and config_values["rescue_circle_conf"]["detector"] == "hough"
+        )
+        img0_binary_rescue = rescue_images["binary_rescue"]
+        img0_binary_rescue_clean = rescue_images["binary_rescue_clean"]
 
         # -------------
         # INITIAL ENTER
@@ -477,24 +527,30 @@ def run_evac():
             m.run_tank_for_time(60, 60, 1500)
             
             # Spin around to try and get us off any wall
+            evac_map = EvacMap(hfov=config_values["camera_geometry"]["hfov"])
             align_to_bearing(cmps.read_bearing_16bit() - 180, 7, debug_prefix="EVAC Align - ")
+            evac_map.record_scan(cmps.read_bearing_16bit(), uss.distance("front"), uss.distance("side"))
             align_to_bearing(cmps.read_bearing_16bit() - 90, 7, debug_prefix="EVAC Align - ")
+            evac_map.record_scan(cmps.read_bearing_16bit(), uss.distance("front"), uss.distance("side"))
 
-            front_dist = USS["front"].distance * 100
+            front_dist = uss.distance("front")
 
             if front_dist < 10:
                 m.run_tank_for_time(-60, -60, 2500)
                 align_to_bearing(cmps.read_bearing_16bit() - 180, 7, debug_prefix="EVAC Align - ")
 
-            servo["cam"].angle = -80
-            servo["lift"].angle = 40
-            servo["claw"].angle = 0
-            time.sleep(0.5)
-            servo["cam"].angle = evac_cam_angle
-            time.sleep(0.5)
-            m.run_tank_for_time(60, 60, 1000)
+            evac_sequence = choreo.run(
+                Sequence("evac init")
+                .servo("cam", -80).servo("lift", 40).servo("claw", 0)
+                .wait(0.5).servo("cam", evac_cam_angle)
+                .wait(0.5).motors(60, 60)
+                .wait(1).stop()
+            )
 
             ball_found_qty = [0, 0]
+            victim_tracker.reset()
+            evac_map.new_position()
+            vl6180x_sampler.start()
             rescue_mode = "victim"
 
             continue
@@ -506,76 +562,36 @@ def run_evac():
             if sum(ball_found_qty) >= 3:
                 print("Found all victims")
                 rescue_mode = "block"
+                evac_map.save(evac_map_log)
+                vl6180x_sampler.stop()
 
             servo["cam"].angle = evac_cam_angle
             servo["lift"].angle = 40
             servo["claw"].angle = 0
 
-            # minDist = min distance between circles
-            # param1 = high threshold for canny edge detection (sensitivity) - lower = more circles
-            # param2 = accumulator threshold for circle detection - Higher = more reliable circles, but may miss some
-            # minRadius = minimum radius of circle
-            # maxRadius = maximum radius of circle
-            circles = cv2.HoughCircles(img0_blurred, cv2.HOUGH_GRADIENT, **{
-                "dp": config_values["rescue_circle_conf"]["dp"],
-                "minDist": config_values["rescue_circle_conf"]["minDist"],
-                "param1": config_values["rescue_circle_conf"]["param1"],
-                "param2": config_values["rescue_circle_conf"]["param2"],
-                "minRadius": config_values["rescue_circle_conf"]["minRadius"],
-                "maxRadius": config_values["rescue_circle_conf"]["maxRadius"],
-            })
-
-            sorted_circles = []
-            if circles is not None:
-                # Round the circle parameters to integers
-                detected_circles = np.round(circles[0, :]).astype(int)
-                detected_circles = sorted(detected_circles , key = lambda v: [v[1], v[1]],reverse=True)
-                
-                # If the circle is in the bottom half of the image, check that the radius is greater than 40
-                # valid_circles = []
-                # for (x, y, r) in detected_circles:
-                #     if y > config_values["rescue_circle_conf"]["heightBuffer"] and r > config_values["rescue_circle_conf"]["lowHeightMinRadius"]:
-                #         valid_circles.append([x, y, r])
-                #     elif y <= config_values["rescue_circle_conf"]["heightBuffer"]:
-                #         valid_circles.append([x, y, r])
-
-                # Draw the detected circles on the original image
-                for (x, y, r) in detected_circles:
-                    cv2.circle(img0, (x, y), r, (0, 0, 255), 2)
-                    cv2.circle(img0, (x, y), 2, (0, 0, 255), 3)
-
-                height_bar_qty = 13
-                height_bar_minRadius = [a - 7 for a in [90, 85, 80, 72, 66, 58, 52, 44, 38, 31, 23, 16, 15]] # This could become a linear function... but it works for now
-                height_bar_maxRadius = [b + config_values["rescue_circle_minradius_offset"] for b in height_bar_minRadius]
-
-                height_bars = [(img0.shape[0] / height_bar_qty) * i for i in range(height_bar_qty - 1, -1, -1)]
-                height_bar_circles = [[] for i in range(height_bar_qty)]
-                for (x, y, r) in detected_circles:
-                    for i in range(height_bar_qty):
-                        if y >= height_bars[i]:
-                            if r >= height_bar_minRadius[i] and r <= height_bar_maxRadius[i]: 
-                                height_bar_circles[i].append([x, y, r, i])
-                            break
-                    
-                    # Sort the circles in each bar by x position
-                    height_bar_circles[i] = sorted(height_bar_circles[i], key = lambda v: [v[0], v[0]])
+            target, detected_circles = victim_tracker.step(rescue_images, config_values["rescue_circle_conf"], config_values["rescue_circle_minradius_offset"])
 
-                # Compile circles into a single list, horizontally in height bar (closest to furthest)
-                for i in range(height_bar_qty):
-                    sorted_circles += height_bar_circles[i]
-                
-                # Draw horizontal lines for height bars
-                for i in range(height_bar_qty):
-                    cv2.line(img0, (0, int(height_bars[i])), (img0.shape[1], int(height_bars[i])), (255, 255, 255), 1)
-                
-                # Draw the sorted circles on the original image
-                for i, (x, y, r, bar) in enumerate(sorted_circles):
-                    cv2.circle(img0, (x, y), r, (0, 255, 0), 2)
-                    cv2.circle(img0, (x, y), 2, (0, 255, 0), 3)
-                    cv2.putText(img0, f"{bar}-{i}-{r}", (x , y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (125, 125, 255), 2)
+            # Draw the detected circles on the original image
+            for (x, y, r) in detected_circles:
+                cv2.circle(img0, (x, y), r, (0, 0, 255), 2)
+                cv2.circle(img0, (x, y), 2, (0, 0, 255), 3)
+
+            # Draw horizontal lines for height bars
+            for height_bar in evac.height_bar_lines(img0.shape[0]):
+                cv2.line(img0, (0, height_bar), (img0.shape[1], height_bar), (255, 255, 255), 1)
+
+            # Draw the tracked victims, and the windows they will be searched for in next frame
+            for track in victim_tracker.confirmed_tracks():
+                x, y, r, bar = track.circle()
+                colour = (0, 255, 0) if track.misses == 0 else (0, 255, 255)
+                cv2.circle(img0, (x, y), r, colour, 2)
+                cv2.circle(img0, (x, y), 2, colour, 3)
+                cv2.putText(img0, f"{track.id}-{bar}-{r}", (x , y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (125, 125, 255), 2)
+            for (x, y, w, h) in victim_tracker.windows(img0.shape):
+                cv2.rectangle(img0, (x, y), (x + w, y + h), (255, 0, 0), 1)
 
             if debug_state("rescue"):
-                # cv2.imshow("img0_blurred", img0_blurred)
+                # cv2.imshow("img0_blurred", rescue_images["blurred"])
                 # cv2.imshow("img0_gray_rescue_scaled", img0_gray_rescue_scaled)
                 cv2.imshow("img0_binary_rescue", cv2.resize(img0_binary_rescue, (0, 0), fx=0.8, fy=0.7))
                 cv2.imshow("img0_binary_rescue_clean", cv2.resize(img0_binary_rescue_clean, (0, 0), fx=0.8, fy=0.7))
@@ -587,17 +603,19 @@ def run_evac():
                     program_active = False
                     break
 
-            if len(sorted_circles) > 0:
-                lowest_circle = sorted_circles[0]
-                circle_check_counter = 0
+            if target is not None and target.misses == 0:
+                lowest_circle = target.circle()
+                if evac_map_enabled:
+                    visible = [track.circle()[0] for track in victim_tracker.confirmed_tracks() if track.misses == 0]
+                    evac_map.record_view(cmps.read_bearing_16bit(), visible, img0.shape[1])
 
                 # If the circle is +-100 pixels horizontally away from the centre, steer the robot towards it
                 if lowest_circle[0] < (img0.shape[1] / 2) - 100:
                     print("Circle is to the left")
-                    m.run_tank_for_time(-40, 40, 50, False)
+                    m.run_tank_for_time_async(-40, 40, 50, False)
                 elif lowest_circle[0] > (img0.shape[1] / 2) + 100:
                     print("Circle is to the right")
-                    m.run_tank_for_time(40, -40, 50, False)
+                    m.run_tank_for_time_async(40, -40, 50, False)
                 else:
                     last_circle_pos = lowest_circle
                     print("Circle is in the centre-ish")
@@ -606,66 +624,55 @@ def run_evac():
                     if lowest_circle[1] > THRESH_FINAL_APPROACH:
                         print("Approaching")
                         approach_victim(1)
-                    m.run_tank_for_time(40, 40, 300)
-            else:
-                if last_circle_pos is not None and last_circle_pos[1] > 340:
-                    print("Approaching with extra distance")
-                    approach_victim(1.5)
-                    continue
-                elif last_circle_pos is not None and last_circle_pos[1] <= 340 and abs(last_circle_pos[0] - (img0.shape[1] / 2)) < 250:
-                    # Did the circle vanish? Lets double check...
-                    if circle_check_counter < 3:
-                        print("Circle may have vanished, double checking")
-                        circle_check_counter += 1
-                        time.sleep(0.3)
-                        continue
                     else:
-                        print("Circle vanished")
+                        # Keep processing frames while driving, the next command replaces this one
+                        m.run_tank_for_time_async(40, 40, 300)
+            elif last_circle_pos is not None and last_circle_pos[1] > 340:
+                # The victim has gone below the camera, so it's right in front of us
+                print("Approaching with extra distance")
+                approach_victim(1.5)
+                continue
+            elif target is not None:
+                # The tracker keeps the victim for a few frames, so a missed detection doesn't send us rotating away
+                print(f"Circle may have vanished, tracking ({target.misses}/{victim_track_max_misses})")
+                continue
+            elif len(victim_tracker.tentative_tracks()) > 0:
+                # A new victim needs a few detections before it is trusted, so stay still until it is confirmed (or dropped)
+                print(f"Confirming {len(victim_tracker.tentative_tracks())} victim(s)")
+                continue
+            else:
+                if last_circle_pos is not None:
+                    print("Circle vanished")
                 last_circle_pos = None
-                print("Rotating")
-                m.run_tank_for_time(60, -60, 200)
-                time.sleep(0.2)
+
+                # A victim needs confirm_hits frames to be confirmed, so look for that long before recording this bearing as empty
+                if victim_tracker.frames_since_reset < victim_tracker.confirm_hits:
+                    continue
+
+                next_bearing = None
+                if evac_map_enabled:
+                    bearing = cmps.read_bearing_16bit()
+                    evac_map.record_view(bearing, [], img0.shape[1])
+                    evac_map.record_scan(bearing, uss.distance("front"), uss.distance("side"))
+                    next_bearing = evac_map.next_bearing(bearing)
+
+                if next_bearing is not None:
+                    print(f"Turning to {'victim' if len(evac_map.victims) > 0 else 'unexplored'} bearing {next_bearing:.1f}")
+                    align_to_bearing(next_bearing, 7, timeout=3, debug_prefix="EVAC Map - ")
+                else:
+                    print("Rotating")
+                    m.run_tank_for_time(60, -60, 200)
+                clock.sleep(0.2)
+                victim_tracker.reset()
 
         # ------------------------
         # BLOCK FINDING AND RESCUE
         # ------------------------
         elif rescue_mode == "block":
-            # Find the contours of the rescue blocks
-            img0_block_mask = cv2.inRange(img0_hsv, config_values["rescue_block_hsv_threshold"][0], config_values["rescue_block_hsv_threshold"][1])
-            img0_binary_rescue_block = cv2.bitwise_and(cv2.bitwise_not(img0_binary_rescue), img0_block_mask)
-            img0_binary_rescue_block = cv2.morphologyEx(img0_binary_rescue_block, cv2.MORPH_OPEN, np.ones((13,13),np.uint8))
-
-            contours_block = cv2.findContours(img0_binary_rescue_block, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
-            contours_block = [{
-                "contour": c, 
-                "contourArea": cv2.contourArea(c),
-                "boundingRect": cv2.boundingRect(c),
-                "touching_sides": [],
-                "near_sides": []
-            } for c in contours_block]
-
-            # Figure out which sides of the image the contours are touching
-            side_threshold = [10, 50]
-            for i, contour in enumerate(contours_block):
-                x, y, w, h = contour["boundingRect"]
-
-                if x < side_threshold[0]: contours_block[i]["touching_sides"].append("left")
-                if y < side_threshold[0]: contours_block[i]["touching_sides"].append("top")
-                if x + w > img0.shape[1] - side_threshold[0]: contours_block[i]["touching_sides"].append("right")
-                if y + h > img0.shape[0] - side_threshold[0]: contours_block[i]["touching_sides"].append("bottom")
-
-                if x < side_threshold[1]: contours_block[i]["near_sides"].append("left")
-                if y < side_threshold[1]: contours_block[i]["near_sides"].append("top")
-                if x + w > img0.shape[1] - side_threshold[1]: contours_block[i]["near_sides"].append("right")
-                if y + h > img0.shape[0] - side_threshold[1]: contours_block[i]["near_sides"].append("bottom")
-            
-            # Filter by area and ensure it doesn't touch the top
-            contours_block = [c for c in contours_block if c["contourArea"] > 10000 and "top" not in c["touching_sides"]]
-            
-            # Sort by area
-            contours_block = sorted(contours_block, key=lambda c: c["contourArea"], reverse=True)
+            contours_block = evac.find_blocks(img0_hsv, img0_binary_rescue, config_values["rescue_block_hsv_threshold"])
 
-            cv2.drawContours(img0, [c["contour"] for c in contours_block], -1, (0, 0, 255), 2)
+            for contour_block in contours_block:
+                cv2.rectangle(img0, contour_block["boundingRect"], (0, 0, 255), 2)
             if len(contours_block) > 0:
                 contour_block = contours_block[0]
 
@@ -676,7 +683,10 @@ def run_evac():
 
                 cv2.circle(img0, (int(cx), int(cy)), 5, (0, 0, 255), -1)
 
-                front_dist = USS["front"].distance * 100
+                if evac_map_enabled:
+                    evac_map.record_block(cmps.read_bearing_16bit(), cx, img0.shape[1])
+
+                front_dist = uss.distance("front")
                 if front_dist <= 5 and front_dist != 0:
                     bottom_block_approach_counter += 5
 
@@ -687,21 +697,18 @@ def run_evac():
                     if bottom_block_approach_counter > 30:
                         print("Finished approach")
                         m.run_tank_for_time(-40, -40, 1400)
-                        time.sleep(0.1)
+                        clock.sleep(0.1)
                         start_bearing = cmps.read_bearing_16bit()
                         align_to_bearing(start_bearing - 180, 10, debug_prefix="EVAC Align - ")
-                        time.sleep(0.1)
-                        m.run_tank_for_time(-35, -35, 1000)
-                        servo["gate"].angle = 70
-                        time.sleep(0.5)
+                        clock.sleep(0.1)
+                        delivery = Sequence("block delivery").motors(-35, -35).wait(1).stop().servo("gate", 70).wait(0.5)
                         for i in range(12):
-                            m.run_tank_for_time(100, 100, 150)
-                            m.run_tank_for_time(-100, -100, 250)
-                        servo["gate"].angle = -90
-                        m.run_tank_for_time(35, 35, 1000)
-                        time.sleep(1)
+                            delivery.motors(100, 100).wait(0.15).stop().motors(-100, -100).wait(0.25).stop()
+                        delivery.servo("gate", -90).motors(35, 35).wait(1).stop().wait(1).motors(35, 35).wait(0.2).stop()
+                        evac_sequence = choreo.run(delivery)
+                        continue
                     
-                    m.run_tank_for_time(35, 35, 200)
+                    m.run_tank_for_time_async(35, 35, 200)
                     print("Block on bottom - approach")
                 else:
                     if front_dist <= 5 and front_dist != 0:
@@ -709,7 +716,7 @@ def run_evac():
                     else:
                         bottom_block_approach_counter = 0
                     if (
-                        ("left" in contour["near_sides"] and "right" in contour["near_sides"])
+                        ("left" in contour_block["near_sides"] and "right" in contour_block["near_sides"])
                         or (
                             abs(cx - (img0.shape[1]/2)) < 50
                             and (("left" in contour_block["touching_sides"]) + ("right" in contour_block["touching_sides"])) != 1
@@ -724,24 +731,25 @@ def run_evac():
                         m.run_tank(35, 10)
                         print("Block on right - turn right")
             else:
-                m.run_tank_for_time(60, -60, 100)
+                block_bearing = evac_map.block_bearing(cmps.read_bearing_16bit()) if evac_map_enabled else None
+                if block_bearing is not None:
+                    print(f"Turning to block bearing {block_bearing:.1f}")
+                    align_to_bearing(block_bearing, 7, timeout=3, debug_prefix="EVAC Map - ")
+                else:
+                    m.run_tank_for_time_async(60, -60, 100)
             
             servo["claw"].angle = -90
 
             if servo["lift"].angle > -60:
                 # If the lift was down, give a bit of time before the camera moves
-                servo["cam"].angle = -80
-                servo["lift"].angle = -80
-                time.sleep(0.5)
-                servo["cam"].angle = evac_cam_angle
+                evac_sequence = choreo.run(Sequence("block lift").servo("cam", -80).servo("lift", -80).wait(0.5).servo("cam", evac_cam_angle))
             else:
                 servo["lift"].angle = -80
                 servo["cam"].angle = evac_cam_angle
 
             if debug_state("rescue"):
-                # cv2.imshow("img0_blurred", img0_blurred)
+                # cv2.imshow("img0_blurred", rescue_images["blurred"])
                 # cv2.imshow("img0_gray_rescue_scaled", img0_gray_rescue_scaled)
-                cv2.imshow("img0_binary_rescue_block", cv2.resize(img0_binary_rescue_block, (0, 0), fx=0.8, fy=0.7))
                 cv2.imshow("img0_binary_rescue", cv2.resize(img0_binary_rescue, (0, 0), fx=0.8, fy=0.7))
                 cv2.imshow("img0_binary_rescue_clean", cv2.resize(img0_binary_rescue_clean, (0, 0), fx=0.8, fy=0.7))
                 cv2.imshow("img0", cv2.resize(img0, (0, 0), fx=0.8, fy=0.7))
@@ -757,11 +765,11 @@ def run_evac():
 m.stop_all()
 os.system("cat motd.txt")
 while cam.is_halted():
-    time.sleep(0.1)
+    clock.sleep(0.1)
 
 for i in range(3, 0, -1):
     print(f"Starting in {i}...", end="\r")
-    time.sleep(1)
+    clock.sleep(1)
 
 # Clear the countdown line
 print("\033[K")
@@ -771,7 +779,7 @@ print()
 if cam.read_stream_processed()["raw"] is None:
     print("Waiting for first frame")
     while cam.read_stream_processed()["raw"] is None:
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
 # ---------
 # MAIN LOOP
@@ -781,11 +789,12 @@ while program_active:
         # ---------------
         # FRAME BALANCING
         # ---------------
-        time.sleep(program_sleep_time)
+        clock.sleep(program_sleep_time)
         frames += 1
+        frame_count += 1
 
         if frames % 30 == 0 and frames != 0:
-            fpsLoop = int(frames/(time.time()-fpsTime))
+            fpsLoop = int(frames/(clock.now()-fpsTime))
             fpsCamera = cam.get_fps()
 
             # Try to balance out the processing time and the camera FPS
@@ -798,19 +807,23 @@ while program_active:
                 program_sleep_time -= sleep_adjustment_amt
 
             if frames > 500:
-                fpsTime = time.time()
+                fpsTime = clock.now()
                 frames = 0
-            print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)}")
+            print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)} \tROI Hit: {int(line_tracker.hit_rate()*100)}% \tROI Saved: {int(line_tracker.saved_fraction()*100)}%")
+            if speed_scheduler_enabled:
+                print(f"Speed scheduler: {speed_scheduler.summary()}")
+            if motor_writer_enabled:
+                print(m.writer.summary())
 
         # ------------------
         # OBSTACLE AVOIDANCE
         # ------------------
-        front_dist = USS["front"].distance * 100
+        front_dist = uss.distance("front")
         if front_dist < obstacle_treshold:
             print(f"Obstacle detected at {front_dist}cm... ", end="")
             m.stop_all()
-            time.sleep(0.7)
-            if USS["front"].distance * 100 < obstacle_treshold + 1:
+            clock.sleep(0.7)
+            if uss.distance("front") < obstacle_treshold + 1:
                 print("Confirmed.")
                 avoid_obstacle()
             else:
@@ -823,7 +836,7 @@ while program_active:
         if cam.is_halted():
             print("Camera is halted... Waiting")
             m.stop_all()
-            time.sleep(0.1)
+            clock.sleep(0.1)
             continue
         
         changed_black_contour = False
@@ -857,33 +870,40 @@ while program_active:
             continue
 
         
+        is_there_green = np.count_nonzero(img0_green == 0)
+
+        # Filter white contours to have a minimum area before we accept them, for the green turns and intersections
+        white_contours_filtered = [contour for contour in white_contours if cv2.contourArea(contour) > 500]
+
         # Find black contours
+        # Only the area around the tracked line is searched, unless this frame may contain an intersection
+        # The signature counts the same white contours as the intersection branches, so every frame they handle is searched in full
         # If there are no black contours, skip the rest of the loop
-        img0_line_not = cv2.bitwise_not(img0_line)
-        black_contours, black_hierarchy = cv2.findContours(img0_line_not, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        intersection_signature = len(white_contours_filtered) > 2 or is_there_green > 4000 or turning is not None or current_linefollowing_state is not None
+        black_contours, black_hierarchy, line_roi = line_tracker.find_contours(img0_line, black_contour_threshold, force_full=intersection_signature)
         if (len(black_contours) == 0):
             print("No black contours found")
+            line_tracker.reset()
             continue
         
         # -----------
         # GREEN TURNS
         # -----------
 
-        is_there_green = np.count_nonzero(img0_green == 0)
         black_contours_turn = None
 
         # print("Green: ", is_there_green)
         
         img0_line_new = img0_line.copy()
+        img0_line_steer = img0_line # Line mask (line is black) that the chosen contour came from, used by the scanline estimator
 
         # Check if there is a significant amount of green pixels
-        if is_there_green > 4000: #and len(white_contours) > 2: #((is_there_green > 1000 or time.time() - last_green_found_time < 0.5) and (len(white_contours) > 2 or greenCenter is not None)):
+        if is_there_green > 4000: #and len(white_contours) > 2: #((is_there_green > 1000 or clock.now() - last_green_found_time < 0.5) and (len(white_contours) > 2 or greenCenter is not None)):
             changed_img0_line = None
 
             unfiltered_green_contours, green_hierarchy = cv2.findContours(cv2.bitwise_not(img0_green), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
             green_contours_filtered = [contour for contour in unfiltered_green_contours if cv2.contourArea(contour) > 1000]
-            white_contours_filtered = [contour for contour in white_contours if cv2.contourArea(contour) > 500]
             
             followable_green = []
             for g_contour in green_contours_filtered:
@@ -933,23 +953,17 @@ while program_active:
                     if not turning:
                         # With double green, we may briefly see only 1 green contour while entering. 
                         # Hence, add some delay to when we start turning to prevent this and ensure we can see all green contours
-                        if time.time() - initial_green_time < 1: initial_green_time = time.time() # Reset the initial green time
-                        if time.time() - initial_green_time < 0.3: can_follow_green = False
+                        if clock.now() - initial_green_time < 1: initial_green_time = clock.now() # Reset the initial green time
+                        if clock.now() - initial_green_time < 0.3: can_follow_green = False
                     
                     if can_follow_green:
                         selected = followable_green[0]
-                        # Dilate selected["w"] to make it larger, and then use it as a mask
-                        img_black = np.zeros((img0.shape[0], img0.shape[1]), np.uint8)
-                        cv2.drawContours(img_black, [selected["w"]], -1, 255, 100)
-
-                        # Mask the line image with the dilated white contour
-                        img0_line_new = cv2.bitwise_and(cv2.bitwise_not(img0_line), img_black)
-                        # Erode the line image to remove slight inconsistencies we don't want
-                        img0_line_new = cv2.erode(img0_line_new, np.ones((3,3), np.uint8), iterations=2)
+                        # Keep only the line around the white contour, only processing the area near it
+                        img0_line_new, changed_img0_line_roi = ck.greenTurnLineMask(img0_line, selected["w"])
 
                         changed_img0_line = img0_line_new
 
-                        last_green_time = time.time()
+                        last_green_time = clock.now()
                         if not turning:
                             # Based on the centre location of the white contour, we are either turning left or right
                             if selected["w_bounds"][0] + selected["w_bounds"][2] / 2 < img0.shape[1] / 2:
@@ -962,64 +976,63 @@ while program_active:
             if (changed_img0_line is not None):
                 print("Green caused a change in the line")
                 img0_line_new = changed_img0_line
-                new_black_contours, new_black_hierarchy = cv2.findContours(img0_line_new, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+                roi_x, roi_y, roi_w, roi_h = changed_img0_line_roi
+                new_black_contours, new_black_hierarchy = cv2.findContours(img0_line_new[roi_y:roi_y+roi_h, roi_x:roi_x+roi_w], cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE, offset=(roi_x, roi_y))
                 cv2.drawContours(img0, new_black_contours, -1, (0,0,255), 2)
                 if (len(new_black_contours) > 0):
                     black_contours = new_black_contours
                     black_hierarchy = new_black_hierarchy
+                    img0_line_steer = cv2.bitwise_not(img0_line_new)
                 else:
                     print("No black contours found after changing contour")
 
                 changed_black_contour = False
 
             print("GREEN TURN STUFF")
-        elif turning is not None and last_green_time + 1 < time.time():
+        elif turning is not None and last_green_time + 1 < clock.now():
             turning = None
             print("No longer turning")
         
         # -----------------
         # STOP ON RED CHECK
         # -----------------
-        img0_red = cv2.inRange(img0_hsv, config_values["red_hsv_threshold"][0], config_values["red_hsv_threshold"][1])
-        img0_red = cv2.dilate(img0_red, np.ones((5,5),np.uint8), iterations=2)
-
-        red_contours = [[contour, cv2.contourArea(contour)] for contour in cv2.findContours(img0_red, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]]
-        red_contours = sorted(red_contours, key=lambda contour: contour[1], reverse=True)
-        red_contours_filtered = [contour[0] for contour in red_contours if contour[1] > 20000]
-
-        if len(red_contours_filtered) > 0:
-            edges = sorted(ck.getTouchingEdges(ck.simplifiedContourPoints(red_contours_filtered[0]), img0_binary.shape))
-            if edges == ["left", "right"]:
-                m.stop_all()
-                red_stop_check += 1
-                print(f"RED IDENTIFIED - {red_stop_check}/3 tries")
-
-                if red_stop_check == 1:
-                    time.sleep(0.1)
-                    m.run_tank_for_time(-40, -40, 100)
-                    time.sleep(0.1)
-
-                time.sleep(7)
-
-                if debug_state():
-                    cv2.imshow("img0_red", img0_red)
-                    cv2.waitKey(1)
-                    
-                if red_stop_check > 3:
-                    print("DETECTED RED STOP 3 TIMES, STOPPING")
-                    break
+        img0_red = None
+        if band_detector == "profile":
+            is_red_stop, red_band = ck.findRedStopBand(img0_hsv, config_values["red_hsv_threshold"])
+            is_large_red = red_band is not None and red_band["pixels"] > 20000
+        else:
+            is_red_stop, img0_red = ck.findRedStopContour(img0_hsv, config_values["red_hsv_threshold"])
+            is_large_red = np.count_nonzero(img0_red) > 20000
 
-                continue # Don't run the rest of the follower, we don't really want to move forward in case we accidentally loose the red...
-            else:
-                red_stop_check = 0
+        if is_red_stop:
+            m.stop_all()
+            red_stop_check += 1
+            print(f"RED IDENTIFIED - {red_stop_check}/3 tries")
+
+            if red_stop_check == 1:
+                clock.sleep(0.1)
+                m.run_tank_for_time(-40, -40, 100)
+                clock.sleep(0.1)
+
+            clock.sleep(7)
+
+            if debug_state() and img0_red is not None:
+                cv2.imshow("img0_red", img0_red)
+                cv2.waitKey(1)
+                
+            if red_stop_check > 3:
+                print("DETECTED RED STOP 3 TIMES, STOPPING")
+                break
+
+            continue # Don't run the rest of the follower, we don't really want to move forward in case we accidentally loose the red...
+        elif is_large_red:
+            # Only a lot of red that isn't a stop line resets the count, so losing sight of the line for a frame doesn't
+            red_stop_check = 0
 
         # -------------
         # INTERSECTIONS
         # -------------
         if not turning:
-            # Filter white contours to have a minimum area before we accept them 
-            white_contours_filtered = [contour for contour in white_contours if cv2.contourArea(contour) > 500]
-
             if len(white_contours_filtered) == 2:
                 contour_L = white_contours_filtered[0]
                 contour_R = white_contours_filtered[1]
@@ -1097,189 +1110,39 @@ while program_active:
                 if "4-ng" in current_linefollowing_state:
                     current_linefollowing_state = "3-ng-4-ex"
                 
-                intersection_state_debug = ["3-ng", time.time()]
-                # Get the center of each contour
-                white_contours_filtered_with_center = [(contour, ck.centerOfContour(contour)) for contour in white_contours_filtered]
-
-                # Sort the contours from left to right - Based on the centre of the contour's horz val
-                sorted_contours_horz = sorted(white_contours_filtered_with_center, key=lambda contour: contour[1][0])
-
-                # Simplify the contours to get the corner points
-                approx_contours = [ck.simplifiedContourPoints(contour[0], 0.03) for contour in sorted_contours_horz]
-
-                # Middle of contour centres
-                mid_point = (
-                    int(sum([contour[1][0] for contour in sorted_contours_horz])/len(sorted_contours_horz)),
-                    int(sum([contour[1][1] for contour in sorted_contours_horz])/len(sorted_contours_horz))
-                )
-
-                # Get the closest point of the approx contours to the mid point
-                def closestPointToMidPoint(approx_contour, mid_point):
-                    return sorted(approx_contour, key=lambda point: ck.pointDistance(point, mid_point))[0]
-
-                # Get the closest points of each approx contour to the mid point, and store the index of the contour to back reference later
-                closest_points = [
-                    [closestPointToMidPoint(approx_contour, mid_point), i] 
-                    for i, approx_contour in enumerate(approx_contours)
-                ]
-                
-                # Get the closest points, sorted by distance to mid point
-                sorted_closest_points = sorted(closest_points, key=lambda point: ck.pointDistance(point[0], mid_point))
-                closest_2_points_vert_sort = sorted(sorted_closest_points[:2], key=lambda point: point[0][1])
-
-                # If a point is touching the top/bottom of the screen, it is quite possibly invalid and will cause some issues with cutting
-                # So, we will find the next best point, the point inside the other contour that is at the top of the screen, and is closest to the X value of the other point
-                for i, point in enumerate(closest_2_points_vert_sort):
-                    if point[0][1] > img0_line_new.shape[0]-10 or point[0][1] < 10:
-                        # Find the closest point to the x value of the other point                    
-                        other_point_x = closest_2_points_vert_sort[1-i][0][0]
-                        other_point_approx_contour_i = closest_2_points_vert_sort[1-i][1]
-
-                        closest_points_to_other_x = sorted(approx_contours[other_point_approx_contour_i], key=lambda point: abs(point[0] - other_point_x))
-                        new_valid_points = [
-                            point for point in closest_points_to_other_x 
-                            if not np.isin(point, [
-                                closest_2_points_vert_sort[0][0],
-                                closest_2_points_vert_sort[1][0]
-                            ]).any()
-                        ]
-                        if len(new_valid_points) == 0:
-                            # print(f"Point {i} is at an edge, but no new valid points were found")
-                            continue
-
-                        closest_2_points_vert_sort = sorted([[new_valid_points[0], other_point_approx_contour_i], closest_2_points_vert_sort[1-i]], key=lambda point: point[0][1])
-                        # print(f"Point {i} is at an edge, replacing with {new_valid_points[0]}")
-
-                split_line = [point[0] for point in closest_2_points_vert_sort]
-                
-                contour_center_point_sides = [[], []] # Left, Right
-                for i, contour in enumerate(sorted_contours_horz):
-                    if split_line[1][0] == split_line[0][0]:  # Line is vertical, so x is constant
-                        side = "right" if contour[1][0] < split_line[0][0] else "left"
-                    else:
-                        slope = (split_line[1][1] - split_line[0][1]) / (split_line[1][0] - split_line[0][0])
-                        y_intercept = split_line[0][1] - slope * split_line[0][0]
-
-                        if contour[1][1] < slope * contour[1][0] + y_intercept:
-                            side = "left" if slope > 0 else "right"
-                        else:
-                            side = "right" if slope > 0 else "left"
-
-                    contour_center_point_sides[side == "left"].append(contour[1])
-                
-                # Get the edges that the contour not relevant to the closest points touches
-                edges_big = sorted(ck.getTouchingEdges(approx_contours[sorted_closest_points[2][1]], img0_binary.shape))
+                intersection_state_debug = ["3-ng", clock.now()]
+                split = helper_intersections.three_way_split(white_contours_filtered, img0_binary.shape)
 
                 # --------------
                 # EVAC DETECTION
                 # --------------
-                # This is a janky solution to detecting evac entry... it should work for now, but definitely should be looked at.
-                if len(black_contours) >= 1 and edges_big == ["left", "right", "top"]:
-                    edges_black = sorted(ck.getTouchingEdges(ck.simplifiedContourPoints(black_contours[0], 0.03), img0_binary.shape))
+                if helper_intersections.is_evac_entrance(img0_line, black_contours, split["edges_big"], band_detector):
+                    m.stop_all()
+                    evac_detect_check += 1
+                    print(f"EVACUATION ZONE DETECTED: {evac_detect_check}/3")
+
+                    if evac_detect_check == 1:
+                        clock.sleep(0.1)
+                        m.run_tank_for_time(-40, -40, 100)
+                        clock.sleep(0.1)
+
+                    if evac_detect_check >= 3:
+                        print("STARTING EVAC")
+                        run_evac()
                     
-                    if edges_black == ["bottom", "left", "right"]:
-                        m.stop_all()
-                        evac_detect_check += 1
-                        print(f"EVACUATION ZONE DETECTED: {evac_detect_check}/3")
-
-                        if evac_detect_check == 1:
-                            time.sleep(0.1)
-                            m.run_tank_for_time(-40, -40, 100)
-                            time.sleep(0.1)
-
-                        if evac_detect_check >= 3:
-                            print("STARTING EVAC")
-                            run_evac()
-                        
-                        time.sleep(0.1)
-                        continue
+                    clock.sleep(0.1)
+                    continue
                 
                 evac_detect_check = 0
 
                 # --- Rest of 3WC Intersections
-
-                # Cut direction is based on the side of the line with the most contour center points (contour_center_point_sides)
-                cut_direction = len(contour_center_point_sides[0]) > len(contour_center_point_sides[1])
-
-                # If we are just entering a 3-way intersection, and the 'big contour' does not connect to the bottom, 
-                # we may be entering a 4-way intersection... so follow the vertical line
-                if len(edges_big) >= 2 and "bottom" not in edges_big and "-en" in current_linefollowing_state:
-                    cut_direction = not cut_direction
-                # We are exiting a 4-way intersection, so follow the vertical line
-                elif current_linefollowing_state == "3-ng-4-ex":
-                    cut_direction = not cut_direction
-                else:
-                    # We have probably actually entered now, lets stop following the vert line and do the normal thing.
-                    current_linefollowing_state = "3-ng"
-
-                    # If this is true, the line we want to follow is the smaller, perpendicular line to the large line.
-                    # This case should realistically never happen, but it's here just in case.
-                    if edges_big == ["bottom", "left", "right"] or edges_big == ["left", "right", "top"]:
-                        cut_direction = not cut_direction
-                    # If the contour not relevant to the closest points is really small (area), we are probably just entering the intersection,
-                    # So we need to follow the line that is perpendicular to the large line
-                    # We ignore this if edges_big does not include the bottom, because we could accidently have the wrong contour in some weird angle
-                    elif cv2.contourArea(sorted_contours_horz[sorted_closest_points[2][1]][0]) < 7000 and "bottom" in edges_big:
-                        cut_direction = not cut_direction
-
-                # CutMaskWithLine will fail if the line is flat, so we need to make sure that the line is not flat
-                if closest_2_points_vert_sort[0][0][1] == closest_2_points_vert_sort[1][0][1]:
-                    closest_2_points_vert_sort[0][0][1] += 1 # Move the first point up by 1 pixel
-                    
-                img0_line_new = helper_intersections.CutMaskWithLine(closest_2_points_vert_sort[0][0], closest_2_points_vert_sort[1][0], img0_line_new, "left" if cut_direction else "right")
+                cut_direction, current_linefollowing_state = helper_intersections.three_way_cut_direction(split, current_linefollowing_state)
+                img0_line_new = helper_intersections.three_way_cut(img0_line_new, split, cut_direction)
                 changed_black_contour = cv2.bitwise_not(img0_line_new)
 
             elif (len(white_contours_filtered) == 4):
-                intersection_state_debug = ["4-ng", time.time()]
-                # Get the center of each contour
-                white_contours_filtered_with_center = [(contour, ck.centerOfContour(contour)) for contour in white_contours_filtered]
-
-                # Sort the contours from left to right - Based on the centre of the contour's horz val
-                sorted_contours_horz = sorted(white_contours_filtered_with_center, key=lambda contour: contour[1][0])
-                
-                # Sort the contours from top to bottom, for each side of the image - Based on the centre of the contour's vert val
-                contour_BL, contour_TL = tuple(sorted(sorted_contours_horz[:2], reverse=True, key=lambda contour: contour[1][1]))
-                contour_BR, contour_TR = tuple(sorted(sorted_contours_horz[2:], reverse=True, key=lambda contour: contour[1][1]))
-
-                # Simplify the contours to get the corner points
-                approx_BL = ck.simplifiedContourPoints(contour_BL[0], 0.03)
-                approx_TL = ck.simplifiedContourPoints(contour_TL[0], 0.03)
-                approx_BR = ck.simplifiedContourPoints(contour_BR[0], 0.03)
-                approx_TR = ck.simplifiedContourPoints(contour_TR[0], 0.03)
-
-                # Middle of contour centres
-                mid_point = (
-                    int((contour_BL[1][0] + contour_TL[1][0] + contour_BR[1][0] + contour_TR[1][0]) / 4),
-                    int((contour_BL[1][1] + contour_TL[1][1] + contour_BR[1][1] + contour_TR[1][1]) / 4)
-                )
-
-                # Get the closest point of the approx contours to the mid point
-                def closestPointToMidPoint(approx_contour, mid_point):
-                    return sorted(approx_contour, key=lambda point: ck.pointDistance(point, mid_point))[0]
-                
-                closest_BL = closestPointToMidPoint(approx_BL, mid_point)
-                closest_TL = closestPointToMidPoint(approx_TL, mid_point)
-                closest_BR = closestPointToMidPoint(approx_BR, mid_point)
-                closest_TR = closestPointToMidPoint(approx_TR, mid_point)
-
-                # If closest_TL or closest_TR is touching the top of the screen, it is quite possibly invalid and will cause some issues with cutting
-                # So, we will find the next best point, the point inside the relevant contour, and is closest to the X value of the other point
-                if closest_TL[1] < 10:
-                    closest_TL = closest_BL
-                    closest_BL = sorted(approx_BL, key=lambda point: abs(point[0] - closest_BL[0]))[1]
-                elif closest_BL[1] > img0_binary.shape[0] - 10:
-                    closest_BL = closest_TL
-                    closest_TL = sorted(approx_TL, key=lambda point: abs(point[0] - closest_TL[0]))[1]
-                # # We will do the same with the right-side contours
-                if closest_TR[1] < 10:
-                    closest_TR = closest_BR
-                    closest_BR = sorted(approx_BR, key=lambda point: abs(point[0] - closest_BR[0]))[1]
-                elif closest_BR[1] > img0_binary.shape[0] - 10:
-                    closest_BR = closest_TR
-                    closest_TR = sorted(approx_TR, key=lambda point: abs(point[0] - closest_TR[0]))[1]
-
-                img0_line_new = helper_intersections.CutMaskWithLine(closest_BL, closest_TL, img0_line_new, "left")
-                img0_line_new = helper_intersections.CutMaskWithLine(closest_BR, closest_TR, img0_line_new, "right")
+                intersection_state_debug = ["4-ng", clock.now()]
+                img0_line_new = helper_intersections.four_way_cut(img0_line_new, white_contours_filtered)
 
                 current_linefollowing_state = "4-ng"
                 changed_black_contour = cv2.bitwise_not(img0_line_new)
@@ -1291,6 +1154,7 @@ while program_active:
             if (len(new_black_contours) > 0):
                 black_contours = new_black_contours
                 black_hierarchy = new_black_hierarchy
+                img0_line_steer = img0_line_new
             else:
                 print("No black contours found after changing contour")
 
@@ -1304,6 +1168,7 @@ while program_active:
         sorted_black_contours = ck.findBestContours(black_contours, black_contour_threshold, last_line_pos)
         if len(sorted_black_contours) == 0:
             print("No black contours found")
+            line_tracker.reset()
 
             # This is a botchy temp fix so that sometimes we can handle the case where we lose the line, 
             # and other times we can handle gaps in the line
@@ -1318,7 +1183,8 @@ while program_active:
             # Optimally, this should figure out if the line lost was in the centre and hence we haven't just fallen off the line.
             # Going forward, instead of using current_steering, means if we fall off the line, we have little hope of getting back on...
             new_steer = current_steering if no_black_contours_mode == "steer" else 0
-            m.run_steer(follower_speed, 100, new_steer)
+            m.run_steer(follower_speed, 100, new_steer, frame_id=frame_count)
+            speed_scheduler.reset()
 
             preview_image_img0 = cv2.resize(img0, (0,0), fx=0.8, fy=0.7)
             
@@ -1370,22 +1236,71 @@ while program_active:
             elif horz_sorted_black_bounding_points_top_2[1][0] > img0.shape[1] - bigTurnSideMargin:
                 isBigTurn = 2
 
+        # The closer the topmost point is to the bottom of the screen, the more we want to turn
+        topmost_point = sorted(black_bounding_box, key=lambda point: point[1])[0]
+        topmost_y = topmost_point[1]
+
+        rect_estimate = (black_contour_error, black_contour_angle_new)
+
+        # Scanline estimate of the same line, calculated alongside the minAreaRect estimate for comparison
+        scanline_centres = ck.scanlineCentres(img0_line_steer, scanline_count, cv2.boundingRect(chosen_black_contour[2]), last_line_pos[0])
+        scanline_fit = ck.fitScanlineCentres(scanline_centres["points"], img0.shape[1]/2) if scanline_centres is not None else None
+
+        if steering_estimator == "scanline" and scanline_fit is not None:
+            black_contour_error = int(scanline_fit["error"])
+            black_contour_angle_new = int(scanline_fit["heading"])
+            topmost_y = scanline_fit["top"]
+
+            isBigTurn = 0
+            if abs(black_contour_angle_new) > bigTurnAngleMargin:
+                if scanline_centres["exit_side"] == "left":
+                    isBigTurn = 1
+                elif scanline_centres["exit_side"] == "right":
+                    isBigTurn = 2
+
+        # Measure the line on the floor instead of in the tilted image, so that angles and margins don't depend on where the line is
+        # Only the few points used for steering are transformed, the image itself is never warped
+        if steering_ground_plane:
+            ground_homography = ck.groundHomography(servo["cam"].angle, config_values["camera_geometry"])
+
+            if steering_estimator == "scanline" and scanline_fit is not None:
+                # Flip y so that forwards on the floor is "up", like in the image
+                ground_fit = ck.fitScanlineCentres(ck.imageToGround(scanline_centres["points"], ground_homography) * [1, -1], 0)
+                ground_error = ground_fit["error"]
+                ground_angle = ground_fit["heading"]
+            else:
+                ground_BL, ground_TR, ground_centre = ck.imageToGround([black_bounding_box_BL, black_bounding_box_TR, last_line_pos], ground_homography)
+                ground_error = ground_centre[0]
+                ground_angle = math.degrees(math.atan2(ground_TR[0] - ground_BL[0], ground_TR[1] - ground_BL[1]))
+
+            # Scale the floor error into the same range as the image error, so the PID weights still apply
+            black_contour_error = int(ground_error / max_error_ground * max_error)
+            black_contour_angle_new = int(ground_angle)
+
         if isBigTurn == 1 and black_contour_angle_new > 0 or isBigTurn == 2 and black_contour_angle_new < 0:
             black_contour_angle_new = black_contour_angle_new*-1
+
+        line_tracker.update(chosen_black_contour[1][0], black_contour_angle_new, cv2.boundingRect(chosen_black_contour[2]))
             
         current_position = (black_contour_angle_new/max_angle)*angle_weight+(black_contour_error/max_error)*error_weight
         current_position *= 100
 
-        # The closer the topmost point is to the bottom of the screen, the more we want to turn
-        topmost_point = sorted(black_bounding_box, key=lambda point: point[1])[0]
-        extra_pos = ((topmost_point[1]/img0.shape[1]) * 10)
+        extra_pos = ((topmost_y/img0.shape[1]) * 10)
         if (isBigTurn and extra_pos > 1):
             current_position *= min(0.7 * extra_pos, 1)
+
+        # Speed up on straights, and slow down when the line ahead bends or an intersection is coming up
+        base_speed = follower_speed
+        if speed_scheduler_enabled:
+            base_speed = speed_scheduler.update(
+                scanline_fit["heading_change"] if scanline_fit is not None else None,
+                intersection_signature or isBigTurn != 0
+            )
         
         # PID stuff
         error = -current_position
 
-        timeDiff = time.time() - current_time
+        timeDiff = clock.now() - current_time
         if (timeDiff == 0):
             timeDiff = 1/10
         proportional = KP*(error)
@@ -1394,34 +1309,42 @@ while program_active:
         current_steering = -(proportional + pid_integral + derivative)
         
         pid_last_error = error
-        current_time = time.time()
+        current_time = clock.now()
 
         current_pitch = cmps.read_pitch()
 
         if current_pitch > 180 and current_pitch < 240:
+            speed_scheduler.reset()
             if time_since_ramp_start == 0:
-                time_since_ramp_start = time.time()
-            print(f"RAMP ({int(time.time() - time_since_ramp_start)})") 
-            if time.time() - time_since_ramp_start > 18:
-                motor_vals = m.run_steer(100, 100, 0)
-            if time.time() - time_since_ramp_start > 10:
-                motor_vals = m.run_steer(80, 100, current_steering, ramp=True)
+                time_since_ramp_start = clock.now()
+            print(f"RAMP ({int(clock.now() - time_since_ramp_start)})") 
+            if clock.now() - time_since_ramp_start > 18:
+                motor_vals = m.run_steer(100, 100, 0, frame_id=frame_count)
+            if clock.now() - time_since_ramp_start > 10:
+                motor_vals = m.run_steer(80, 100, current_steering, ramp=True, frame_id=frame_count)
             else:
-                motor_vals = m.run_steer(follower_speed, 100, current_steering, ramp=True)
+                motor_vals = m.run_steer(follower_speed, 100, current_steering, ramp=True, frame_id=frame_count)
         else:
             if time_since_ramp_start > 3:
-                time_ramp_end = time.time() + 2
+                time_ramp_end = clock.now() + 2
 
             time_since_ramp_start = 0
-            if time.time() < time_ramp_end:
+            if clock.now() < time_ramp_end:
                 print("END RAMP")
-                last_significant_bearing_change = time.time()
-                motor_vals = m.run_steer(follower_speed, 100, current_steering, ramp=True)
+                speed_scheduler.reset()
+                last_significant_bearing_change = clock.now()
+                motor_vals = m.run_steer(follower_speed, 100, current_steering, ramp=True, frame_id=frame_count)
             else:
-                new_bearing = cmps.read_bearing_16bit()
+                if cmps_sampler.running and cmps_sampler.count > 0:
+                    # The bearing when the frame was captured, and the sampler's filtered yaw rate
+                    new_bearing = cmps_sampler.at(cam.last_capture_time)["bearing"]
+                    speed_scheduler.set_yaw_rate(cmps_sampler.yaw_rate)
+                else:
+                    new_bearing = cmps.read_bearing_16bit()
+                    speed_scheduler.observe_bearing(new_bearing)
 
                 if current_bearing is None:
-                    last_significant_bearing_change = time.time()
+                    last_significant_bearing_change = clock.now()
                     current_bearing = new_bearing
                 
                 bearing_diff = abs(new_bearing - current_bearing)
@@ -1429,20 +1352,22 @@ while program_active:
                     
                 # Check if the absolute difference is within the specified range or if it wraps around 360
                 bearing_min_err = 6
-                if (bearing_diff <= bearing_min_err or bearing_diff >= (360 - bearing_min_err)) and int(time.time() - last_significant_bearing_change) > 10:
+                if (bearing_diff <= bearing_min_err or bearing_diff >= (360 - bearing_min_err)) and int(clock.now() - last_significant_bearing_change) > 10:
                     print("SAME BEARING FOR 10 SECONDS")
-                    m.run_tank_for_time(100, 100, 400)
-                    last_significant_bearing_change = time.time()
+                    m.run_tank_for_time_async(100, 100, 400)
+                    last_significant_bearing_change = clock.now()
                 elif not (bearing_diff <= bearing_min_err or bearing_diff >= (360 - bearing_min_err)):
-                    last_significant_bearing_change = time.time()
+                    last_significant_bearing_change = clock.now()
                     
-                motor_vals = m.run_steer(follower_speed, 100, current_steering)
+                # Let the unstick move finish, while still processing frames
+                if not m.is_moving():
+                    motor_vals = m.run_steer(base_speed, 100, current_steering, frame_id=frame_count)
 
         # ----------
         # DEBUG INFO
         # ----------
 
-        print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)} \tSteer: {int(current_steering)} \t{str(motor_vals)}\tUSS: {round(front_dist, 1)}\tPit: {int(current_pitch)}\tBear: {current_bearing} LSB: {int(time.time() - last_significant_bearing_change)}")
+        print(f"FPS: {fpsLoop}, {fpsCamera} \tDel: {int(program_sleep_time*1000)} \tSteer: {int(current_steering)} \t{str(motor_vals)}\tUSS: {round(front_dist, 1)}\tPit: {int(current_pitch)}\tBear: {current_bearing} LSB: {int(clock.now() - last_significant_bearing_change)}")
         if debug_state():
             # cv2.drawContours(img0, [chosen_black_contour[2]], -1, (0,255,0), 3) # DEBUG
             # cv2.drawContours(img0, [black_bounding_box], 0, (255, 0, 255), 2)
@@ -1486,6 +1411,8 @@ while program_active:
             cv2.drawContours(preview_image_img0_contours, white_contours, -1, (255,0,0), 3)
             cv2.drawContours(preview_image_img0_contours, black_contours, -1, (0,255,0), 3)
             cv2.drawContours(preview_image_img0_contours, [chosen_black_contour[2]], -1, (0,0,255), 3)
+            if line_roi is not None:
+                cv2.rectangle(preview_image_img0_contours, line_roi, (255,255,0), 2)
             
             cv2.putText(preview_image_img0_contours, f"{black_contour_angle:4d} Angle Raw", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2) # DEBUG
             cv2.putText(preview_image_img0_contours, f"{black_contour_angle_new:4d} Angle", (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2) # DEBUG
@@ -1493,6 +1420,12 @@ while program_active:
             cv2.putText(preview_image_img0_contours, f"{int(current_position):4d} Position", (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2) # DEBUG
             cv2.putText(preview_image_img0_contours, f"{int(current_steering):4d} Steering", (10, 140), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2) # DEBUG
             cv2.putText(preview_image_img0_contours, f"{int(extra_pos):4d} Extra", (10, 170), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2) # DEBUG
+
+            cv2.putText(preview_image_img0_contours, f"Rect: {rect_estimate[0]} Err {rect_estimate[1]} Ang", (10, 275), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2) # DEBUG
+            if scanline_fit is not None:
+                for point in scanline_centres["points"]:
+                    cv2.circle(preview_image_img0_contours, (int(point[0]), int(point[1])), 4, (255, 0, 255), -1)
+                cv2.putText(preview_image_img0_contours, f"Scan: {int(scanline_fit['error'])} Err {int(scanline_fit['heading'])} Ang {scanline_fit['curvature']*1000:.2f} Curv", (10, 300), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2) # DEBUG
             
             if turning is not None:
                 cv2.putText(preview_image_img0_contours, f"{turning} Turning", (10, 220), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (125, 0, 255), 2) # DEBUG
@@ -1501,7 +1434,7 @@ while program_active:
                 cv2.putText(preview_image_img0_contours, f"Big Turn", (10, 250), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
 
             cv2.putText(preview_image_img0_contours, f"LF State: {current_linefollowing_state}", (10, 330), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
-            cv2.putText(preview_image_img0_contours, f"INT Debug: {intersection_state_debug[0]} - {int(time.time() - intersection_state_debug[1])}", (10, 360), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
+            cv2.putText(preview_image_img0_contours, f"INT Debug: {intersection_state_debug[0]} - {int(clock.now() - intersection_state_debug[1])}", (10, 360), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2)
 
             cv2.putText(preview_image_img0_contours, f"FPS: {fpsLoop} | {fpsCamera}", (10, 390), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 100, 0), 2)
 
@@ -1530,6 +1463,6 @@ while program_active:
         traceback.print_exc()
         print("Returning to start of loop in 5 seconds...")
         m.stop_all()
-        time.sleep(5)
+        clock.sleep(5)
 
 exit_gracefully()
\ No newline at end of file
@@ -1,14 +1,15 @@
-import time
 import cv2
 import json
 import numpy as np
 import queue
-from picamera2 import Picamera2
+import helper_camerakit as ck
+import helper_clock as clock
+import helper_devices as devices
 from threading import Thread
 
 def get_camera(num):
-    cam = Picamera2(num)
-    if num == 0: # Pi camera
+    cam = devices.camera(num)
+    if num == 0 and not devices.SIMULATED: # Pi camera
         available_modes = cam.sensor_modes
         available_modes.sort(key=lambda x: x["fps"], reverse=True)
         chosen_mode = available_modes[0]
@@ -93,8 +94,8 @@ class CameraStream:
         
     def update_stream(self):
         self.cam.start()
-        self.start_time = time.time()
-        self.last_capture_time = time.time()
+        self.start_time = clock.now()
+        self.last_capture_time = clock.now()
 
         while self.stream_running:
             self.frames += 1
@@ -102,7 +103,7 @@ class CameraStream:
             if not self.buffer_thread or not self.buffer_thread.is_alive():
                 self.buffer_halt = True
                 print("\n[CAMERA] NEW BUFFER CREATED\n")
-                if time.time() - self.last_buffer_create_time < 5:
+                if clock.now() - self.last_buffer_create_time < 5:
                     print("[CAMERA] WARNING: Buffer thread died too quickly, entirely restarting stream")
                     try:
                         def thread_attempt_stop():
@@ -128,21 +129,21 @@ class CameraStream:
                     
                     self.cam = get_camera(self.num)
                     self.cam.start()
-                    print("[CAMERA] Camera restarted, continuing", time.time())
+                    print("[CAMERA] Camera restarted, continuing", clock.now())
                     
                 self.buffer_thread_id += 1
                 self.first_frame_found = False
                 self.buffer_thread = Thread(target=self.capture_buffer_thread, args=(self.buffer_thread_id,))
                 self.buffer_thread.start()
-                self.last_capture_time = time.time()
-                self.last_buffer_create_time = time.time()
+                self.last_capture_time = clock.now()
+                self.last_buffer_create_time = clock.now()
 
             try:
                 buf = self.buffer_queue.get(timeout=0.5)
                 self.frame = self.cam.helpers.make_array(buf, self.cam.camera_configuration()["main"])
 
                 self.first_frame_found = True
-                self.last_capture_time = time.time()
+                self.last_capture_time = clock.now()
 
                 if self.processing_conf is not None:
                     self.process_frame()
@@ -151,13 +152,13 @@ class CameraStream:
                 print("[CAMERA] Buffer capture timed out. Skipping frame")
 
             # Check if no buffer has been added for at least 1 second
-            if time.time() - self.last_capture_time > (1 if self.first_frame_found else 3):
+            if clock.now() - self.last_capture_time > (1 if self.first_frame_found else 3):
                 print("[CAMERA] WARNING: No buffer added for 1 second, camera stream may be frozen - restarting stream")
                 self.buffer_thread = None
                 self.buffer_halt = True
 
         self.cam.stop()
-        self.stop_time = time.time()
+        self.stop_time = clock.now()
     
     def capture_buffer_thread(self, thread_id):
         print(f"[CAMERA] Created buffer thread #{thread_id}")
@@ -185,42 +186,8 @@ class CameraStream:
         if self.processing_conf is None:
             raise Exception(f"[CAMERA] Camera {self.num} has no conf for processing")
 
-        resized = frame[0:429, 0:frame.shape[1]]
-        resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-
-        # Find the black in the image
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # Scale white values based on the inverse of the calibration map
-        gray_scaled = self.processing_conf["calibration_map"] * gray
-
-        # Get the binary image
-        black_line_threshold = self.processing_conf["black_line_threshold"]
-        binary = ((gray_scaled > black_line_threshold) * 255).astype(np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((7,7),np.uint8))
-
-        # Find green in the image
-        hsv = cv2.cvtColor(resized, cv2.COLOR_BGR2HSV)
-        green_turn_hsv_threshold = self.processing_conf["green_turn_hsv_threshold"]
-        green = cv2.bitwise_not(cv2.inRange(hsv, green_turn_hsv_threshold[0], green_turn_hsv_threshold[1]))
-        green = cv2.erode(green, np.ones((5,5),np.uint8), iterations=1)
-
-        # Find the line, by removing the green from the image (since green looks like black when grayscaled)
-        line = cv2.dilate(binary, np.ones((5,5),np.uint8), iterations=2)
-        line = cv2.bitwise_or(line, cv2.bitwise_not(green))
-
         # Only set the processed data once it is all populated, to avoid partial data being read
-        self.processed = {
-            "raw": frame,
-            "resized": resized,
-            "gray": gray,
-            "gray_scaled": gray_scaled,
-            "binary": binary,
-            "hsv": hsv,
-            "green": green,
-            "line": line,
-        }
+        self.processed = ck.processFrame(frame, self.processing_conf)
 
     def stop(self):
         print(f"[CAMERA] Stopping stream for Camera {self.num}")
@@ -230,4 +197,4 @@ class CameraStream:
         self.processing_conf = conf
         
     def get_fps(self):
-        return int(self.frames/(time.time() - self.start_time))
+        return int(self.frames/(clock.now() - self.start_time))
@@ -159,4 +159,388 @@ def getTouchingEdges(points: list[tuple[int, int]], shape: tuple[int, int]) -> l
             edges.append("top")
         if point[1] == shape[0]-1 and "bottom" not in edges:
             edges.append("bottom")
-    return edges
\ No newline at end of file
+    return edges
+
+def scanlineCentres(line_mask: np.ndarray, num_scanlines: int = 12, bounds: tuple[int, int, int, int] = None, start_x: float = None, min_run_width: int = 8) -> dict:
+    """
+    Samples horizontal scanlines of a line mask and finds the centre of the line on each row.
+    Runs of line pixels are found with a vectorised run-length pass over all rows at once,
+    then, from the bottom row upwards, the run closest to the previous row's centre is chosen.
+
+    Args:
+        line_mask (np.ndarray): The line image (line is black, background is white).
+        num_scanlines (int, optional): The number of rows to sample. Default is 12.
+        bounds (tuple[int, int, int, int], optional): Only sample inside this rect (x, y, w, h). Default is the full image.
+        start_x (float, optional): The expected line position on the bottom row. Default is the centre of the bounds.
+        min_run_width (int, optional): Runs narrower than this (px) are treated as noise. Default is 8.
+
+    Returns:
+        dict: None if no line was found, otherwise
+        {
+            points: np.array of (x, y) line centres, bottom to top,
+            exit_side: "left" or "right" if the topmost run touches that side of the image, else None
+        }
+    """
+    x0, y0, w, h = bounds if bounds is not None else (0, 0, line_mask.shape[1], line_mask.shape[0])
+    rows = np.unique(np.linspace(y0 + h - 1, y0, num_scanlines).astype(int))[::-1]
+
+    samples = line_mask[rows, x0:x0+w] == 0
+
+    # Pad each row with background so every run has a start and an end
+    padded = np.zeros((len(rows), w + 2), np.int8)
+    padded[:, 1:-1] = samples
+    transitions = np.diff(padded, axis=1)
+
+    # np.nonzero is row-major, so starts and ends pair up in order
+    run_rows, run_starts = np.nonzero(transitions == 1)
+    run_ends = np.nonzero(transitions == -1)[1]
+
+    valid_runs = (run_ends - run_starts) >= min_run_width
+    run_rows, run_starts, run_ends = run_rows[valid_runs], run_starts[valid_runs], run_ends[valid_runs]
+    if len(run_rows) == 0:
+        return None
+    run_centres = (run_starts + run_ends - 1) / 2 + x0
+
+    reference_x = start_x if start_x is not None else x0 + w / 2
+    points = []
+    top_run = None
+    for i in range(len(rows)):
+        row_runs = np.nonzero(run_rows == i)[0]
+        if len(row_runs) == 0:
+            continue
+        closest = row_runs[np.argmin(np.abs(run_centres[row_runs] - reference_x))]
+        reference_x = run_centres[closest]
+        points.append((reference_x, rows[i]))
+        top_run = closest
+
+    exit_side = None
+    if run_starts[top_run] + x0 == 0:
+        exit_side = "left"
+    elif run_ends[top_run] + x0 == line_mask.shape[1]:
+        exit_side = "right"
+
+    return {
+        "points": np.array(points, dtype=float),
+        "exit_side": exit_side,
+    }
+
+def fitScanlineCentres(points: np.ndarray, origin_x: float) -> dict:
+    """
+    Fits x = c + b*t + a*t^2 to line centres by least squares, where t is the distance up from the middle sampled row.
+    The error and heading are measured at the middle sampled row, matching the centre of a contour's minAreaRect.
+
+    Args:
+        points (np.ndarray): The (x, y) line centres, as returned by scanlineCentres.
+        origin_x (float): The x value that counts as zero error, usually the centre of the image.
+
+    Returns:
+        dict: None if there are not enough points to fit, otherwise
+        {
+            error: float, horizontal offset of the line from origin_x,
+            heading: float, angle of the line from vertical in degrees, positive when leaning right,
+            curvature: float, 1/radius of the line, positive when curving right,
+            heading_change: float, difference in heading between the topmost and bottommost centres in degrees,
+            top: float, y value of the topmost centre
+        }
+    """
+    if points is None or len(points) < 2:
+        return None
+
+    ref_y = (points[:, 1].max() + points[:, 1].min()) / 2
+    t = ref_y - points[:, 1]
+
+    if len(points) >= 3:
+        a, b, c = np.polyfit(t, points[:, 0], 2)
+    else:
+        b, c = np.polyfit(t, points[:, 0], 1)
+        a = 0
+
+    return {
+        "error": c - origin_x,
+        "heading": math.degrees(math.atan(b)),
+        "curvature": 2 * a / (1 + b**2)**1.5,
+        "heading_change": math.degrees(math.atan(b + 2 * a * t.max()) - math.atan(b + 2 * a * t.min())),
+        "top": points[:, 1].min(),
+    }
+
+g_ground_homographies = {} # Cache of image to ground homographies, keyed by camera servo angle
+
+def groundHomography(cam_angle: float, camera_geometry: dict) -> np.ndarray:
+    """
+    Gets the homography that maps image points onto the floor, for a given camera servo angle.
+    Homographies are only calculated once per angle, and then cached.
+
+    If camera_geometry has calibration points for this angle (see calibrate_ground.py), they are used directly.
+    Otherwise, the homography is calculated from a pinhole model of the camera's height, field of view and pitch.
+
+    Args:
+        cam_angle (float): The angle of the camera servo.
+        camera_geometry (dict): The camera_geometry section of config.json.
+
+    Returns:
+        np.ndarray: 3x3 homography from image pixels (x, y) to floor coordinates in mm
+                    (x to the right, y forwards, relative to the camera).
+    """
+    key = int(round(cam_angle))
+    if key in g_ground_homographies:
+        return g_ground_homographies[key]
+
+    calibration = camera_geometry.get("calibration_points", {}).get(str(key))
+    if calibration is not None:
+        homography, _ = cv2.findHomography(np.array(calibration["image"], dtype=np.float32), np.array(calibration["ground"], dtype=np.float32))
+    else:
+        width, height = camera_geometry["image_size"]
+        focal = (width / 2) / math.tan(math.radians(camera_geometry["hfov"]) / 2)
+        pitch = math.radians(camera_geometry["servo_pitch_offset"] - key) # Angle of the camera below horizontal
+        cam_height = camera_geometry["height_mm"]
+
+        K = np.array([
+            [focal, 0, width / 2],
+            [0, focal, height / 2],
+            [0, 0, 1]
+        ])
+        # Maps a floor point (x, y, 1) into camera coordinates (right, down, forwards)
+        floor_to_camera = np.array([
+            [1, 0, 0],
+            [0, -math.sin(pitch), cam_height * math.cos(pitch)],
+            [0, math.cos(pitch), cam_height * math.sin(pitch)]
+        ])
+        homography = np.linalg.inv(K @ floor_to_camera)
+
+    g_ground_homographies[key] = homography / homography[2, 2]
+    return g_ground_homographies[key]
+
+def imageToGround(points: np.ndarray, homography: np.ndarray) -> np.ndarray:
+    """
+    Transforms a handful of image points onto the floor, without warping the whole image.
+
+    Args:
+        points (np.ndarray): Image points as an array of (x, y).
+        homography (np.ndarray): The homography from groundHomography.
+
+    Returns:
+        np.ndarray: Floor points as an array of (x, y) in mm.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(points, homography).reshape(-1, 2)
+
+def processFrame(frame: np.ndarray, processing_conf: dict) -> dict:
+    """
+    Pre-processes a raw camera frame into the images used by the follower.
+
+    Args:
+        frame (np.ndarray): The raw camera frame.
+        processing_conf (dict): The calibration map and thresholds, as passed to CameraStream.
+
+    Returns:
+        dict: The processed images (raw, resized, gray, gray_scaled, binary, hsv, green, line).
+    """
+    resized = frame[0:429, 0:frame.shape[1]]
+    resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+
+    # Find the black in the image
+    gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+    # Scale white values based on the inverse of the calibration map
+    gray_scaled = processing_conf["calibration_map"] * gray
+
+    # Get the binary image
+    black_line_threshold = processing_conf["black_line_threshold"]
+    binary = ((gray_scaled > black_line_threshold) * 255).astype(np.uint8)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((7,7),np.uint8))
+
+    # Find green in the image
+    hsv = cv2.cvtColor(resized, cv2.COLOR_BGR2HSV)
+    green_turn_hsv_threshold = processing_conf["green_turn_hsv_threshold"]
+    green = cv2.bitwise_not(cv2.inRange(hsv, green_turn_hsv_threshold[0], green_turn_hsv_threshold[1]))
+    green = cv2.erode(green, np.ones((5,5),np.uint8), iterations=1)
+
+    # Find the line, by removing the green from the image (since green looks like black when grayscaled)
+    line = cv2.dilate(binary, np.ones((5,5),np.uint8), iterations=2)
+    line = cv2.bitwise_or(line, cv2.bitwise_not(green))
+
+    return {
+        "raw": frame,
+        "resized": resized,
+        "gray": gray,
+        "gray_scaled": gray_scaled,
+        "binary": binary,
+        "hsv": hsv,
+        "green": green,
+        "line": line,
+    }
+
+def findHorizontalBand(mask: np.ndarray, scale: int = 1, min_row_coverage: float = 0.2, grow_coverage: float = None) -> dict:
+    """
+    Finds the strongest horizontal band of a mask using its row-wise projection profile.
+    This is much cheaper than finding contours, so the mask is expected to already be at a reduced resolution.
+
+    Args:
+        mask (np.ndarray): The (downscaled) mask, where non-zero pixels are part of the band.
+        scale (int, optional): How much the mask was downscaled by, so results are in full resolution units. Default is 1.
+        min_row_coverage (float, optional): The fraction of the peak row that must be covered for there to be a band. Default is 0.2.
+        grow_coverage (float, optional): The fraction of a row next to the band that must be covered for it to be added to the band.
+            A tilted band only partly covers its top and bottom rows, so this should be lower than min_row_coverage. Default is min_row_coverage.
+
+    Returns:
+        dict: None if no row reaches min_row_coverage, otherwise
+        {
+            top: int, first row of the band,
+            bottom: int, last row of the band,
+            coverage: float, mean fraction of each band row that is covered (0-1),
+            span: float, fraction of columns with any pixel inside the band (0-1),
+            pixels: int, approximate number of mask pixels inside the band,
+            touches_top: bool,
+            touches_bottom: bool,
+            profile: np.array of the coverage of each (downscaled) row
+        }
+    """
+    profile = np.count_nonzero(mask, axis=1) / mask.shape[1]
+
+    peak = int(np.argmax(profile))
+    if profile[peak] < min_row_coverage:
+        return None
+
+    # Grow the band out from the peak row, while rows stay above the coverage threshold
+    if grow_coverage is None:
+        grow_coverage = min_row_coverage
+    rows_above = np.nonzero(profile[:peak] < grow_coverage)[0]
+    rows_below = np.nonzero(profile[peak:] < grow_coverage)[0]
+    top = rows_above[-1] + 1 if len(rows_above) > 0 else 0
+    bottom = peak + rows_below[0] - 1 if len(rows_below) > 0 else len(profile) - 1
+
+    band = mask[top:bottom+1]
+    return {
+        "top": int(top * scale),
+        "bottom": int((bottom + 1) * scale - 1),
+        "coverage": float(profile[top:bottom+1].mean()),
+        "span": np.count_nonzero(band.any(axis=0)) / mask.shape[1],
+        "pixels": int(np.count_nonzero(band) * scale * scale),
+        "touches_top": top == 0,
+        "touches_bottom": bottom == len(profile) - 1,
+        "profile": profile,
+    }
+
+def findRedStopContour(hsv: np.ndarray, red_hsv_threshold: list[np.ndarray]) -> tuple[bool, np.ndarray]:
+    """
+    Checks for a red stop line by finding the largest red contour, and checking that it only touches the left and right of the image.
+
+    Args:
+        hsv (np.ndarray): The HSV image.
+        red_hsv_threshold (list[np.ndarray]): The lower and upper HSV bounds for red.
+
+    Returns:
+        bool: True if a red stop line was found.
+        np.ndarray: The red mask.
+    """
+    red = cv2.inRange(hsv, red_hsv_threshold[0], red_hsv_threshold[1])
+    red = cv2.dilate(red, np.ones((5,5),np.uint8), iterations=2)
+
+    red_contours = [[contour, cv2.contourArea(contour)] for contour in cv2.findContours(red, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]]
+    red_contours = sorted(red_contours, key=lambda contour: contour[1], reverse=True)
+    red_contours_filtered = [contour[0] for contour in red_contours if contour[1] > 20000]
+
+    if len(red_contours_filtered) == 0:
+        return False, red
+
+    edges = sorted(getTouchingEdges(simplifiedContourPoints(red_contours_filtered[0]), red.shape))
+    return edges == ["left", "right"], red
+
+def findRedStopBand(hsv: np.ndarray, red_hsv_threshold: list[np.ndarray], scale: int = 4) -> tuple[bool, dict]:
+    """
+    Checks for a red stop line with a projection profile of a reduced resolution red mask.
+    The line must span the image from left to right, without touching the top or bottom.
+    Any row with a little red is grown into the band, so a tilted line still spans the image.
+
+    Args:
+        hsv (np.ndarray): The HSV image.
+        red_hsv_threshold (list[np.ndarray]): The lower and upper HSV bounds for red.
+        scale (int, optional): How much to downscale the image by. Default is 4.
+
+    Returns:
+        bool: True if a red stop line was found.
+        dict: The band, as returned by findHorizontalBand (None if no band).
+    """
+    small = cv2.resize(hsv, (hsv.shape[1] // scale, hsv.shape[0] // scale), interpolation=cv2.INTER_NEAREST)
+    red = cv2.inRange(small, red_hsv_threshold[0], red_hsv_threshold[1])
+    band = findHorizontalBand(red, scale, 0.2, grow_coverage=0.02)
+
+    is_stop = (
+        band is not None
+        and band["pixels"] > 20000
+        and band["span"] >= 0.95
+        and not band["touches_top"]
+        and not band["touches_bottom"]
+    )
+    return is_stop, band
+
+def findEvacEntranceBand(line: np.ndarray, scale: int = 4) -> tuple[bool, dict]:
+    """
+    Checks for the black strip at the evacuation zone entrance with a projection profile of a reduced resolution line mask.
+    The strip must span the image from left to right, with white above it and the line continuing to the bottom of the image.
+    A tilted strip covers less of each row, so the band starts from a half covered row and grows through the partly covered rows
+    either side of it, which are still well above the coverage of the line.
+
+    Args:
+        line (np.ndarray): The line image (line is black, background is white).
+        scale (int, optional): How much to downscale the image by. Default is 4.
+
+    Returns:
+        bool: True if the evacuation zone entrance was found.
+        dict: The band, as returned by findHorizontalBand (None if no band).
+    """
+    black = line[::scale, ::scale] == 0
+    band = findHorizontalBand(black, scale, 0.5, grow_coverage=0.3)
+
+    if band is None or band["span"] < 0.95 or band["touches_top"]:
+        return False, band
+
+    # Above a 4-way intersection the line carries on through most rows, but nothing carries on above the entrance
+    above = band["profile"][:band["top"] // scale]
+    is_entrance = above.max() < 0.5 and np.mean(above > 0.05) < 0.5 and band["profile"][-1] > 0
+    return is_entrance, band
+
+g_green_turn_kernel = np.ones((3,3), np.uint8)
+
+def greenTurnLineMask(line: np.ndarray, white_contour: Contour, thickness: int = 100, use_roi: bool = True) -> tuple[np.ndarray, tuple[int, int, int, int]]:
+    """
+    Builds the line mask used to follow a green turn: the line, restricted to the area around the white contour containing the green marker.
+
+    With use_roi, all of the work is done inside the bounding rect of the white contour,
+    padded by half the drawing thickness and the erosion reach, so the output is identical while touching far fewer pixels.
+
+    Args:
+        line (np.ndarray): The line image (line is black, background is white).
+        white_contour (Contour): The white contour containing the followed green marker.
+        thickness (int, optional): The thickness to draw the white contour with, which decides how much line is kept. Default is 100.
+        use_roi (bool, optional): Only process the area around the white contour. Default is True.
+
+    Returns:
+        np.ndarray: The new line image (line is white, background is black).
+        tuple[int, int, int, int]: The rect (x, y, w, h) outside of which the new line image is empty.
+    """
+    if use_roi:
+        # The drawn contour reaches thickness/2 past the contour, and eroding twice reads 2 more pixels
+        pad = thickness // 2 + 4
+        x, y, w, h = cv2.boundingRect(white_contour)
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(line.shape[1], x + w + pad), min(line.shape[0], y + h + pad)
+    else:
+        x0, y0, x1, y1 = 0, 0, line.shape[1], line.shape[0]
+
+    # Dilate the white contour to make it larger, and then use it as a mask
+    white_mask = np.zeros((y1 - y0, x1 - x0), np.uint8)
+    cv2.drawContours(white_mask, [white_contour], -1, 255, thickness, offset=(-x0, -y0))
+
+    # Mask the line image with the dilated white contour
+    roi_line = cv2.bitwise_and(cv2.bitwise_not(line[y0:y1, x0:x1]), white_mask)
+    # Erode the line image to remove slight inconsistencies we don't want
+    roi_line = cv2.erode(roi_line, g_green_turn_kernel, iterations=2)
+
+    if not use_roi:
+        return roi_line, (x0, y0, x1 - x0, y1 - y0)
+
+    new_line = np.zeros(line.shape[:2], np.uint8)
+    new_line[y0:y1, x0:x1] = roi_line
+    return new_line, (x0, y0, x1 - x0, y1 - y0)
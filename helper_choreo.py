@@ -0,0 +1,281 @@
+import heapq
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import helper_clock as clock
+
+class Sequence:
+    """
+    A timed keyframe program of servo and motor actions.
+
+    Actions are added at the current time cursor, and wait() moves the cursor on, e.g.
+        Sequence("lift").servo("cam", -80).wait(0.5).servo("lift", -80).wait(0.8)
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name (str): The name used when reporting durations.
+        """
+        self.name = name
+        self.cursor = 0
+        self.keyframes: List[Tuple[float, str, str, tuple]] = []     # (time, description, action, args)
+        self.uses_motors = False
+
+    def wait(self, seconds: float) -> "Sequence":
+        """
+        Moves the time cursor on.
+
+        Args:
+            seconds (float): How long to wait before the next action.
+        """
+        self.cursor += seconds
+        return self
+
+    def servo(self, name: str, angle: float) -> "Sequence":
+        """
+        Sets a servo angle.
+
+        Args:
+            name (str): The name of the servo, as given to the Choreographer.
+            angle (float): The angle to set.
+        """
+        self.keyframes.append((self.cursor, f"servo {name} {angle}", "servo", (name, angle)))
+        return self
+
+    def motors(self, left_speed: float, right_speed: float) -> "Sequence":
+        """
+        Runs a tank drive until the next motor action.
+
+        Args:
+            left_speed (float): The speed to run the left motors at (-100 to 100).
+            right_speed (float): The speed to run the right motors at (-100 to 100).
+        """
+        self.uses_motors = True
+        self.keyframes.append((self.cursor, f"motors {left_speed} {right_speed}", "motors", (left_speed, right_speed)))
+        return self
+
+    def stop(self, brake: bool = True) -> "Sequence":
+        """
+        Stops all motors.
+
+        Args:
+            brake (bool, optional): Whether to brake the motors (True) or just coast (False). Defaults to True.
+        """
+        self.keyframes.append((self.cursor, "stop", "stop", (brake,)))
+        return self
+
+    def call(self, function: Callable, *args) -> "Sequence":
+        """
+        Calls a function, e.g. to record that something has happened.
+
+        Args:
+            function (Callable): The function to call.
+            *args: The arguments to call it with.
+        """
+        self.keyframes.append((self.cursor, getattr(function, "__name__", "call"), "call", (function, *args)))
+        return self
+
+    def duration(self) -> float:
+        """
+        Returns:
+            float: The planned length of the sequence (s), including any trailing wait.
+        """
+        return self.cursor
+
+class SequenceHandle:
+    """
+    A running sequence. future resolves with the actual duration (s) once the last keyframe has run.
+    """
+
+    def __init__(self, sequence: Sequence, start_time: float) -> None:
+        self.sequence = sequence
+        self.start_time = start_time
+        self.future = Future()
+        self.future.set_running_or_notify_cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        Blocks until the sequence has finished.
+
+        Args:
+            timeout (float, optional): The longest time to wait (s). Defaults to None (forever).
+
+        Returns:
+            Optional[float]: The duration of the sequence, or None if it was cancelled.
+        """
+        try:
+            return self.future.result(timeout)
+        except Exception:
+            return None
+
+class Choreographer:
+    """
+    Runs servo and motor sequences on a background timer thread, so the main loop can keep reading frames while they play.
+    """
+
+    def __init__(self, servos: Dict[str, object], motors) -> None:
+        """
+        Initialise and start the timer thread.
+
+        Args:
+            servos (dict): The servos by name, each with an angle property (e.g. gpiozero.AngularServo).
+            motors: The motor module (helper_motorkit), used for run_tank and stop_all.
+        """
+        self.servos = servos
+        self.motors = motors
+
+        self.queue = []                     # Heap of (due time, order, handle, keyframe index)
+        self.order = 0
+        self.active: List[SequenceHandle] = []
+        self.condition = threading.Condition()
+        # Held while an action runs, so a cancelled sequence can't run another action after its stop.
+        # Always taken before condition, and re-entrant so a "call" action can run() or cancel() a sequence
+        self.action_lock = threading.RLock()
+        self.running = True
+
+        self.stats: Dict[str, dict] = {}    # Per sequence name: runs, cancelled, planned and actual durations
+
+        self.thread = threading.Thread(target=self.update, args=(), daemon=True)
+        self.thread.start()
+
+    def run(self, sequence: Sequence, preempt: bool = True) -> SequenceHandle:
+        """
+        Starts playing a sequence.
+
+        Args:
+            sequence (Sequence): The sequence to play.
+            preempt (bool, optional): Cancel any running sequences first, so they don't fight over the servos and motors. Defaults to True.
+
+        Returns:
+            SequenceHandle: The running sequence.
+        """
+        with self.action_lock, self.condition:
+            if preempt:
+                self._cancel_all()
+
+            handle = SequenceHandle(sequence, clock.now())
+            self.active.append(handle)
+            for index, keyframe in enumerate(sequence.keyframes):
+                heapq.heappush(self.queue, (handle.start_time + keyframe[0], self.order, handle, index))
+                self.order += 1
+            # A marker for the end of the sequence, so trailing waits are kept
+            heapq.heappush(self.queue, (handle.start_time + sequence.duration(), self.order, handle, None))
+            self.order += 1
+
+            clock.notify(self.condition)
+        return handle
+
+    def play(self, sequence: Sequence) -> Optional[float]:
+        """
+        Plays a sequence and waits for it to finish, for when nothing else can happen until it's done.
+
+        Returns:
+            Optional[float]: The duration of the sequence, or None if it was cancelled.
+        """
+        return self.run(sequence).wait()
+
+    def cancel(self, handle: SequenceHandle) -> None:
+        """
+        Stops a sequence before its remaining keyframes run. The motors are stopped if it used them.
+
+        Args:
+            handle (SequenceHandle): The sequence to cancel.
+        """
+        with self.action_lock, self.condition:
+            self._cancel(handle)
+
+    def busy(self) -> bool:
+        """
+        Returns:
+            bool: Whether any sequence is still playing.
+        """
+        return len(self.active) > 0
+
+    def stop(self) -> None:
+        """
+        Cancels everything and stops the timer thread.
+        """
+        with self.action_lock, self.condition:
+            self._cancel_all()
+            self.running = False
+            clock.notify(self.condition)
+
+    def _cancel_all(self) -> None:
+        for handle in list(self.active):
+            self._cancel(handle)
+
+    def _cancel(self, handle: SequenceHandle) -> None:
+        """
+        Cancels a sequence. action_lock and condition must be held, in that order.
+        """
+        if handle not in self.active:
+            return
+        self.active.remove(handle)
+        self.queue = [item for item in self.queue if item[2] is not handle]
+        heapq.heapify(self.queue)
+
+        if handle.sequence.uses_motors:
+            self.motors.stop_all()
+        self._record(handle, cancelled=True)
+        handle.future.set_exception(InterruptedError(f"Sequence {handle.sequence.name} was cancelled"))
+
+    def update(self) -> None:
+        while True:
+            with self.condition:
+                while self.running and (len(self.queue) == 0 or self.queue[0][0] > clock.now()):
+                    clock.wait(self.condition, self.queue[0][0] - clock.now() if len(self.queue) > 0 else None)
+                if not self.running:
+                    return
+                _, _, handle, index = heapq.heappop(self.queue)
+
+                if index is None:
+                    self.active.remove(handle)
+                    duration = self._record(handle)
+                    handle.future.set_result(duration)
+                    continue
+
+                _, description, action, args = handle.sequence.keyframes[index]
+
+            # Run the action outside the condition, so slow I2C writes don't hold up the queue.
+            # The sequence may have been cancelled since it was popped, and its stop already written, so check under the action lock
+            with self.action_lock:
+                if handle not in self.active:
+                    continue
+                try:
+                    if action == "servo":
+                        self.servos[args[0]].angle = args[1]
+                    elif action == "motors":
+                        self.motors.run_tank(*args)
+                    elif action == "stop":
+                        self.motors.stop_all(*args)
+                    elif action == "call":
+                        args[0](*args[1:])
+                except Exception as e:
+                    print(f"[CHOREO] Error in {handle.sequence.name} ({description}): {e}")
+
+    def _record(self, handle: SequenceHandle, cancelled: bool = False) -> float:
+        duration = clock.now() - handle.start_time
+        stats = self.stats.setdefault(handle.sequence.name, {"runs": 0, "cancelled": 0, "planned": handle.sequence.duration(), "total": 0, "max": 0})
+        if cancelled:
+            stats["cancelled"] += 1
+        else:
+            stats["runs"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+        return duration
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The planned and actual duration of each sequence, so they can be trimmed.
+        """
+        lines = []
+        for name, stats in self.stats.items():
+            mean = stats["total"] / stats["runs"] if stats["runs"] > 0 else 0
+            lines.append(f"{name}: {stats['runs']} runs ({stats['cancelled']} cancelled) | Planned: {stats['planned']:.2f}s | Actual: {mean:.2f}s (max {stats['max']:.2f}s)")
+        return "\n".join(lines)
@@ -0,0 +1,254 @@
+import math
+import os
+import time
+import threading
+
+class RealClock:
+    """
+    The wall clock, used on the robot.
+    """
+
+    def now(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, condition: threading.Condition, seconds: float = None) -> bool:
+        return condition.wait(seconds)
+
+    def notify(self, condition: threading.Condition) -> None:
+        condition.notify_all()
+
+class VirtualClock:
+    """
+    A clock that only moves when every thread using it is asleep, so replays and simulations run as fast as the code can go.
+
+    A sleeping thread waits until virtual time reaches the end of its sleep. Once all the threads that sleep on the clock are asleep,
+    the clock jumps straight to the earliest wake-up, so a 3 minute run takes however long the processing takes.
+    A thread blocked on something else (a queue, a join) for longer than stall_timeout (real seconds) is treated as asleep,
+    so it can't stop the clock, e.g. while the program is shutting down.
+    A thread waiting on a threading.Condition through wait() counts as asleep until its timeout, so the clock can move on to it.
+    """
+
+    def __init__(self, start: float = None, stall_timeout: float = 0.05) -> None:
+        """
+        Args:
+            start (float, optional): The time to start at (s since the epoch). Defaults to the current wall clock time, so timestamps still look sensible.
+            stall_timeout (float, optional): How long a thread can run without sleeping before the clock moves on without it (real s). Defaults to 0.05.
+        """
+        self.start = time.time() if start is None else start
+        self.elapsed = 0        # Virtual seconds since start. Kept apart from start, so small intervals aren't lost to rounding
+        self.stall_timeout = stall_timeout
+        self.poll_interval = min(stall_timeout, 0.005)     # How often a thread in wait() checks the clock (real s)
+
+        self.condition = threading.Condition()
+        self.wake_times = {}    # Sleeping thread -> elapsed time to wake at
+        self.waiting_on = {}    # Thread in wait() -> the condition it is waiting on
+        self.awake_since = {}   # Thread that has slept on this clock -> real time it last woke up
+
+        self.stats = {
+            "sleeps": 0,
+            "slept": 0,         # Virtual seconds skipped by sleeping
+            "stalls": 0,        # Times the clock moved on without a thread that was still running
+        }
+
+    def now(self) -> float:
+        return self.start + self.elapsed
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def _advance(self) -> None:
+        """
+        Moves the clock to the earliest wake-up if no other thread is still running. Must be called with the condition held.
+        """
+        if len(self.wake_times) == 0:
+            return
+
+        real_now = time.monotonic()
+        stalled = False
+        for thread, awake_since in list(self.awake_since.items()):
+            if not thread.is_alive():
+                del self.awake_since[thread]
+            elif thread not in self.wake_times:
+                if real_now - awake_since < self.stall_timeout:
+                    return
+                stalled = True
+
+        wake_time = min(self.wake_times.values())
+        if wake_time > self.elapsed and wake_time != math.inf:
+            self.stats["stalls"] += stalled
+            self.elapsed = wake_time
+            self.condition.notify_all()
+
+    def sleep(self, seconds: float) -> None:
+        thread = threading.current_thread()
+        with self.condition:
+            wake_time = self.elapsed + max(0, seconds)
+            self.stats["sleeps"] += 1
+            self.stats["slept"] += wake_time - self.elapsed
+            self.wake_times[thread] = wake_time
+
+            # A signal handler can raise out of the wait (e.g. sys.exit), and must not leave the clock waiting for this thread
+            try:
+                self._advance()
+                while self.elapsed < wake_time:
+                    self.condition.wait(self.stall_timeout)
+                    self._advance()
+            finally:
+                self.wake_times.pop(thread, None)
+                self.awake_since[thread] = time.monotonic()
+
+    def wait(self, condition: threading.Condition, seconds: float = None) -> bool:
+        """
+        Waits on a condition until it is notified, or until the clock reaches the timeout. The condition must be held.
+        The clock can't notify another thread's condition, so this checks it every poll_interval.
+        The condition must be notified with notify(), so the clock knows the thread is awake before it gets the chance to run.
+        """
+        thread = threading.current_thread()
+        with self.condition:
+            wake_time = math.inf if seconds is None else self.elapsed + max(0, seconds)
+            self.wake_times[thread] = wake_time
+            self.waiting_on[thread] = condition
+
+        try:
+            while True:
+                if condition.wait(self.poll_interval):
+                    return True
+                with self.condition:
+                    self._advance()
+                    if self.elapsed >= wake_time:
+                        return False
+        finally:
+            with self.condition:
+                self.wake_times.pop(thread, None)
+                self.waiting_on.pop(thread, None)
+                self.awake_since[thread] = time.monotonic()
+
+    def notify(self, condition: threading.Condition) -> None:
+        """
+        Notifies every thread waiting on a condition, and counts them as awake straight away. The condition must be held.
+        """
+        with self.condition:
+            for thread, waiting_on in list(self.waiting_on.items()):
+                if waiting_on is condition:
+                    self.wake_times.pop(thread, None)
+                    self.awake_since[thread] = time.monotonic()
+        condition.notify_all()
+
+    def advance(self, seconds: float) -> None:
+        """
+        Moves the clock forward without sleeping, e.g. for the time a replayed frame took on the robot.
+        """
+        with self.condition:
+            self.elapsed += max(0, seconds)
+            self.condition.notify_all()
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The virtual time elapsed, and how much of it was skipped by sleeping.
+        """
+        return f"Virtual time: {self.elapsed:.1f}s | Skipped: {self.stats['slept']:.1f}s in {self.stats['sleeps']} sleeps | Stalls: {self.stats['stalls']}"
+
+class Timer(threading.Thread):
+    """
+    Calls a function after an interval of clock time, like threading.Timer, but following a VirtualClock.
+    """
+
+    def __init__(self, interval: float, function, args: tuple = ()) -> None:
+        """
+        Args:
+            interval (float): How long to wait before calling the function (s).
+            function (Callable): The function to call.
+            args (tuple, optional): The arguments to call it with. Defaults to ().
+        """
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.condition = threading.Condition()
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Stops the timer if it hasn't called the function yet.
+        """
+        with self.condition:
+            self.cancelled = True
+            notify(self.condition)
+
+    def run(self) -> None:
+        end_time = monotonic() + self.interval
+        with self.condition:
+            while not self.cancelled and monotonic() < end_time:
+                wait(self.condition, end_time - monotonic())
+            if self.cancelled:
+                return
+        self.function(*self.args)
+
+# Which clock the mission code runs on: "real", or "virtual" for faster than real time replays and simulations
+CLOCK = os.environ.get("CATBOT_CLOCK", "real")
+if CLOCK not in ("real", "virtual"):
+    raise ValueError(f"CATBOT_CLOCK must be 'real' or 'virtual', not '{CLOCK}'")
+
+current = VirtualClock() if CLOCK == "virtual" else RealClock()
+
+def use(new_clock) -> None:
+    """
+    Switches every module using helper_clock to another clock, e.g. a fresh VirtualClock for each replay.
+
+    Args:
+        new_clock (RealClock | VirtualClock): The clock to use.
+    """
+    global current
+    current = new_clock
+
+def now() -> float:
+    """
+    Returns:
+        float: The current time (s since the epoch), like time.time().
+    """
+    return current.now()
+
+def monotonic() -> float:
+    """
+    Returns:
+        float: A time that never goes backwards (s), like time.monotonic(), for measuring intervals.
+    """
+    return current.monotonic()
+
+def sleep(seconds: float) -> None:
+    """
+    Sleeps, like time.sleep(), but instantly on a VirtualClock.
+
+    Args:
+        seconds (float): How long to sleep (s).
+    """
+    current.sleep(seconds)
+
+def wait(condition: threading.Condition, seconds: float = None) -> bool:
+    """
+    Waits on a threading.Condition like condition.wait(), but with the timeout in clock time, so it follows a VirtualClock.
+
+    Args:
+        condition (threading.Condition): The condition to wait on, which must be held.
+        seconds (float, optional): The longest time to wait (s). Defaults to None (until notified).
+
+    Returns:
+        bool: True if the condition was notified, False if it timed out.
+    """
+    return current.wait(condition, seconds)
+
+def notify(condition: threading.Condition) -> None:
+    """
+    Notifies every thread waiting on a threading.Condition with wait(), like condition.notify_all().
+
+    Args:
+        condition (threading.Condition): The condition to notify, which must be held.
+    """
+    current.notify(condition)
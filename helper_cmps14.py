@@ -1,6 +1,10 @@
-import smbus2
-import time
-from typing import Union
+import struct
+import threading
+import numpy as np
+from typing import Optional, Union
+import helper_clock as clock
+import helper_devices as devices
+from helper_i2c import arbiter
 
 class CMPS14:
     """
@@ -15,14 +19,30 @@ class CMPS14:
             i2c_bus (int, optional): I2C bus number. Defaults to 1.
             i2c_address (int, optional): I2C address of CMPS14 module. Defaults to 0x61.
         """
-        self.bus = smbus2.SMBus(i2c_bus)
+        self.bus = devices.smbus(i2c_bus)
         self.address = i2c_address
 
-        self.last_values = {
+        # Snapshots younger than this are reused by the per-field methods, so reading several fields in a frame is one transaction.
+        # The CMPS14 updates its outputs at 100Hz, so a newer read would return the same values anyway
+        self.snapshot_max_age = 0.01
+
+        # Replaced as a whole, so every field always comes from the same read
+        self.snapshot = {
+            "time": 0,
             "bearing_8bit": 0,
             "bearing_16bit": 0,
             "pitch": 0,
             "roll": 0,
+            "accel": None,
+            "gyro": None,
+        }
+
+        self.sampler = None     # Set by CMPS14Sampler while it is running, so the per-field methods don't touch the bus
+
+        self.stats = {
+            "snapshots": 0,
+            "reused": 0,
+            "errors": 0,
         }
 
     def read_byte(self, register: int) -> int:
@@ -35,7 +55,7 @@ class CMPS14:
         Returns:
             int: Byte value read from the register.
         """
-        return self.bus.read_byte_data(self.address, register)
+        return arbiter.run("cmps14", lambda: self.bus.read_byte_data(self.address, register), key=f"byte {register}")
 
     def read_word(self, register: int) -> int:
         """
@@ -47,10 +67,22 @@ class CMPS14:
         Returns:
             int: Two byte value read from the register.
         """
-        high = self.bus.read_byte_data(self.address, register)
-        low = self.bus.read_byte_data(self.address, register + 1)
+        high, low = self.read_block(register, 2)
         return (high << 8) + low
 
+    def read_block(self, register: int, length: int) -> list[int]:
+        """
+        Read consecutive registers in one transaction, starting from a specific register.
+
+        Args:
+            register (int): Register address of the first byte.
+            length (int): Number of bytes to read (up to 32).
+
+        Returns:
+            list[int]: Byte values read from the registers.
+        """
+        return arbiter.run("cmps14", lambda: self.bus.read_i2c_block_data(self.address, register, length), key=f"block {register} {length}")
+
     def write_byte(self, register: int, value: int) -> None:
         """
         Write a single byte to a specific register.
@@ -59,7 +91,7 @@ class CMPS14:
             register (int): Register address.
             value (int): Byte value to write.
         """
-        self.bus.write_byte_data(self.address, register, value)
+        arbiter.run("cmps14", lambda: self.bus.write_byte_data(self.address, register, value))
 
     def send_command(self, *commands: int) -> None:
         """
@@ -71,7 +103,60 @@ class CMPS14:
         """
         for cmd in commands:
             self.write_byte(0x00, cmd)
-            time.sleep(0.02)  # 20ms delay between each command
+            clock.sleep(0.02)  # 20ms delay between each command
+
+    def read_snapshot(self, motion: bool = False) -> dict:
+        """
+        Reads the bearing, pitch and roll (registers 0x01-0x05) in one transaction, so the high and low bytes
+        of the 16-bit bearing and the other fields always come from the same sample.
+
+        Args:
+            motion (bool, optional): Also read the raw accelerometer and gyro (registers up to 0x17). Defaults to False.
+
+        Returns:
+            dict: {
+                time: When the snapshot was read (clock.now()),
+                bearing_8bit: Compass bearing as a 0-255 value,
+                bearing_16bit: Compass bearing, scaled to 0-359.9 degrees,
+                pitch: Pitch angle, as the unsigned register value (0-255, above 127 is pitched down),
+                roll: Roll angle, as the unsigned register value (0-255),
+                accel: Raw accelerometer (x, y, z), or None if motion is False,
+                gyro: Raw gyro (x, y, z), or None if motion is False
+            }
+            The last snapshot is returned if the read fails (the I2C arbiter reports errors).
+        """
+        try:
+            data = bytes(self.read_block(0x01, 0x17 if motion else 0x05))
+        except OSError:
+            self.stats["errors"] += 1
+            return self.snapshot
+
+        bearing_8bit, bearing_16bit, pitch, roll = struct.unpack(">BHBB", data[:5])
+        snapshot = {
+            "time": clock.now(),
+            "bearing_8bit": bearing_8bit,
+            "bearing_16bit": bearing_16bit / 10.0, # Scale to 0-359.9°
+            "pitch": pitch,
+            "roll": roll,
+            "accel": struct.unpack(">3h", data[11:17]) if motion else None,
+            "gyro": struct.unpack(">3h", data[17:23]) if motion else None,
+        }
+        self.stats["snapshots"] += 1
+        self.snapshot = snapshot
+        return snapshot
+
+    def latest_snapshot(self) -> dict:
+        """
+        Returns the last snapshot if it is younger than snapshot_max_age (or a CMPS14Sampler is keeping it up to date), otherwise reads a new one.
+
+        Returns:
+            dict: The snapshot, as from read_snapshot.
+        """
+        snapshot = self.snapshot
+        if self.sampler is not None or clock.now() - snapshot["time"] < self.snapshot_max_age:
+            self.stats["reused"] += 1
+            return snapshot
+        return self.read_snapshot()
 
     def read_bearing_8bit(self) -> int:
         """
@@ -80,12 +165,7 @@ class CMPS14:
         Returns:
             int: Compass bearing in 8-bit.
         """
-        try:
-            self.last_values["bearing_8bit"] = self.read_byte(0x01)
-        except OSError:
-            print("[WARN] OSError while reading bearing_8bit. Returning last value.")
-            pass
-        return self.last_values["bearing_8bit"]
+        return self.latest_snapshot()["bearing_8bit"]
 
     def read_bearing_16bit(self) -> float:
         """
@@ -95,13 +175,7 @@ class CMPS14:
         Returns:
             float: Compass bearing in 16-bit, scaled to 0-359.9 degrees.
         """
-        try:
-            value = self.read_word(0x02)
-            self.last_values["bearing_16bit"] = value / 10.0 # Scale to 0-359.9°
-        except OSError:
-            print("[WARN] OSError while reading bearing_16bit. Returning last value.")
-            pass
-        return self.last_values["bearing_16bit"] 
+        return self.latest_snapshot()["bearing_16bit"]
 
     def read_pitch(self) -> int:
         """
@@ -110,12 +184,7 @@ class CMPS14:
         Returns:
             int: Pitch angle. (+/- 90°)
         """
-        try:
-            self.last_values["pitch"] = self.read_byte(0x04)
-        except OSError:
-            print("[WARN] OSError while reading pitch. Returning last value.")
-            pass
-        return self.last_values["pitch"]
+        return self.latest_snapshot()["pitch"]
 
     def read_roll(self) -> int:
         """
@@ -124,10 +193,181 @@ class CMPS14:
         Returns:
             int: Roll angle. (+/- 90°)
         """
-        try:
-            self.last_values["roll"] = self.read_byte(0x05)
-        except OSError:
-            print("[WARN] OSError while reading roll. Returning last value.")
-            pass
-        return self.last_values["roll"]
-    
\ No newline at end of file
+        return self.latest_snapshot()["roll"]
+
+class CMPS14Sampler:
+    """
+    Reads CMPS14 snapshots at a fixed rate in a background thread, into a preallocated ring buffer of
+    (timestamp, bearing, pitch, roll), and keeps an unwrapped heading and a low pass filtered yaw rate.
+
+    While it is running, the CMPS14's read_bearing_16bit(), read_pitch() etc. return the latest sample without touching the bus.
+    """
+
+    def __init__(self, cmps: CMPS14, rate: float = 50, size: int = 256, yaw_rate_tau: float = 0.1) -> None:
+        """
+        Initialise the sampler.
+
+        Args:
+            cmps (CMPS14): The compass to read.
+            rate (float, optional): The sample rate (Hz). The CMPS14 updates at 100Hz. Defaults to 50.
+            size (int, optional): The number of samples kept in the ring buffer. Defaults to 256.
+            yaw_rate_tau (float, optional): Time constant of the yaw rate low pass filter (s). Defaults to 0.1.
+        """
+        self.cmps = cmps
+        self.period = 1 / rate
+        self.size = size
+        self.yaw_rate_tau = yaw_rate_tau
+
+        self.buffer = np.zeros((size, 4))   # (timestamp, bearing, pitch, roll) per sample
+        self.headings = np.zeros(size)      # Unwrapped heading per sample, which keeps counting past 360
+        self.count = 0                      # Total samples written, the next sample goes in count % size
+        self.yaw_rate = 0.0                 # Filtered yaw rate (degrees/s), positive is clockwise
+        self.lock = threading.Lock()
+
+        self.thread = None
+        self.running = False
+
+        self.stats = {
+            "samples": 0,
+            "errors": 0,
+            "overruns": 0,
+            "start_time": 0,
+        }
+
+    def start(self) -> None:
+        """
+        Starts the sampler thread. Does nothing if it is already running.
+        """
+        if self.running:
+            return
+        self.running = True
+        self.stats["start_time"] = clock.now()
+        self.thread = threading.Thread(target=self.update, args=(), daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the sampler thread, so the CMPS14 is read directly again.
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join(1)
+        self.cmps.sampler = None
+
+    def update(self) -> None:
+        next_sample_time = clock.now()
+
+        while self.running:
+            clock.sleep(max(0, next_sample_time - clock.now()))
+            next_sample_time += self.period
+            # Skip the missed samples rather than bursting to catch up
+            if next_sample_time < clock.now():
+                self.stats["overruns"] += 1
+                next_sample_time = clock.now() + self.period
+
+            last_time = self.cmps.snapshot["time"]
+            snapshot = self.cmps.read_snapshot()
+            if snapshot["time"] == last_time:
+                self.stats["errors"] += 1
+                continue
+
+            self._add(snapshot)
+            # Only hand the per-field methods over once there is a sample for them to return
+            self.cmps.sampler = self
+
+    def _add(self, snapshot: dict) -> None:
+        with self.lock:
+            index = self.count % self.size
+            if self.count > 0:
+                last = (self.count - 1) % self.size
+                diff = (snapshot["bearing_16bit"] - self.buffer[last, 1] + 180) % 360 - 180
+                self.headings[index] = self.headings[last] + diff
+
+                dt = snapshot["time"] - self.buffer[last, 0]
+                if dt > 0:
+                    alpha = dt / (self.yaw_rate_tau + dt)
+                    self.yaw_rate += alpha * (diff / dt - self.yaw_rate)
+            else:
+                self.headings[index] = snapshot["bearing_16bit"]
+
+            self.buffer[index] = (snapshot["time"], snapshot["bearing_16bit"], snapshot["pitch"], snapshot["roll"])
+            self.count += 1
+            self.stats["samples"] += 1
+
+    def samples(self, n: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Copies the most recent samples out of the ring buffer, oldest first.
+
+        Args:
+            n (int, optional): The number of samples. Defaults to None (everything in the buffer).
+
+        Returns:
+            samples: The samples as an array of (timestamp, bearing, pitch, roll).
+            headings: The unwrapped heading of each sample.
+        """
+        with self.lock:
+            available = min(self.count, self.size)
+            n = available if n is None else min(n, available)
+            indices = np.arange(self.count - n, self.count) % self.size
+            return self.buffer[indices].copy(), self.headings[indices].copy()
+
+    def latest(self) -> Optional[dict]:
+        """
+        Returns:
+            Optional[dict]: The latest sample as {time, bearing, heading, pitch, roll, yaw_rate}, or None before the first sample.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            index = (self.count - 1) % self.size
+            timestamp, bearing, pitch, roll = self.buffer[index]
+            return {
+                "time": float(timestamp),
+                "bearing": float(bearing),
+                "heading": float(self.headings[index]),
+                "pitch": int(pitch),
+                "roll": int(roll),
+                "yaw_rate": self.yaw_rate,
+            }
+
+    def at(self, timestamp: float) -> Optional[dict]:
+        """
+        Estimates the compass reading at a time, e.g. when a camera frame was captured,
+        by interpolating the unwrapped heading between the samples either side of it.
+        Pitch and roll are taken from the nearest sample. Times outside the buffer use the oldest or newest sample.
+
+        Args:
+            timestamp (float): The time to estimate the reading at (clock.now()).
+
+        Returns:
+            Optional[dict]: The reading as {time, bearing, heading, pitch, roll}, or None before the first sample.
+        """
+        samples, headings = self.samples()
+        if len(samples) == 0:
+            return None
+
+        heading = float(np.interp(timestamp, samples[:, 0], headings))
+        nearest = np.argmin(np.abs(samples[:, 0] - timestamp))
+        return {
+            "time": timestamp,
+            "bearing": heading % 360,
+            "heading": heading,
+            "pitch": int(samples[nearest, 2]),
+            "roll": int(samples[nearest, 3]),
+        }
+
+    def get_rate(self) -> float:
+        """
+        Returns:
+            float: The sample rate since the sampler started (Hz).
+        """
+        elapsed = clock.now() - self.stats["start_time"]
+        return self.stats["samples"] / elapsed if self.stats["start_time"] > 0 and elapsed > 0 else 0
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The sample rate, yaw rate and errors for logging.
+        """
+        return f"Compass: {self.get_rate():.0f}Hz | Yaw rate: {self.yaw_rate:.1f}deg/s | Overruns: {self.stats['overruns']} | Errors: {self.stats['errors']}"
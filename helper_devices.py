@@ -0,0 +1,472 @@
+import os
+import json
+import time
+import threading
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+import helper_clock as clock
+from helper_i2c import FakeI2CDevice
+from helper_simtrack import SimTrack
+
+# Which devices to use: "real" for the robot, or "sim" for deterministic simulated devices, so the follower can run on any Linux machine
+BACKEND = os.environ.get("CATBOT_DEVICES", "real")
+SIMULATED = BACKEND == "sim"
+# Don't open any preview windows. Defaults to on when simulated
+HEADLESS = os.environ.get("CATBOT_HEADLESS", "1" if SIMULATED else "0") == "1"
+
+if BACKEND not in ("real", "sim"):
+    raise ValueError(f"CATBOT_DEVICES must be 'real' or 'sim', not '{BACKEND}'")
+
+VL6180X_ALS_GAIN_1 = 0x06 # adafruit_vl6180x.ALS_GAIN_1, so it can be used without the library
+
+class SimWorld:
+    """
+    The state shared by the simulated devices: a differential drive robot on a SimTrack, driven by the simulated motor throttles.
+
+    The pose is stepped forward on helper_clock whenever a device reads it, so with a VirtualClock the whole loop runs faster than real time.
+    The camera sees the track texture through the camera_geometry in config.json, the compass reads the heading,
+    and the ultrasonic sensors see the walls and obstacles. Every step is scored against the line, for the lap times and cross-track error.
+    """
+
+    def __init__(
+        self,
+        track: Optional[SimTrack] = None,
+        wheel_base: float = 150,
+        max_wheel_speed: float = 400,
+        camera_offset: float = 60,
+        camera_servo_pin: int = 19,
+        max_distance: float = 100,
+    ) -> None:
+        """
+        Args:
+            track (SimTrack, optional): The track to drive on. Defaults to SimTrack.default().
+            wheel_base (float, optional): The distance between the left and right wheels (mm). Defaults to 150.
+            max_wheel_speed (float, optional): The wheel speed at full throttle (mm/s). Defaults to 400.
+            camera_offset (float, optional): How far the camera is in front of the wheel axle (mm). Defaults to 60.
+            camera_servo_pin (int, optional): The pin of the camera servo, whose angle the camera view follows. Defaults to 19.
+            max_distance (float, optional): The ultrasonic distance reported when nothing is in range (cm). Defaults to 100.
+        """
+        self.track = track if track is not None else SimTrack.default()
+        self.wheel_base = wheel_base
+        self.max_wheel_speed = max_wheel_speed
+        self.camera_offset = camera_offset
+        self.camera_servo_pin = camera_servo_pin
+        self.max_distance = max_distance
+        self.camera_geometry = None     # Loaded from config.json on the first frame
+        # Bearing relative to the front and distance in front of the wheel axle (mm) of each ultrasonic sensor
+        self.ultrasonic_mounts = {"front": (0, 80), "side": (90, 40)}
+
+        self.x, self.y, self.heading = self.track.start_pose()   # mm, mm, compass bearing (degrees), clockwise
+        self.lock = threading.Lock()
+        self.motor_kit = None
+        self.servos = {}
+
+        self.start_time = clock.now()
+        self.real_start_time = time.time()
+        self.last_step = self.start_time
+        self.progress = 0           # How far along the line the robot is (mm)
+        self.travelled = 0          # Progress along the line since the start, counting laps (mm)
+        self.lap_start = None       # Set when the robot first moves
+        self.lap_times = []
+
+        self.stats = {
+            "frames": 0,
+            "driven": 0,            # mm
+            "error_total": 0,       # Cross-track error (mm) integrated over time
+            "error_time": 0,
+            "error_max": 0,
+        }
+
+    def wheel_speeds(self) -> Tuple[float, float]:
+        """
+        Returns:
+            tuple[float, float]: The left and right wheel speeds (mm/s), from the simulated motor throttles.
+        """
+        if self.motor_kit is None:
+            return 0, 0
+
+        import helper_motorkit as m # Imported here, since helper_motorkit creates its MotorKit through this module
+        throttles = self.motor_kit.throttles()
+        def side(front: str, back: str) -> float:
+            forward = [throttles[m.conf_tank[name]] * m.conf_directions[m.conf_tank[name]] for name in (front, back)]
+            return sum(forward) / 2 * self.max_wheel_speed
+        return side("front_l", "back_l"), side("front_r", "back_r")
+
+    def step(self) -> None:
+        """
+        Moves the robot forward to now, with a differential drive model, and scores the new position against the line.
+        """
+        with self.lock:
+            now = clock.now()
+            dt = now - self.last_step
+            self.last_step = now
+            if dt <= 0:
+                return
+
+            left, right = self.wheel_speeds()
+            speed = (left + right) / 2
+            yaw_rate = np.degrees((left - right) / self.wheel_base)
+            self.heading = (self.heading + yaw_rate * dt) % 360
+            self.x += speed * dt * np.sin(np.radians(self.heading))
+            self.y += speed * dt * np.cos(np.radians(self.heading))
+
+            if self.lap_start is None:
+                if speed == 0:
+                    return
+                self.lap_start = now
+
+            error, progress = self.track.nearest((self.x, self.y))
+            # Progress wraps around at the end of each lap, and goes backwards if the robot does
+            length = self.track.length
+            self.travelled += (progress - self.progress + length / 2) % length - length / 2
+            self.progress = progress
+
+            self.stats["driven"] += abs(speed) * dt
+            self.stats["error_total"] += abs(error) * dt
+            self.stats["error_time"] += dt
+            self.stats["error_max"] = max(self.stats["error_max"], abs(error))
+
+            if self.travelled >= length * (len(self.lap_times) + 1):
+                self.lap_times.append(now - self.lap_start)
+                self.lap_start = now
+                print(f"[SIM] Lap {len(self.lap_times)}: {self.lap_times[-1]:.2f}s")
+
+    def render(self, size: Tuple[int, int] = (640, 480)) -> np.ndarray:
+        """
+        Args:
+            size (tuple[int, int], optional): The image size (width, height). Defaults to (640, 480).
+
+        Returns:
+            np.ndarray: The camera frame, as 4 channel RGBX like Picamera2's XBGR8888.
+        """
+        if self.camera_geometry is None:
+            with open("config.json", "r") as json_file:
+                self.camera_geometry = json.load(json_file)["camera_geometry"]
+
+        camera_servo = self.servos.get(self.camera_servo_pin)
+        cam_angle = camera_servo.angle if camera_servo is not None and camera_servo.angle is not None else -64
+        with self.lock:
+            pose = (self.x, self.y, self.heading)
+
+        frame = self.track.render_view(pose, cam_angle, self.camera_geometry, self.camera_offset, size)
+        self.stats["frames"] += 1
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+
+    def distance(self, name: str) -> float:
+        """
+        Returns:
+            float: The distance the named ultrasonic sensor sees (cm), or max_distance if nothing is in range.
+        """
+        bearing_offset, forward = self.ultrasonic_mounts.get(name, (0, 0))
+        with self.lock:
+            x = self.x + forward * np.sin(np.radians(self.heading))
+            y = self.y + forward * np.cos(np.radians(self.heading))
+            bearing = self.heading + bearing_offset
+        return self.track.raycast((x, y), bearing, self.max_distance * 10) / 10
+
+    def summary(self, loops: Optional[int] = None) -> str:
+        """
+        Args:
+            loops (int, optional): The number of main loop iterations, for the loop FPS. Defaults to None.
+
+        Returns:
+            str: The laps, cross-track error, frame rates and speed up over real time.
+        """
+        elapsed = max(clock.now() - self.start_time, 1e-6)
+        real_elapsed = max(time.time() - self.real_start_time, 1e-6)
+        laps = ", ".join(f"{lap_time:.2f}s" for lap_time in self.lap_times) or "-"
+        mean_error = self.stats["error_total"] / max(self.stats["error_time"], 1e-6)
+        loop_fps = f" | Loop: {loops / elapsed:.0f}fps" if loops is not None else ""
+        return (
+            f"Sim: Laps: {len(self.lap_times)} ({laps}) | Cross-track: {mean_error:.1f}mm (max {self.stats['error_max']:.1f}mm)"
+            f" | Driven: {self.stats['driven'] / 1000:.2f}m | Camera: {self.stats['frames'] / elapsed:.0f}fps{loop_fps}"
+            f" | {elapsed:.1f}s in {real_elapsed:.1f}s ({elapsed / real_elapsed:.1f}x real time)"
+        )
+
+world = None
+if SIMULATED:
+    # The track to drive on: the path of a track JSON file (see SimTrack.load), or the default loop
+    track_path = os.environ.get("CATBOT_SIM_TRACK")
+    world = SimWorld(SimTrack.load(track_path) if track_path else None)
+
+# -----
+# MOTORS
+# -----
+class SimMotor:
+    """
+    A DCMotor that writes its in1 and in2 channels into the simulated PCA9685 registers, like adafruit_motor does.
+    """
+
+    def __init__(self, kit: "SimMotorKit", in1: int, in2: int) -> None:
+        self.kit = kit
+        self.in1 = in1
+        self.in2 = in2
+        self._throttle = None
+
+    @property
+    def throttle(self):
+        return self._throttle
+
+    @throttle.setter
+    def throttle(self, value) -> None:
+        import helper_motorkit as m
+        for channel, duty_cycle in zip((self.in1, self.in2), m.throttle_duty_cycles(value)):
+            self.kit.set_channel(channel, *m.duty_cycle_registers(duty_cycle))
+        self._throttle = value
+
+class SimMotorKit:
+    """
+    A MotorKit whose PCA9685 is an in-memory register file, so both helper_motorkit's block writes and the per-motor throttle path work.
+    """
+
+    # (enable, in1, in2) PCA9685 channels of each motor, as wired by adafruit_motorkit
+    CHANNELS = [(8, 9, 10), (13, 11, 12), (2, 3, 4), (7, 5, 6)]
+
+    def __init__(self) -> None:
+        self._pca = type("SimPCA9685", (), {})()
+        self._pca.i2c_device = FakeI2CDevice(0x60)
+        self.motors = [None] * 4
+
+    def set_channel(self, channel: int, on: int, off: int) -> None:
+        self._pca.i2c_device.registers[6 + 4 * channel:10 + 4 * channel] = on.to_bytes(2, "little") + off.to_bytes(2, "little")
+
+    def _motor(self, index: int) -> SimMotor:
+        # Like MotorKit, turn the enable channel fully on the first time a motor is used
+        if self.motors[index] is None:
+            enable, in1, in2 = self.CHANNELS[index]
+            self.set_channel(enable, 0x1000, 0)
+            self.motors[index] = SimMotor(self, in1, in2)
+        return self.motors[index]
+
+    motor1 = property(lambda self: self._motor(0))
+    motor2 = property(lambda self: self._motor(1))
+    motor3 = property(lambda self: self._motor(2))
+    motor4 = property(lambda self: self._motor(3))
+
+    def throttles(self) -> list:
+        """
+        Returns:
+            list: The throttle (-1 to 1) of each motor, read back from the PWM registers.
+        """
+        registers = self._pca.i2c_device.registers
+        def duty(channel: int) -> float:
+            on = registers[6 + 4 * channel] | registers[7 + 4 * channel] << 8
+            off = registers[8 + 4 * channel] | registers[9 + 4 * channel] << 8
+            if on & 0x1000:
+                return 1
+            if off & 0x1000:
+                return 0
+            return off / 4096
+
+        return [duty(in1) - duty(in2) for _, in1, in2 in self.CHANNELS]
+
+def motor_kit():
+    """
+    Returns:
+        The adafruit MotorKit, or a SimMotorKit.
+    """
+    if SIMULATED:
+        world.motor_kit = SimMotorKit()
+        return world.motor_kit
+    from adafruit_motorkit import MotorKit
+    return MotorKit()
+
+# ------
+# SERVOS
+# ------
+class SimServo:
+    def __init__(self, initial_angle: float = 0) -> None:
+        self.angle = initial_angle
+
+    def detach(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+def servo(pin: int, min_pulse_width: float, max_pulse_width: float, initial_angle: float):
+    """
+    Returns:
+        A gpiozero.AngularServo, or a SimServo.
+    """
+    if SIMULATED:
+        world.servos[pin] = SimServo(initial_angle)
+        return world.servos[pin]
+    import gpiozero
+    return gpiozero.AngularServo(pin, min_pulse_width=min_pulse_width, max_pulse_width=max_pulse_width, initial_angle=initial_angle)
+
+# --------------
+# DIGITAL INPUTS
+# --------------
+class SimDigitalInput:
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+    def close(self) -> None:
+        pass
+
+def digital_input(pin: int, pull_up: bool = True):
+    """
+    Returns:
+        A gpiozero.DigitalInputDevice, or a SimDigitalInput.
+        When simulated, the value of every switch is set with CATBOT_SIM_SWITCH_<pin> (defaults to 0, off).
+    """
+    if SIMULATED:
+        return SimDigitalInput(int(os.environ.get(f"CATBOT_SIM_SWITCH_{pin}", "0")))
+    import gpiozero
+    return gpiozero.DigitalInputDevice(pin, pull_up=pull_up)
+
+# ---
+# I2C
+# ---
+def i2c_bus():
+    """
+    Returns:
+        The busio.I2C bus used by the adafruit sensors, or None when simulated.
+    """
+    if SIMULATED:
+        return None
+    import board
+    import busio
+    return busio.I2C(board.SCL, board.SDA)
+
+class SimCMPS14Bus(FakeI2CDevice):
+    """
+    A CMPS14 register file, refreshed from the simulated robot's heading before every read.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(0x61)
+
+    def write_then_readinto(self, out_buffer: bytes, in_buffer: bytearray, **kwargs) -> None:
+        world.step()
+        bearing = int(round(world.heading * 10)) % 3600
+        self.registers[1] = int(world.heading / 360 * 255) & 0xFF
+        self.registers[2:4] = bearing.to_bytes(2, "big")
+        super().write_then_readinto(out_buffer, in_buffer, **kwargs)
+
+def smbus(bus: int):
+    """
+    Returns:
+        An smbus2.SMBus, or a SimCMPS14Bus (the CMPS14 is the only smbus2 device).
+    """
+    if SIMULATED:
+        return SimCMPS14Bus()
+    import smbus2
+    return smbus2.SMBus(bus)
+
+class SimVL6180X:
+    """
+    A VL6180X that never sees anything in range.
+    """
+
+    def __init__(self) -> None:
+        self.range = 255
+
+    def read_lux(self, gain: int) -> float:
+        return 100
+
+    def start_range_continuous(self, period: int = 100) -> None:
+        pass
+
+    def stop_range_continuous(self) -> None:
+        pass
+
+def vl6180x(i2c):
+    """
+    Returns:
+        An adafruit_vl6180x.VL6180X, or a SimVL6180X.
+    """
+    if SIMULATED:
+        return SimVL6180X()
+    import adafruit_vl6180x
+    return adafruit_vl6180x.VL6180X(i2c)
+
+# ----------
+# ULTRASONIC
+# ----------
+class SimUltrasonic:
+    """
+    The same interface as helper_ultrasonic.UltrasonicService, with distances from the simulated world.
+    """
+
+    def __init__(self, sensors: Dict[str, Tuple[int, int]]) -> None:
+        self.sensors = sensors
+        self.running = True
+
+    def reading(self, name: str) -> dict:
+        return {"distance": world.distance(name), "raw": world.distance(name), "time": clock.now(), "age": 0, "stale": False}
+
+    def distance(self, name: str) -> float:
+        return world.distance(name)
+
+    def wait_for_reading(self, name: str, timeout: float) -> dict:
+        return self.reading(name)
+
+    def stop(self) -> None:
+        self.running = False
+
+    def summary(self) -> str:
+        return "USS: " + " | ".join(f"{name}: {world.distance(name):.1f}cm (sim)" for name in self.sensors)
+
+def ultrasonic(sensors: Dict[str, Tuple[int, int]]):
+    """
+    Args:
+        sensors (dict): The (trigger, echo) GPIO pins of each sensor, by name.
+
+    Returns:
+        A helper_ultrasonic.UltrasonicService, or a SimUltrasonic.
+    """
+    if SIMULATED:
+        return SimUltrasonic(sensors)
+    from helper_ultrasonic import UltrasonicService
+    return UltrasonicService(sensors)
+
+# ------
+# CAMERA
+# ------
+class SimCamera:
+    """
+    Stands in for Picamera2 in helper_camera.CameraStream, serving frames rendered by the simulated world at a fixed frame rate.
+    """
+
+    def __init__(self, num: int, fps: float = 60, size: Tuple[int, int] = (640, 480)) -> None:
+        self.num = num
+        self.period = 1 / fps
+        self.size = size
+        self.next_frame_time = 0
+        self.helpers = self
+        self.sensor_modes = [{"size": size, "fps": fps}]
+
+    def start(self) -> None:
+        self.next_frame_time = clock.now()
+
+    def stop(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def camera_configuration(self) -> dict:
+        return {"main": {"size": self.size, "format": "XBGR8888"}}
+
+    def capture_buffer(self) -> np.ndarray:
+        clock.sleep(max(0, self.next_frame_time - clock.now()))
+        self.next_frame_time = max(self.next_frame_time + self.period, clock.now())
+        world.step()
+        return world.render(self.size)
+
+    def make_array(self, buffer: np.ndarray, config: dict) -> np.ndarray:
+        return buffer
+
+def camera(num: int):
+    """
+    Returns:
+        A Picamera2, or a SimCamera. The Picamera2 is not configured, see helper_camera.get_camera.
+    """
+    if SIMULATED:
+        return SimCamera(num, fps=float(os.environ.get("CATBOT_SIM_FPS", "60")))
+    from picamera2 import Picamera2
+    return Picamera2(num)
@@ -0,0 +1,288 @@
+import cv2
+import math
+import numpy as np
+
+# Minimum victim radius for each height bar, from the bottom of the image (closest) to the top (furthest)
+# This could become a linear function... but it works for now
+HEIGHT_BAR_MIN_RADIUS = np.array([a - 7 for a in [90, 85, 80, 72, 66, 58, 52, 44, 38, 31, 23, 16, 15]])
+
+# How many victims find_victims_contour looks for in one blob, since victims touching each other join into one blob
+MAX_CIRCLES_PER_BLOB = 6
+
+def preprocess(gray: np.ndarray, calibration_map_rescue: np.ndarray, black_rescue_threshold: int, blur: bool = True) -> dict:
+    """
+    Builds the images used to find victims and blocks inside the evacuation zone.
+    Everything above the bottom of the walls in each 40px column segment is made white, so the walls are ignored.
+
+    Args:
+        gray (np.ndarray): The blurred grayscale image.
+        calibration_map_rescue (np.ndarray): The rescue calibration map.
+        black_rescue_threshold (int): The threshold used to get a binary image inside the rescue zone.
+        blur (bool, optional): Whether to make the blurred image, which is only needed by HoughCircles. Defaults to True.
+
+    Returns:
+        dict: {
+            binary_rescue: The binary image with the walls removed,
+            binary_rescue_clean: The binary image before the walls were removed,
+            gray_rescue: The calibrated grayscale image, with the walls removed, used by the contour victim detector,
+            blurred: The median blurred image, with the walls removed, used by HoughCircles (None if blur is False)
+        }
+    """
+    gray_rescue_calibrated = calibration_map_rescue * gray
+    binary_rescue = ((gray_rescue_calibrated > black_rescue_threshold) * 255).astype(np.uint8)
+    binary_rescue = cv2.morphologyEx(binary_rescue, cv2.MORPH_OPEN, np.ones((7,7),np.uint8))
+
+    binary_rescue_clean = binary_rescue.copy()
+
+    gray_rescue = np.clip(gray_rescue_calibrated, 0, 255).astype(np.uint8)
+    blurred = None
+    if blur:
+        blurred = cv2.medianBlur(gray_rescue, 9)
+
+    segment_width = 40
+
+    for x in range(0, binary_rescue.shape[1], segment_width):
+        segment = binary_rescue[:, x:x+segment_width]
+
+        # Find the lowest point in the segment that has a full column of white pixels at least 10 pixels high
+        bottom_white_column = -1
+        for y in range(0, binary_rescue.shape[0] - 10):
+            if np.all(segment[y:y+10, :] == 255):
+                bottom_white_column = y
+                break
+
+        # Set all pixels below this column to black
+        if bottom_white_column != -1:
+            binary_rescue[:bottom_white_column:, x:x+segment_width] = 255
+            gray_rescue[:bottom_white_column:, x:x+segment_width] = 255
+            if blurred is not None:
+                blurred[:bottom_white_column:, x:x+segment_width] = 255
+
+    return {
+        "binary_rescue": binary_rescue,
+        "binary_rescue_clean": binary_rescue_clean,
+        "gray_rescue": gray_rescue,
+        "blurred": blurred,
+    }
+
+def find_victims_hough(blurred: np.ndarray, circle_conf: dict) -> np.ndarray:
+    """
+    Finds victim candidates with HoughCircles.
+
+    Args:
+        blurred (np.ndarray): The blurred rescue image, from preprocess.
+        circle_conf (dict): rescue_circle_conf from config.json.
+
+    Returns:
+        np.ndarray: The candidate circles as an array of (x, y, r).
+    """
+    # minDist = min distance between circles
+    # param1 = high threshold for canny edge detection (sensitivity) - lower = more circles
+    # param2 = accumulator threshold for circle detection - Higher = more reliable circles, but may miss some
+    # minRadius = minimum radius of circle
+    # maxRadius = maximum radius of circle
+    circles = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, **{
+        "dp": circle_conf["dp"],
+        "minDist": circle_conf["minDist"],
+        "param1": circle_conf["param1"],
+        "param2": circle_conf["param2"],
+        "minRadius": circle_conf["minRadius"],
+        "maxRadius": circle_conf["maxRadius"],
+    })
+
+    if circles is None:
+        return np.zeros((0, 3), dtype=int)
+    return np.round(circles[0, :]).astype(int)
+
+def find_victims_contour(gray_rescue: np.ndarray, circle_conf: dict, scale: int = 2) -> np.ndarray:
+    """
+    Finds victim candidates as round blobs darker than the floor in the calibrated rescue image.
+    The threshold (circle_conf["victimThreshold"]) is just below the floor, so silver victims are found by their darker rim and reflections,
+    not only black victims. Blobs are found with connected components on a downscaled image, filtered by area on the stats table.
+
+    Each blob is measured at full resolution by its inscribed circles (the peaks of its distance transform), since a victim's shadow
+    on the floor joins onto its blob below it, and would pull an enclosing circle down and make it bigger. Victims touching each other
+    join into one blob too, so each blob can give several circles.
+    A silver victim that is mostly reflection, with little dark rim left below victimThreshold, is still missed.
+    The shadow is only ever below the victim, so the blob must be clear of the rim of the circle above its centre: at least minCircularity
+    of the points just outside the upper half of the circle must be floor. The corners of a block are not, for example.
+
+    Args:
+        gray_rescue (np.ndarray): The calibrated grayscale rescue image with the walls removed, from preprocess.
+        circle_conf (dict): rescue_circle_conf from config.json.
+        scale (int, optional): How much to downscale the image by when finding blobs. Defaults to 2.
+
+    Returns:
+        np.ndarray: The candidate circles as an array of (x, y, r).
+    """
+    victims = ((gray_rescue < circle_conf["victimThreshold"]) * 255).astype(np.uint8)
+    # Remove thin lines (the bottom of the walls) and speckle, so they don't join onto victims
+    victims = cv2.morphologyEx(victims, cv2.MORPH_OPEN, np.ones((7,7),np.uint8))
+    victims_small = cv2.resize(victims, None, fx=1/scale, fy=1/scale, interpolation=cv2.INTER_NEAREST)
+    stats = cv2.connectedComponentsWithStats(victims_small, connectivity=8)[2][1:] # Skip the background label
+
+    # Remove anything too small to be a victim. There is no upper limit or aspect ratio filter, since victims touching each other,
+    # or touching a block, join into one blob
+    areas = stats[:, cv2.CC_STAT_AREA] * scale**2
+    candidates = stats[areas >= math.pi * circle_conf["minRadius"]**2 * circle_conf["minFill"]]
+
+    # Points just outside the upper half of a unit circle, for checking the rim is clear
+    rim_angles = np.linspace(math.pi, 2 * math.pi, 24)
+    rim = np.stack((np.cos(rim_angles), np.sin(rim_angles)), axis=1) * 1.15
+
+    circles = []
+    for x, y, w, h, _ in candidates * scale:
+        # Look at the blob at full resolution, with a border for the pixels lost when downscaling
+        x0, y0 = max(x - scale, 0), max(y - scale, 0)
+        x1, y1 = min(x + w + scale, victims.shape[1]), min(y + h + scale, victims.shape[0])
+        contours = cv2.findContours(victims[y0:y1, x0:x1], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
+        if len(contours) == 0:
+            continue
+
+        # Fill the blob, so the bright middle and highlights of a silver victim are part of it, with a border of floor for the distance transform.
+        # Where the blob is cut off by the edge of the image, it is carried on past the edge instead, so a victim partly out of view isn't measured smaller
+        pad = [maxpad if edge else 1 for edge, maxpad in zip((y0 == 0, y1 == victims.shape[0], x0 == 0, x1 == victims.shape[1]), [circle_conf["maxRadius"]] * 4)]
+        filled = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.drawContours(filled, [max(contours, key=cv2.contourArea)], -1, 255, -1)
+        blob = cv2.copyMakeBorder(filled, *pad, cv2.BORDER_REPLICATE)
+        blob[:pad[0] if pad[0] == 1 else 0] = 0
+        blob[blob.shape[0] - (pad[1] if pad[1] == 1 else 0):] = 0
+        blob[:, :pad[2] if pad[2] == 1 else 0] = 0
+        blob[:, blob.shape[1] - (pad[3] if pad[3] == 1 else 0):] = 0
+
+        # Take the inscribed circles from the largest down, removing each one from the distance transform,
+        # so every victim in a joined blob gets its own peak
+        distance = cv2.distanceTransform(blob, cv2.DIST_L2, 5)
+        found = []
+        for _ in range(MAX_CIRCLES_PER_BLOB):
+            _, r, _, (cx, cy) = cv2.minMaxLoc(distance)
+            if r < circle_conf["minRadius"]:
+                break
+            cv2.circle(distance, (cx, cy), math.ceil(r), 0, -1)
+            # A peak overlapping a circle already found by more than half its radius is part of the same victim
+            if any(math.hypot(cx - fx, cy - fy) < fr + r / 2 for fx, fy, fr in found):
+                continue
+            found.append((cx, cy, r))
+
+            r = min(r, circle_conf["maxRadius"])
+            cx, cy = cx + x0 - pad[2], cy + y0 - pad[0]
+
+            # Only rim points inside the image can be checked
+            rim_points = np.round(rim * r + (cx, cy)).astype(int)
+            inside = (rim_points[:, 0] >= 0) & (rim_points[:, 0] < victims.shape[1]) & (rim_points[:, 1] >= 0) & (rim_points[:, 1] < victims.shape[0])
+            if np.count_nonzero(inside) < len(rim) / 2:
+                continue
+            clear = np.count_nonzero(victims[rim_points[inside, 1], rim_points[inside, 0]] == 0) / np.count_nonzero(inside)
+            if clear >= circle_conf["minCircularity"]:
+                circles.append((round(cx), round(cy), round(r)))
+
+    return np.array(circles, dtype=int).reshape(-1, 3)
+
+def find_victims(images: dict, circle_conf: dict) -> np.ndarray:
+    """
+    Finds victim candidates with the detector selected by circle_conf["detector"] ("hough" or "contour").
+
+    Args:
+        images (dict): The images from preprocess.
+        circle_conf (dict): rescue_circle_conf from config.json.
+
+    Returns:
+        np.ndarray: The candidate circles as an array of (x, y, r).
+    """
+    if circle_conf["detector"] == "contour":
+        return find_victims_contour(images["gray_rescue"], circle_conf)
+    return find_victims_hough(images["blurred"], circle_conf)
+
+def filter_victims_by_height(circles: np.ndarray, image_height: int, minradius_offset: int) -> np.ndarray:
+    """
+    Removes circles that are too small or large for their height in the image, since victims further away look smaller.
+    The image is split into horizontal height bars, each with its own radius limits.
+
+    Args:
+        circles (np.ndarray): The candidate circles as an array of (x, y, r).
+        image_height (int): The height of the image.
+        minradius_offset (int): How much larger than the minimum radius a circle can be.
+
+    Returns:
+        np.ndarray: The valid circles as an array of (x, y, r, bar), sorted from the closest height bar to the furthest,
+                    then from left to right.
+    """
+    if len(circles) == 0:
+        return np.zeros((0, 4), dtype=int)
+
+    height_bar_qty = len(HEIGHT_BAR_MIN_RADIUS)
+    bar_height = image_height / height_bar_qty
+
+    x, y, r = circles[:, 0], circles[:, 1], circles[:, 2]
+    # Bar 0 is at the bottom of the image
+    bars = np.clip(np.ceil(height_bar_qty - 1 - y / bar_height), 0, height_bar_qty - 1).astype(int)
+
+    min_radius = HEIGHT_BAR_MIN_RADIUS[bars]
+    valid = (r >= min_radius) & (r <= min_radius + minradius_offset)
+
+    valid_circles = np.column_stack((circles[valid], bars[valid]))
+    return valid_circles[np.lexsort((valid_circles[:, 0], valid_circles[:, 3]))]
+
+def height_bar_lines(image_height: int) -> list[int]:
+    """
+    Returns:
+        list[int]: The y position of the top of each height bar, from the bottom of the image to the top.
+    """
+    height_bar_qty = len(HEIGHT_BAR_MIN_RADIUS)
+    return [int((image_height / height_bar_qty) * i) for i in range(height_bar_qty - 1, -1, -1)]
+
+def find_blocks(hsv: np.ndarray, binary_rescue: np.ndarray, hsv_threshold: list[np.ndarray], scale: int = 4, min_area: int = 10000, side_threshold: tuple[int, int] = (10, 50)) -> list[dict]:
+    """
+    Finds the rescue blocks, using connected components on a downscaled block mask.
+
+    Args:
+        hsv (np.ndarray): The HSV image.
+        binary_rescue (np.ndarray): The binary rescue image with the walls removed, from preprocess.
+        hsv_threshold (list[np.ndarray]): The lower and upper HSV bounds of the block.
+        scale (int, optional): How much to downscale the images by. Defaults to 4.
+        min_area (int, optional): The minimum area of a block, in full resolution pixels. Defaults to 10000.
+        side_threshold (tuple[int, int], optional): How close (px) a block must be to a side of the image
+                                                    to be touching it, and to be near it. Defaults to (10, 50).
+
+    Returns:
+        list[dict]: The blocks, largest first, that don't touch the top of the image. Each block is {
+            contourArea: The area in full resolution pixels,
+            boundingRect: The bounding rect (x, y, w, h) in full resolution pixels,
+            touching_sides: The sides of the image the block is touching,
+            near_sides: The sides of the image the block is near
+        }
+    """
+    hsv_small = cv2.resize(hsv, None, fx=1/scale, fy=1/scale, interpolation=cv2.INTER_NEAREST)
+    binary_small = cv2.resize(binary_rescue, None, fx=1/scale, fy=1/scale, interpolation=cv2.INTER_NEAREST)
+
+    block_mask = cv2.inRange(hsv_small, hsv_threshold[0], hsv_threshold[1])
+    block_mask = cv2.bitwise_and(cv2.bitwise_not(binary_small), block_mask)
+    # Same size opening as the 13x13 used at full resolution
+    kernel_size = max(1, round(13 / scale)) | 1
+    block_mask = cv2.morphologyEx(block_mask, cv2.MORPH_OPEN, np.ones((kernel_size, kernel_size), np.uint8))
+
+    stats = cv2.connectedComponentsWithStats(block_mask, connectivity=8)[2][1:] # Skip the background label
+    x, y, w, h = (stats[:, :4] * scale).T
+    areas = stats[:, cv2.CC_STAT_AREA] * scale**2
+    height, width = binary_rescue.shape[:2]
+
+    # Figure out which sides of the image the blocks are touching, for all blocks at once
+    sides = {}
+    for kind, threshold in zip(["touching_sides", "near_sides"], side_threshold):
+        sides[kind] = {
+            "left": x < threshold,
+            "top": y < threshold,
+            "right": x + w > width - threshold,
+            "bottom": y + h > height - threshold,
+        }
+
+    # Filter by area and ensure it doesn't touch the top, then sort by area
+    valid = np.nonzero((areas > min_area) & ~sides["touching_sides"]["top"])[0]
+    valid = valid[np.argsort(-areas[valid], kind="stable")]
+
+    return [{
+        "contourArea": int(areas[i]),
+        "boundingRect": (int(x[i]), int(y[i]), int(w[i]), int(h[i])),
+        "touching_sides": [side for side, flags in sides["touching_sides"].items() if flags[i]],
+        "near_sides": [side for side, flags in sides["near_sides"].items() if flags[i]],
+    } for i in valid]
@@ -0,0 +1,239 @@
+import json
+import numpy as np
+from typing import List, Optional
+
+import helper_clock as clock
+
+def bearing_diff(a: float, b: float) -> float:
+    """
+    Returns:
+        float: The signed difference a - b between two bearings, wrapped to +-180.
+    """
+    return (a - b + 180) % 360 - 180
+
+class EvacMap:
+    """
+    A polar map of the evacuation zone around the robot, indexed by compass bearing.
+
+    For each bearing bin it keeps the last front and side ultrasonic distances, and whether the camera has looked that way.
+    Victims and blocks are kept as the bearing they were seen at, so the robot can turn straight to them,
+    or to the nearest direction it hasn't looked in yet, instead of rotating in small steps and re-detecting.
+
+    Bearings are relative to where the robot is standing, so call new_position() after driving somewhere else.
+    """
+
+    def __init__(self, bin_size: int = 10, hfov: float = 62.2, side_offset: float = 90, victim_timeout: float = 30) -> None:
+        """
+        Initialise the map.
+
+        Args:
+            bin_size (int, optional): The size of each bearing bin (degrees). Defaults to 10.
+            hfov (float, optional): The horizontal field of view of the camera (degrees). Defaults to 62.2.
+            side_offset (float, optional): The bearing of the side ultrasonic sensor relative to the front (degrees). Defaults to 90.
+            victim_timeout (float, optional): Forget victims not seen for this long (s). Defaults to 30.
+        """
+        self.bin_size = bin_size
+        self.hfov = hfov
+        self.side_offset = side_offset
+        self.victim_timeout = victim_timeout
+
+        self.num_bins = 360 // bin_size
+        self.distances = np.full(self.num_bins, np.nan)     # Closest wall/object seen in each bin (cm)
+        self.seen = np.zeros(self.num_bins, dtype=bool)     # Whether the camera has looked at each bin from here
+        self.victims = []                                   # [{"bearing", "time"}]
+        self.blocks = []                                    # [{"bearing", "time"}]
+
+        self.start_time = clock.now()
+        self.events = []                                    # Log of everything recorded, for reviewing a run
+
+        self.stats = {
+            "scans": 0,
+            "victims_seen": 0,
+            "rescued": 0,
+            "turns_to_victim": 0,
+            "turns_to_unexplored": 0,
+            "rescans": 0,
+        }
+
+    def _bin(self, bearing: float) -> int:
+        return int((bearing % 360) // self.bin_size)
+
+    def _bin_bearing(self, index: int) -> float:
+        return index * self.bin_size + self.bin_size / 2
+
+    def _log(self, event: str, **values) -> None:
+        self.events.append({"time": round(clock.now() - self.start_time, 3), "event": event, **values})
+
+    def image_bearing(self, bearing: float, x: float, image_width: int) -> float:
+        """
+        Converts a horizontal image position to a compass bearing.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+            x (float): The x position in the image.
+            image_width (int): The width of the image.
+
+        Returns:
+            float: The bearing of x (0-359.9).
+        """
+        return (bearing + (x / image_width - 0.5) * self.hfov) % 360
+
+    def record_scan(self, bearing: float, front_dist: float = None, side_dist: float = None) -> None:
+        """
+        Records the ultrasonic distances at a bearing.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+            front_dist (float, optional): The front ultrasonic distance (cm). 0 or None if there was no reading.
+            side_dist (float, optional): The side ultrasonic distance (cm). 0 or None if there was no reading.
+        """
+        self.stats["scans"] += 1
+        if front_dist:
+            self.distances[self._bin(bearing)] = front_dist
+        if side_dist:
+            self.distances[self._bin(bearing + self.side_offset)] = side_dist
+        self._log("scan", bearing=round(bearing, 1), front=front_dist, side=side_dist)
+
+    def record_view(self, bearing: float, victims_x: Optional[List[float]] = None, image_width: int = 640) -> None:
+        """
+        Records what the camera saw while facing a bearing.
+        Every bin in the camera's field of view is marked as seen, and old victims in view that weren't seen again are forgotten.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+            victims_x (List[float], optional): The x position in the image of each victim seen. Defaults to None.
+            image_width (int, optional): The width of the image. Defaults to 640.
+        """
+        victims_x = victims_x if victims_x is not None else []
+        offsets = np.arange(-self.hfov / 2, self.hfov / 2 + 1, self.bin_size / 2)
+        self.seen[[self._bin(bearing + offset) for offset in offsets]] = True
+
+        now = clock.now()
+        self.victims = [
+            v for v in self.victims
+            if abs(bearing_diff(v["bearing"], bearing)) > self.hfov / 2 and now - v["time"] < self.victim_timeout
+        ]
+        for x in victims_x:
+            self.victims.append({"bearing": self.image_bearing(bearing, x, image_width), "time": now})
+
+        if len(victims_x) > 0:
+            self.stats["victims_seen"] += len(victims_x)
+            self._log("victims", bearing=round(bearing, 1), victims=[round(v["bearing"], 1) for v in self.victims])
+
+    def record_block(self, bearing: float, x: float, image_width: int = 640) -> None:
+        """
+        Records a rescue block seen in the image.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+            x (float): The x position of the block in the image.
+            image_width (int, optional): The width of the image. Defaults to 640.
+        """
+        block_bearing = self.image_bearing(bearing, x, image_width)
+        self.blocks = [b for b in self.blocks if abs(bearing_diff(b["bearing"], block_bearing)) > self.bin_size]
+        self.blocks.append({"bearing": block_bearing, "time": clock.now()})
+        self._log("block", bearing=round(block_bearing, 1))
+
+    def block_bearing(self, bearing: float) -> Optional[float]:
+        """
+        Finds the closest known block that is out of view, forgetting any that should be in view but weren't found.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+
+        Returns:
+            Optional[float]: The bearing of the block, or None if no blocks are known.
+        """
+        self.blocks = [b for b in self.blocks if abs(bearing_diff(b["bearing"], bearing)) > self.hfov / 2]
+        if len(self.blocks) == 0:
+            return None
+        return min(self.blocks, key=lambda b: abs(bearing_diff(b["bearing"], bearing)))["bearing"]
+
+    def record_rescue(self, bearing: float) -> None:
+        """
+        Records that the victim in front of the robot was picked up.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+        """
+        self.stats["rescued"] += 1
+        self.victims = [v for v in self.victims if abs(bearing_diff(v["bearing"], bearing)) > self.hfov / 2]
+        self._log("rescue", bearing=round(bearing, 1))
+
+    def new_position(self) -> None:
+        """
+        Forget what has been looked at and the distances, after the robot has driven somewhere else.
+        Victim and block bearings are kept, since they will still be roughly in the same direction.
+        """
+        self.seen[:] = False
+        self.distances[:] = np.nan
+        self._log("move")
+
+    def next_bearing(self, bearing: float) -> Optional[float]:
+        """
+        Chooses the bearing to turn to next: the closest known victim, otherwise the closest bin that hasn't been looked at.
+        Once everything has been looked at with no victims, the map is cleared so the next search starts again.
+
+        Args:
+            bearing (float): The compass bearing the robot is facing.
+
+        Returns:
+            Optional[float]: The bearing to turn to, or None to carry on searching blindly.
+        """
+        now = clock.now()
+        self.victims = [v for v in self.victims if now - v["time"] < self.victim_timeout]
+        if len(self.victims) > 0:
+            self.stats["turns_to_victim"] += 1
+            return min(self.victims, key=lambda v: abs(bearing_diff(v["bearing"], bearing)))["bearing"]
+
+        unseen = np.nonzero(~self.seen)[0]
+        if len(unseen) == 0:
+            self.stats["rescans"] += 1
+            self.seen[:] = False
+            self._log("rescan")
+            return None
+
+        self.stats["turns_to_unexplored"] += 1
+        # Prefer turning the same way as the blind rotation (clockwise), so the search sweeps around the zone
+        return self._bin_bearing(min(unseen, key=lambda i: bearing_diff(self._bin_bearing(i), bearing) % 360))
+
+    def explored_fraction(self) -> float:
+        """
+        Returns:
+            float: The fraction of bearings that have been looked at from here (0-1).
+        """
+        return np.count_nonzero(self.seen) / self.num_bins
+
+    def victims_per_minute(self) -> float:
+        """
+        Returns:
+            float: The number of victims rescued per minute since the map was created.
+        """
+        elapsed = clock.now() - self.start_time
+        return self.stats["rescued"] / (elapsed / 60) if elapsed > 0 else 0
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: A summary of the map for logging.
+        """
+        return f"Explored: {int(self.explored_fraction()*100)}% | Victims known: {len(self.victims)} | Rescued: {self.stats['rescued']} ({self.victims_per_minute():.2f}/min)"
+
+    def save(self, path: str) -> None:
+        """
+        Saves the map, stats and event log as JSON, so a recorded run can be reviewed.
+
+        Args:
+            path (str): The file to save to.
+        """
+        with open(path, "w") as json_file:
+            json.dump({
+                "elapsed": round(clock.now() - self.start_time, 3),
+                "victims_per_minute": self.victims_per_minute(),
+                "stats": self.stats,
+                "distances": [None if np.isnan(d) else d for d in self.distances],
+                "seen": self.seen.tolist(),
+                "victims": self.victims,
+                "blocks": self.blocks,
+                "events": self.events,
+            }, json_file, indent=4)
@@ -0,0 +1,310 @@
+import time
+import threading
+from typing import Callable, Optional
+
+class FakeI2CDevice:
+    """
+    Stands in for an adafruit_bus_device I2CDevice or an smbus2.SMBus, so I2C code can be checked without the robot.
+
+    It holds a 256 byte register file with auto-increment (like the PCA9685 with AI set):
+    the first byte of a write sets the register pointer, and every following byte is written to the next register.
+    Every transaction and byte is counted, so different ways of talking to a device can be compared.
+    Transactions can be slowed down, or made to fail with fail(), to check how callers cope with a busy or noisy bus.
+    """
+
+    def __init__(self, address: int = 0x40, size: int = 256, latency: float = 0) -> None:
+        """
+        Args:
+            address (int, optional): The address of the device, only used for printing. Defaults to 0x40.
+            size (int, optional): The number of registers. Defaults to 256.
+            latency (float, optional): How long each transaction takes (s). Defaults to 0.
+        """
+        self.device_address = address
+        self.registers = bytearray(size)
+        self.pointer = 0
+        self.latency = latency
+        self.failures = 0                   # Transactions left to fail
+        self.log = []                       # (kind, start register, number of bytes) for every transaction
+
+        self.stats = {
+            "transactions": 0,
+            "bytes_written": 0,
+            "bytes_read": 0,
+        }
+
+    def __enter__(self) -> "FakeI2CDevice":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def fail(self, count: int = 1) -> None:
+        """
+        Makes the next transactions raise OSError, like a NACK or a bus timeout.
+
+        Args:
+            count (int, optional): The number of transactions to fail. Defaults to 1.
+        """
+        self.failures = count
+
+    def _transaction(self) -> None:
+        self.stats["transactions"] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError(121, "Remote I/O error")
+
+    def write(self, buf: bytes, *, start: int = 0, end: Optional[int] = None) -> None:
+        data = bytes(buf[start:end])
+        self._transaction()
+        self.stats["bytes_written"] += len(data)
+        if len(data) == 0:
+            return
+
+        self.pointer = data[0]
+        self.log.append(("write", self.pointer, len(data) - 1))
+        for value in data[1:]:
+            self.registers[self.pointer] = value
+            self.pointer = (self.pointer + 1) % len(self.registers)
+
+    def readinto(self, buf: bytearray, *, start: int = 0, end: Optional[int] = None) -> None:
+        end = len(buf) if end is None else end
+        self._transaction()
+        self.stats["bytes_read"] += end - start
+        self.log.append(("read", self.pointer, end - start))
+        for i in range(start, end):
+            buf[i] = self.registers[self.pointer]
+            self.pointer = (self.pointer + 1) % len(self.registers)
+
+    def write_then_readinto(self, out_buffer: bytes, in_buffer: bytearray, *, out_start: int = 0, out_end: Optional[int] = None, in_start: int = 0, in_end: Optional[int] = None) -> None:
+        """
+        Writes the register pointer then reads, with a repeated start, so it counts as one transaction.
+        """
+        out_data = bytes(out_buffer[out_start:out_end])
+        in_end = len(in_buffer) if in_end is None else in_end
+        self._transaction()
+        self.stats["bytes_written"] += len(out_data)
+        self.stats["bytes_read"] += in_end - in_start
+
+        if len(out_data) > 0:
+            self.pointer = out_data[0]
+        self.log.append(("read", self.pointer, in_end - in_start))
+        for i in range(in_start, in_end):
+            in_buffer[i] = self.registers[self.pointer]
+            self.pointer = (self.pointer + 1) % len(self.registers)
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        buffer = bytearray(1)
+        self.write_then_readinto(bytes([register]), buffer)
+        return buffer[0]
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int) -> list[int]:
+        buffer = bytearray(length)
+        self.write_then_readinto(bytes([register]), buffer)
+        return list(buffer)
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int) -> None:
+        self.write(bytes([register, value]))
+
+    def reset_stats(self) -> None:
+        self.log = []
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The transactions and bytes counted so far.
+        """
+        return f"Device 0x{self.device_address:02x}: {self.stats['transactions']} transactions | Written: {self.stats['bytes_written']}B | Read: {self.stats['bytes_read']}B"
+
+PRIORITY_MOTOR = 0      # Motor writes go first, so steering isn't held up by sensor reads
+PRIORITY_SENSOR = 1
+
+class I2CBackoffError(OSError):
+    """
+    Raised instead of using the bus while a device is backing off after errors.
+    It is an OSError, so callers that already handle I2C errors handle it the same way.
+    """
+
+class _Request:
+    def __init__(self, device: str, function: Callable, priority: int, key: Optional[str]) -> None:
+        self.device = device
+        self.function = function
+        self.priority = priority
+        self.key = key
+        self.started = False
+        self.superseded = False
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class I2CArbiter:
+    """
+    The one way onto I2C bus 1 for every device helper, whichever library they use (blinka, smbus2).
+
+    Only one transaction runs at a time, and motor writes are run ahead of any waiting sensor reads.
+    Transactions with a key are coalesced with a waiting transaction to the same device and key:
+    a read shares the result of the waiting read, and a write replaces the waiting write, since only the latest matters.
+    After an error, the device is skipped (I2CBackoffError) for an exponentially growing back-off time,
+    so a device that has dropped off the bus doesn't hold everything else up.
+    """
+
+    def __init__(self, backoff_base: float = 0.005, backoff_max: float = 0.5) -> None:
+        """
+        Args:
+            backoff_base (float, optional): The back-off after the first error (s), doubling for each error in a row. Defaults to 0.005.
+            backoff_max (float, optional): The longest back-off (s). Defaults to 0.5.
+        """
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.condition = threading.Condition()
+        self.busy = False
+        self.waiting = {}                   # Number of requests waiting at each priority
+        self.pending = {}                   # (device, key) -> waiting _Request, for coalescing
+        self.devices = {}                   # Stats and back-off state for each device
+        self.start_time = time.time()
+
+    def _device(self, device: str) -> dict:
+        if device not in self.devices:
+            self.devices[device] = {
+                "transactions": 0,
+                "errors": 0,
+                "skipped": 0,
+                "coalesced": 0,
+                "latency_total": 0,
+                "latency_max": 0,
+                "wait_total": 0,
+                "wait_max": 0,
+                "error_streak": 0,
+                "backoff_until": 0,
+            }
+        return self.devices[device]
+
+    def _can_start(self, request: _Request) -> bool:
+        if self.busy:
+            return False
+        return not any(count > 0 for priority, count in self.waiting.items() if priority < request.priority)
+
+    def run(self, device: str, function: Callable, priority: int = PRIORITY_SENSOR, key: Optional[str] = None, write: bool = False):
+        """
+        Runs an I2C transaction once the bus is free.
+
+        Args:
+            device (str): The name of the device, for the stats and back-off.
+            function (Callable): Does the transaction, and returns its result.
+            priority (int, optional): PRIORITY_MOTOR or PRIORITY_SENSOR. Lower runs first. Defaults to PRIORITY_SENSOR.
+            key (str, optional): Coalesce with a waiting transaction to the same device with the same key. Defaults to None.
+            write (bool, optional): Whether the transaction is a write, which replaces a waiting one instead of sharing its result. Defaults to False.
+
+        Raises:
+            I2CBackoffError: If the device is backing off after errors.
+            OSError: If the transaction failed.
+
+        Returns:
+            The result of function, or None if a newer write with the same key replaced it.
+        """
+        request = _Request(device, function, priority, key)
+        queued_time = time.time()
+
+        with self.condition:
+            stats = self._device(device)
+            if time.time() < stats["backoff_until"]:
+                stats["skipped"] += 1
+                raise I2CBackoffError(f"{device} is backing off after {stats['error_streak']} errors")
+
+            shared = None
+            if key is not None:
+                waiting = self.pending.get((device, key))
+                if waiting is not None and not waiting.started:
+                    stats["coalesced"] += 1
+                    if write:
+                        waiting.superseded = True
+                        self.condition.notify_all()
+                    else:
+                        shared = waiting
+                if shared is None:
+                    self.pending[(device, key)] = request
+
+        if shared is not None:
+            # The same read is already waiting for the bus, so use its result instead of reading again
+            shared.done.wait()
+            if shared.error is not None:
+                raise shared.error
+            return shared.result
+
+        with self.condition:
+            self.waiting[priority] = self.waiting.get(priority, 0) + 1
+            while not request.superseded and not self._can_start(request):
+                self.condition.wait()
+            self.waiting[priority] -= 1
+
+            if request.superseded:
+                request.done.set()
+                return None
+
+            request.started = True
+            self.busy = True
+            if key is not None and self.pending.get((device, key)) is request:
+                del self.pending[(device, key)]
+
+        start_time = time.time()
+        try:
+            request.result = function()
+            return request.result
+        except OSError as e:
+            request.error = e
+            raise
+        finally:
+            latency = time.time() - start_time
+            wait = start_time - queued_time
+            with self.condition:
+                self.busy = False
+                stats["transactions"] += 1
+                stats["latency_total"] += latency
+                stats["latency_max"] = max(stats["latency_max"], latency)
+                stats["wait_total"] += wait
+                stats["wait_max"] = max(stats["wait_max"], wait)
+                if request.error is not None:
+                    stats["errors"] += 1
+                    stats["error_streak"] += 1
+                    backoff = min(self.backoff_base * 2 ** (stats["error_streak"] - 1), self.backoff_max)
+                    stats["backoff_until"] = time.time() + backoff
+                    if stats["error_streak"] == 1:
+                        print(f"[I2C] {device} error ({request.error}), backing off")
+                elif stats["error_streak"] > 0:
+                    print(f"[I2C] {device} recovered after {stats['error_streak']} errors")
+                    stats["error_streak"] = 0
+                self.condition.notify_all()
+            request.done.set()
+
+    def backoff_remaining(self, device: str) -> float:
+        """
+        Args:
+            device (str): The name of the device.
+
+        Returns:
+            float: How long until the device can be used again after errors (s), or 0 if it isn't backing off.
+        """
+        with self.condition:
+            return max(0, self._device(device)["backoff_until"] - time.time())
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The transaction rate, latency, wait and errors of each device, one per line.
+        """
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        lines = []
+        for device, stats in self.devices.items():
+            count = max(stats["transactions"], 1)
+            lines.append(
+                f"{device}: {stats['transactions'] / elapsed:.0f}/s | Latency: {stats['latency_total'] / count * 1000:.2f}ms (max {stats['latency_max'] * 1000:.1f}ms)"
+                f" | Wait: {stats['wait_total'] / count * 1000:.2f}ms (max {stats['wait_max'] * 1000:.1f}ms)"
+                f" | Coalesced: {stats['coalesced']} | Errors: {stats['errors']} | Skipped: {stats['skipped']}"
+            )
+        return "\n".join(lines)
+
+arbiter = I2CArbiter()
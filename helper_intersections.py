@@ -1,5 +1,6 @@
 import numpy as np
 import cv2
+import helper_camerakit as ck
 # None for nothing happening
 # 2-* For two white contours
 # 3-* For three white contours
@@ -71,3 +72,228 @@ def intersect(line1,line2):
     C = line2[0]
     D = line2[1]
     return ccw(A,C,D) != ccw(B,C,D) and ccw(A,B,C) != ccw(A,B,D)
+
+def closest_point(approx_contour: list, point: tuple) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: The point of a simplified contour closest to a point.
+    """
+    return sorted(approx_contour, key=lambda p: ck.pointDistance(p, point))[0]
+
+def three_way_split(white_contours: list, shape: tuple) -> dict:
+    """
+    Finds the split line of a 3-way intersection (3 white contours), between the two contours closest to the middle of them all.
+
+    Args:
+        white_contours (list): The 3 white contours.
+        shape (tuple[int, int]): The shape of the line mask. (height, width)
+
+    Returns:
+        dict: {
+            split: The two points of the split line, each as [point, index of its contour], from top to bottom,
+            sides: The centres of the contours on the left and right side of the split line, as [left, right],
+            contours: The (contour, centre) of each white contour, from left to right,
+            big: The index of the contour that isn't one of the two closest,
+            edges_big: The image edges the big contour touches, sorted
+        }
+    """
+    # Sort the contours from left to right - Based on the centre of the contour's horz val
+    sorted_contours_horz = sorted([(contour, ck.centerOfContour(contour)) for contour in white_contours], key=lambda contour: contour[1][0])
+
+    # Simplify the contours to get the corner points
+    approx_contours = [ck.simplifiedContourPoints(contour[0], 0.03) for contour in sorted_contours_horz]
+
+    # Middle of contour centres
+    mid_point = (
+        int(sum([contour[1][0] for contour in sorted_contours_horz])/len(sorted_contours_horz)),
+        int(sum([contour[1][1] for contour in sorted_contours_horz])/len(sorted_contours_horz))
+    )
+
+    # Get the closest points of each approx contour to the mid point, and store the index of the contour to back reference later,
+    # sorted by distance to the mid point
+    closest_points = [[closest_point(approx_contour, mid_point), i] for i, approx_contour in enumerate(approx_contours)]
+    sorted_closest_points = sorted(closest_points, key=lambda point: ck.pointDistance(point[0], mid_point))
+    closest_2_points_vert_sort = sorted(sorted_closest_points[:2], key=lambda point: point[0][1])
+
+    # If a point is touching the top/bottom of the screen, it is quite possibly invalid and will cause some issues with cutting
+    # So, we will find the next best point, the point inside the other contour that is at the top of the screen, and is closest to the X value of the other point
+    for i, point in enumerate(closest_2_points_vert_sort):
+        if point[0][1] > shape[0]-10 or point[0][1] < 10:
+            # Find the closest point to the x value of the other point
+            other_point_x = closest_2_points_vert_sort[1-i][0][0]
+            other_point_approx_contour_i = closest_2_points_vert_sort[1-i][1]
+
+            closest_points_to_other_x = sorted(approx_contours[other_point_approx_contour_i], key=lambda point: abs(point[0] - other_point_x))
+            new_valid_points = [
+                point for point in closest_points_to_other_x
+                if not np.isin(point, [
+                    closest_2_points_vert_sort[0][0],
+                    closest_2_points_vert_sort[1][0]
+                ]).any()
+            ]
+            if len(new_valid_points) == 0:
+                continue
+
+            closest_2_points_vert_sort = sorted([[new_valid_points[0], other_point_approx_contour_i], closest_2_points_vert_sort[1-i]], key=lambda point: point[0][1])
+
+    split_line = [point[0] for point in closest_2_points_vert_sort]
+
+    contour_center_point_sides = [[], []] # Left, Right
+    for contour in sorted_contours_horz:
+        if split_line[1][0] == split_line[0][0]:  # Line is vertical, so x is constant
+            side = "right" if contour[1][0] < split_line[0][0] else "left"
+        else:
+            slope = (split_line[1][1] - split_line[0][1]) / (split_line[1][0] - split_line[0][0])
+            y_intercept = split_line[0][1] - slope * split_line[0][0]
+
+            if contour[1][1] < slope * contour[1][0] + y_intercept:
+                side = "left" if slope > 0 else "right"
+            else:
+                side = "right" if slope > 0 else "left"
+
+        contour_center_point_sides[side == "left"].append(contour[1])
+
+    # Get the edges that the contour not relevant to the closest points touches
+    big = sorted_closest_points[2][1]
+    return {
+        "split": closest_2_points_vert_sort,
+        "sides": contour_center_point_sides,
+        "contours": sorted_contours_horz,
+        "big": big,
+        "edges_big": sorted(ck.getTouchingEdges(approx_contours[big], shape)),
+    }
+
+def is_evac_entrance(line: np.ndarray, black_contours: list, edges_big: list, band_detector: str = "contour") -> bool:
+    """
+    Checks a 3-way intersection for the evac entrance: a black strip spanning the image, with white above it and the line continuing below it.
+
+    Args:
+        line (np.ndarray): The line mask (line is black).
+        black_contours (list): The black contours of the line mask.
+        edges_big (list[str]): The sorted edges touched by the big white contour, from three_way_split.
+        band_detector (str, optional): "contour", or "profile" for ck.findEvacEntranceBand. Defaults to "contour".
+
+    Returns:
+        bool: Whether the evac entrance was found.
+    """
+    if band_detector == "profile":
+        return ck.findEvacEntranceBand(line)[0]
+    # This is a janky solution to detecting evac entry... it should work for now, but definitely should be looked at.
+    return (
+        len(black_contours) >= 1 and edges_big == ["left", "right", "top"]
+        and sorted(ck.getTouchingEdges(ck.simplifiedContourPoints(black_contours[0], 0.03), line.shape)) == ["bottom", "left", "right"]
+    )
+
+def three_way_cut_direction(split: dict, state: str) -> tuple[bool, str]:
+    """
+    Chooses which side of the split line of a 3-way intersection to cut away.
+
+    Args:
+        split (dict): The split line, from three_way_split.
+        state (str): The line following state ("3-ng-en" entering, "3-ng-4-ex" exiting a 4-way, or "3-ng").
+
+    Returns:
+        bool: True to cut to the left of the split line, False to cut to the right.
+        str: The new line following state.
+    """
+    edges_big = split["edges_big"]
+
+    # Cut direction is based on the side of the line with the most contour center points
+    cut_direction = len(split["sides"][0]) > len(split["sides"][1])
+
+    # If we are just entering a 3-way intersection, and the 'big contour' does not connect to the bottom,
+    # we may be entering a 4-way intersection... so follow the vertical line
+    if len(edges_big) >= 2 and "bottom" not in edges_big and "-en" in state:
+        cut_direction = not cut_direction
+    # We are exiting a 4-way intersection, so follow the vertical line
+    elif state == "3-ng-4-ex":
+        cut_direction = not cut_direction
+    else:
+        # We have probably actually entered now, lets stop following the vert line and do the normal thing.
+        state = "3-ng"
+
+        # If this is true, the line we want to follow is the smaller, perpendicular line to the large line.
+        # This case should realistically never happen, but it's here just in case.
+        if edges_big == ["bottom", "left", "right"] or edges_big == ["left", "right", "top"]:
+            cut_direction = not cut_direction
+        # If the contour not relevant to the closest points is really small (area), we are probably just entering the intersection,
+        # So we need to follow the line that is perpendicular to the large line
+        # We ignore this if edges_big does not include the bottom, because we could accidently have the wrong contour in some weird angle
+        elif cv2.contourArea(split["contours"][split["big"]][0]) < 7000 and "bottom" in edges_big:
+            cut_direction = not cut_direction
+
+    return cut_direction, state
+
+def three_way_cut(mask: np.ndarray, split: dict, cut_direction: bool) -> np.ndarray:
+    """
+    Cuts a line mask along the split line of a 3-way intersection.
+
+    Args:
+        mask (np.ndarray): The line mask (line is black), which may be changed in place.
+        split (dict): The split line, from three_way_split.
+        cut_direction (bool): True to cut to the left of the split line, False to cut to the right.
+
+    Returns:
+        np.ndarray: The cut line mask.
+    """
+    top, bottom = split["split"][0][0], split["split"][1][0]
+    # CutMaskWithLine will fail if the line is flat, so we need to make sure that the line is not flat
+    if top[1] == bottom[1]:
+        top[1] += 1 # Move the first point up by 1 pixel
+    return CutMaskWithLine(top, bottom, mask, "left" if cut_direction else "right")
+
+def four_way_cut_points(white_contours: list, shape: tuple) -> list:
+    """
+    Finds the corners of a 4-way intersection (4 white contours) to cut along, so only the vertical line is followed.
+
+    Args:
+        white_contours (list): The 4 white contours.
+        shape (tuple[int, int]): The shape of the line mask. (height, width)
+
+    Returns:
+        list[tuple]: The (bottom, top, direction) of the left and right cuts, for CutMaskWithLine.
+    """
+    # Sort the contours from left to right - Based on the centre of the contour's horz val
+    sorted_contours_horz = sorted([(contour, ck.centerOfContour(contour)) for contour in white_contours], key=lambda contour: contour[1][0])
+
+    # Middle of contour centres
+    mid_point = (
+        int(sum([contour[1][0] for contour in sorted_contours_horz]) / 4),
+        int(sum([contour[1][1] for contour in sorted_contours_horz]) / 4)
+    )
+
+    cuts = []
+    for side, direction in [(sorted_contours_horz[:2], "left"), (sorted_contours_horz[2:], "right")]:
+        # Sort the contours on this side from top to bottom - Based on the centre of the contour's vert val
+        contour_B, contour_T = sorted(side, reverse=True, key=lambda contour: contour[1][1])
+        approx_B = ck.simplifiedContourPoints(contour_B[0], 0.03)
+        approx_T = ck.simplifiedContourPoints(contour_T[0], 0.03)
+        closest_B = closest_point(approx_B, mid_point)
+        closest_T = closest_point(approx_T, mid_point)
+
+        # If the top point is touching the top of the screen (or the bottom point the bottom), it is quite possibly invalid and will cause some issues with cutting
+        # So, we will find the next best point, the point inside the relevant contour, and is closest to the X value of the other point
+        if closest_T[1] < 10:
+            closest_T = closest_B
+            closest_B = sorted(approx_B, key=lambda point: abs(point[0] - closest_B[0]))[1]
+        elif closest_B[1] > shape[0] - 10:
+            closest_B = closest_T
+            closest_T = sorted(approx_T, key=lambda point: abs(point[0] - closest_T[0]))[1]
+
+        cuts.append((closest_B, closest_T, direction))
+    return cuts
+
+def four_way_cut(mask: np.ndarray, white_contours: list) -> np.ndarray:
+    """
+    Cuts away everything left of the left pair of corners and right of the right pair of a 4-way intersection, so only the vertical line is followed.
+
+    Args:
+        mask (np.ndarray): The line mask (line is black), which may be changed in place.
+        white_contours (list): The 4 white contours.
+
+    Returns:
+        np.ndarray: The cut line mask.
+    """
+    for bottom, top, direction in four_way_cut_points(white_contours, mask.shape):
+        mask = CutMaskWithLine(bottom, top, mask, direction)
+    return mask
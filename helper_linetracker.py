@@ -0,0 +1,196 @@
+import cv2
+import math
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Type aliases
+Contour = List[List[Tuple[int, int]]]
+Rect = Tuple[int, int, int, int]
+
+class LineTracker:
+    """
+    Alpha-beta tracker for the followed line's centre and angle.
+
+    The tracked state is used to predict a region of interest (ROI) for the next frame,
+    so the black contour search only has to run on a fraction of the line mask.
+    A full-frame search is used whenever the ROI can't be trusted.
+    """
+
+    def __init__(self, alpha: float = 0.6, beta: float = 0.2, margin: int = 60, full_search_interval: int = 15) -> None:
+        """
+        Initialise the tracker.
+
+        Args:
+            alpha (float, optional): Position correction gain. Defaults to 0.6.
+            beta (float, optional): Velocity correction gain. Defaults to 0.2.
+            margin (int, optional): Padding (px) added around the predicted line bounds. Defaults to 60.
+            full_search_interval (int, optional): Force a full-frame search after this many ROI frames. Defaults to 15.
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.margin = margin
+        self.full_search_interval = full_search_interval
+
+        self.state = None                   # [x, y, angle] of the line centre
+        self.velocity = np.zeros(3)         # Change of [x, y, angle] per frame
+        self.bounds = None                  # Bounding rect of the last chosen contour
+        self.frames_since_full = 0
+
+        self.stats = {
+            "frames": 0,
+            "roi_hits": 0,
+            "roi_misses": 0,
+            "full_searches": 0,
+            "pixels_total": 0,
+            "pixels_saved": 0,
+        }
+
+    def reset(self) -> None:
+        """
+        Forget the tracked line, so the next search is done on the full frame.
+        """
+        self.state = None
+        self.velocity = np.zeros(3)
+        self.bounds = None
+
+    def update(self, center: Tuple[float, float], angle: float, bounding_rect: Rect) -> None:
+        """
+        Update the tracker with the line chosen for this frame.
+
+        Args:
+            center (tuple[float, float]): The centre of the chosen contour (x, y).
+            angle (float): The angle of the chosen contour (degrees).
+            bounding_rect (Rect): cv2.boundingRect of the chosen contour.
+        """
+        measurement = np.array([center[0], center[1], angle], dtype=float)
+        self.bounds = bounding_rect
+
+        if self.state is None:
+            self.state = measurement
+            self.velocity = np.zeros(3)
+            return
+
+        predicted = self.state + self.velocity
+        residual = measurement - predicted
+        self.state = predicted + self.alpha * residual
+        self.velocity = self.velocity + self.beta * residual
+
+    def predict_roi(self, shape: Tuple[int, int]) -> Optional[Rect]:
+        """
+        Predicts where the line will be in the next frame.
+
+        Args:
+            shape (tuple[int, int]): The shape of the image. (height, width)
+
+        Returns:
+            Optional[Rect]: The ROI as (x, y, w, h), or None if there is nothing to track.
+        """
+        if self.state is None or self.bounds is None:
+            return None
+
+        dx, dy, d_angle = self.velocity
+        x, y, w, h = self.bounds
+
+        # A rotating line sweeps further sideways the taller it is
+        pad_x = self.margin + abs(dx) + abs(math.radians(d_angle)) * h / 2
+        pad_y = self.margin + abs(dy)
+
+        x0 = int(max(0, x + dx - pad_x))
+        y0 = int(max(0, y + dy - pad_y))
+        x1 = int(min(shape[1], x + w + dx + pad_x))
+        y1 = int(min(shape[0], y + h + dy + pad_y))
+
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def find_contours(self, line_mask: np.ndarray, contour_thresh: int, force_full: bool = False) -> Tuple[List[Contour], np.ndarray, Optional[Rect]]:
+        """
+        Finds the black contours of the line mask, searching only the predicted ROI when possible.
+
+        Falls back to a full-frame search when nothing is tracked, when forced (e.g. intersections),
+        every full_search_interval frames, or when the line is not fully contained in the ROI.
+
+        Args:
+            line_mask (np.ndarray): The line image (line is black, background is white).
+            contour_thresh (int): The minimum contour area to be considered as the line.
+            force_full (bool, optional): Skip the ROI and search the full frame. Defaults to False.
+
+        Returns:
+            contours: The black contours in full-frame coordinates.
+            hierarchy: The contour hierarchy, as returned by cv2.findContours.
+            roi: The ROI that was searched, or None if the full frame was searched.
+        """
+        full_pixels = line_mask.shape[0] * line_mask.shape[1]
+        self.stats["frames"] += 1
+        self.stats["pixels_total"] += full_pixels
+
+        roi = None
+        if not force_full and self.frames_since_full < self.full_search_interval:
+            roi = self.predict_roi(line_mask.shape)
+
+        if roi is not None:
+            x, y, w, h = roi
+            roi_not = cv2.bitwise_not(line_mask[y:y+h, x:x+w])
+            contours, hierarchy = cv2.findContours(roi_not, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+
+            if self._roi_contains_line(contours, roi, contour_thresh, line_mask.shape):
+                self.frames_since_full += 1
+                self.stats["roi_hits"] += 1
+                self.stats["pixels_saved"] += full_pixels - w * h
+                return contours, hierarchy, roi
+
+            # The ROI pixels were scanned for nothing
+            self.stats["roi_misses"] += 1
+            self.stats["pixels_saved"] -= w * h
+
+        self.frames_since_full = 0
+        self.stats["full_searches"] += 1
+        contours, hierarchy = cv2.findContours(cv2.bitwise_not(line_mask), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        return contours, hierarchy, None
+
+    def _roi_contains_line(self, contours: List[Contour], roi: Rect, contour_thresh: int, shape: Tuple[int, int]) -> bool:
+        """
+        Checks that at least one valid contour was found, and that no valid contour is cut off by the ROI.
+        A contour touching an ROI edge that is not also an image edge may continue outside the ROI.
+
+        Args:
+            contours (List[Contour]): The contours found inside the ROI.
+            roi (Rect): The ROI that was searched.
+            contour_thresh (int): The minimum contour area to be considered as the line.
+            shape (tuple[int, int]): The shape of the image. (height, width)
+
+        Returns:
+            bool: True if the ROI result can be used in place of a full-frame search.
+        """
+        x, y, w, h = roi
+        found = False
+        for contour in contours:
+            if cv2.contourArea(contour) <= contour_thresh:
+                continue
+            found = True
+
+            cx, cy, cw, ch = cv2.boundingRect(contour)
+            if (
+                (cx <= x and x > 0)
+                or (cy <= y and y > 0)
+                or (cx + cw >= x + w and x + w < shape[1])
+                or (cy + ch >= y + h and y + h < shape[0])
+            ):
+                return False
+        return found
+
+    def hit_rate(self) -> float:
+        """
+        Returns:
+            float: The fraction of ROI searches that did not need a full-frame fallback (0-1).
+        """
+        attempts = self.stats["roi_hits"] + self.stats["roi_misses"]
+        return self.stats["roi_hits"] / attempts if attempts > 0 else 0
+
+    def saved_fraction(self) -> float:
+        """
+        Returns:
+            float: The fraction of line mask pixels that did not need to be searched (0-1).
+        """
+        return self.stats["pixels_saved"] / self.stats["pixels_total"] if self.stats["pixels_total"] > 0 else 0
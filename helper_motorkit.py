@@ -1,9 +1,11 @@
-import adafruit_motor.motor
-import time
-from adafruit_motorkit import MotorKit
-from typing import Union, List
+import struct
+import threading
+import helper_clock as clock
+import helper_devices as devices
+from typing import Optional, Union, List
+from helper_i2c import arbiter, PRIORITY_MOTOR
 
-kit = MotorKit()
+kit = devices.motor_kit()
 
 # Direction config, such that a positive speed value will be "straight" for each motor
 conf_directions = [1, -1, -1, 1]
@@ -20,8 +22,387 @@ conf_tank = {
     "back_r": 3
 }
 
+# Write all the motor PWM channels in one I2C block write, instead of two writes per motor through the adafruit library
+conf_batched_pwm = True
+
+# PCA9685 channels (in1, in2) for each motor number, as wired by adafruit_motorkit
+conf_pwm_channels = [(9, 10), (11, 12), (3, 4), (5, 6)]
+# PCA9685 channel that MotorKit leaves fully on to enable each motor. 7 and 8 sit between the in1/in2 channels
+conf_enable_channels = [8, 13, 2, 7]
+
+def throttle_duty_cycles(throttle: Optional[float]) -> tuple[int, int]:
+    """
+    Converts a throttle to the 16 bit duty cycles of a motor's in1 and in2 channels, the same way adafruit_motor.DCMotor does in fast decay mode.
+
+    Args:
+        throttle (Optional[float]): The throttle (-1 to 1), 0 to brake, or None to coast.
+
+    Returns:
+        tuple[int, int]: The in1 and in2 duty cycles (0-0xFFFF).
+    """
+    if throttle is None:
+        return 0, 0
+    if throttle > 1 or throttle < -1:
+        raise ValueError("Throttle must be None or between -1.0 and +1.0")
+    if throttle == 0:
+        return 0xFFFF, 0xFFFF
+
+    duty_cycle = int(0xFFFF * abs(throttle))
+    return (0, duty_cycle) if throttle < 0 else (duty_cycle, 0)
+
+def duty_cycle_registers(duty_cycle: int) -> tuple[int, int]:
+    """
+    Converts a 16 bit duty cycle to the PCA9685 LEDn_ON and LEDn_OFF register values, the same way adafruit_pca9685 does.
+
+    Returns:
+        tuple[int, int]: The ON and OFF values. Bit 12 set is fully on or fully off.
+    """
+    if duty_cycle == 0xFFFF:
+        return 0x1000, 0
+    if duty_cycle < 0x0010:
+        return 0, 0x1000
+    return 0, duty_cycle >> 4
+
+class PWMBatch:
+    """
+    Writes motor throttles straight to the PCA9685 LED registers.
+
+    All the motor channels (and the enable channels between them) are one contiguous block of registers,
+    so every changed channel can be written in a single auto-increment write. Only the span from the first
+    to the last changed channel is sent, and nothing is sent if no channel has changed.
+    """
+
+    LED0_ON_L = 0x06
+
+    def __init__(self, i2c_device, motor_channels: List[tuple[int, int]], enable_channels: List[int]) -> None:
+        """
+        Initialise the batch writer, reading the current value of every channel in the block.
+
+        Args:
+            i2c_device: The PCA9685 I2CDevice (kit._pca.i2c_device), or a helper_i2c.FakeI2CDevice.
+            motor_channels (List[tuple[int, int]]): The (in1, in2) channels of each motor number.
+            enable_channels (List[int]): The enable channel of each motor, which must already be fully on.
+
+        Raises:
+            ValueError: If the block between the motor channels contains a channel that isn't a motor or enable channel.
+        """
+        self.device = i2c_device
+        self.motor_channels = motor_channels
+
+        channels = [channel for pair in motor_channels for channel in pair]
+        self.first = min(channels)
+        self.last = max(channels)
+        for channel in range(self.first, self.last + 1):
+            if channel not in channels and channel not in enable_channels:
+                raise ValueError(f"Channel {channel} is between the motor channels but isn't a motor or enable channel")
+
+        self.lock = threading.Lock()
+        self.registers = self._read_block()     # (on, off) of each channel in the block, as last written
+
+        self.stats = {
+            "updates": 0,
+            "skipped": 0,
+            "transactions": 0,
+            "bytes": 0,
+            "channels": 0,
+        }
+
+    def _read_block(self) -> dict:
+        buffer = bytearray(4 * (self.last - self.first + 1))
+        def read():
+            with self.device:
+                self.device.write_then_readinto(bytes([self.LED0_ON_L + 4 * self.first]), buffer)
+        arbiter.run("pca9685", read, PRIORITY_MOTOR)
+        values = struct.unpack(f"<{len(buffer) // 2}H", buffer)
+        return {self.first + i: (values[2 * i], values[2 * i + 1]) for i in range(len(values) // 2)}
+
+    def write(self, throttles: dict) -> None:
+        """
+        Sets the throttle of some motors, in one I2C write.
+
+        Args:
+            throttles (dict): The throttle of each motor number to set, as for DCMotor.throttle (-1 to 1, 0 to brake, None to coast).
+        """
+        with self.lock:
+            values = dict(self.registers)
+            for target, throttle in throttles.items():
+                in1, in2 = self.motor_channels[target]
+                duty_in1, duty_in2 = throttle_duty_cycles(throttle)
+                values[in1] = duty_cycle_registers(duty_in1)
+                values[in2] = duty_cycle_registers(duty_in2)
+
+            self.stats["updates"] += 1
+            changed = [channel for channel in range(self.first, self.last + 1) if values[channel] != self.registers[channel]]
+            if len(changed) == 0:
+                self.stats["skipped"] += 1
+                return
+
+            start, end = changed[0], changed[-1]
+            buffer = bytearray([self.LED0_ON_L + 4 * start])
+            for channel in range(start, end + 1):
+                buffer += struct.pack("<HH", *values[channel])
+
+            def write():
+                with self.device:
+                    self.device.write(buffer)
+            arbiter.run("pca9685", write, PRIORITY_MOTOR)
+            self.registers = values
+
+            self.stats["transactions"] += 1
+            self.stats["bytes"] += len(buffer)
+            self.stats["channels"] += len(changed)
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The number of writes, skipped updates and bytes sent for logging.
+        """
+        return (
+            f"PWM block writes: {self.stats['transactions']}/{self.stats['updates']} | Skipped: {self.stats['skipped']}"
+            f" | Channels changed: {self.stats['channels']} | Bytes: {self.stats['bytes']}"
+        )
+
+class TimedMove:
+    """
+    A tank drive started by run_tank_for_time_async, which is stopped on a timer thread when its duration is up.
+    """
+
+    def __init__(self, left_speed: int, right_speed: int, duration: float, brake: bool) -> None:
+        self.left_speed = left_speed
+        self.right_speed = right_speed
+        self.duration = duration
+        self.brake = brake
+        self.start_time = clock.now()
+        self.end_time = self.start_time + duration / 1000
+
+        self.state = "running" # running, completed, preempted or cancelled
+        self.finished = threading.Event()
+        self.condition = threading.Condition()     # Notified when the move finishes, for wait()
+        self.timer = clock.Timer(duration / 1000, _finish_move, args=(self,))
+
+    def done(self) -> bool:
+        """
+        Returns:
+            bool: Whether the move has finished, been cancelled, or been replaced by another motor command.
+        """
+        return self.finished.is_set()
+
+    def remaining(self) -> float:
+        """
+        Returns:
+            float: The time left before the motors are stopped (ms).
+        """
+        return 0 if self.done() else max(0, self.end_time - clock.now()) * 1000
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the move has finished.
+
+        Args:
+            timeout (float, optional): The longest time to wait (s). Defaults to None (forever).
+
+        Returns:
+            bool: True if the move ran for its full duration.
+        """
+        end_time = None if timeout is None else clock.monotonic() + timeout
+        with self.condition:
+            while not self.finished.is_set() and (end_time is None or clock.monotonic() < end_time):
+                clock.wait(self.condition, None if end_time is None else end_time - clock.monotonic())
+        return self.state == "completed"
+
+    def cancel(self, brake: bool = True) -> None:
+        """
+        Stops the move early, stopping the motors.
+
+        Args:
+            brake (bool, optional): Whether to brake the motors (True) or just coast (False).
+        """
+        with move_lock:
+            if self.state != "running":
+                return
+            _end_move(self, "cancelled")
+            _output(("stop", brake))
+
+move_lock = threading.Lock()
+current_move = None
+move_stats = {
+    "started": 0,
+    "completed": 0,
+    "preempted": 0,
+    "cancelled": 0,
+}
+
+def _end_move(move: TimedMove, state: str) -> None:
+    """
+    Marks a move as finished. move_lock must be held.
+    """
+    global current_move
+    move.timer.cancel()
+    move.state = state
+    move_stats[state] += 1
+    with move.condition:
+        move.finished.set()
+        clock.notify(move.condition)
+    if current_move is move:
+        current_move = None
+
+def _finish_move(move: TimedMove) -> None:
+    """
+    Stops the motors at the end of a move, unless it has already been replaced by another motor command.
+    """
+    with move_lock:
+        if move.state != "running":
+            return
+        _end_move(move, "completed")
+        _output(("stop", move.brake))
+
+class MotorWriter:
+    """
+    Writes motor commands to the motor driver from its own thread, so the I2C writes don't add to the caller's loop time.
+
+    Commands are posted to a single slot mailbox: if a new command arrives before the last one was written,
+    the old one is dropped, since only the latest command matters.
+    A command that fails to write is retried once the motor driver's back-off is over, unless a newer command has replaced it.
+    """
+
+    def __init__(self) -> None:
+        self.slot = None                    # (command, frame_id, post time)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self.stats = {
+            "posted": 0,
+            "written": 0,
+            "dropped": 0,
+            "errors": 0,
+            "retries": 0,
+            "latency_total": 0,
+            "latency_max": 0,
+            "last_frame_id": None,
+        }
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.update, args=(), daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Writes any command still in the mailbox, then stops the thread.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(1)
+
+    def post(self, command: tuple, frame_id: int = None) -> None:
+        """
+        Replaces the command in the mailbox, and returns immediately.
+
+        Args:
+            command (tuple): ("tank", left_speed, right_speed) or ("stop", brake).
+            frame_id (int, optional): The frame the command was made from, for the stats. Defaults to None.
+        """
+        with self.condition:
+            if self.slot is not None:
+                self.stats["dropped"] += 1
+            self.slot = (command, frame_id, clock.now())
+            self.stats["posted"] += 1
+            self.condition.notify()
+
+    def update(self) -> None:
+        while True:
+            with self.condition:
+                while self.running and self.slot is None:
+                    self.condition.wait()
+                if self.slot is None:
+                    return
+                command, frame_id, post_time = self.slot
+                self.slot = None
+
+            try:
+                _write(command)
+            except OSError as e:
+                self.stats["errors"] += 1
+                print(f"[MOTORS] I2C error writing {command}: {e}")
+                with self.condition:
+                    # Put the command back if it is still the latest (e.g. a stop_all), and wait out the back-off, or a newer command
+                    if self.running and self.slot is None:
+                        self.slot = (command, frame_id, post_time)
+                        self.stats["retries"] += 1
+                        self.condition.wait(max(arbiter.backoff_remaining("pca9685"), 0.001))
+                continue
+
+            latency = clock.now() - post_time
+            self.stats["written"] += 1
+            self.stats["latency_total"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+            self.stats["last_frame_id"] = frame_id
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The write latency, dropped commands and errors for logging.
+        """
+        written = self.stats["written"]
+        mean_latency = self.stats["latency_total"] / written * 1000 if written > 0 else 0
+        return (
+            f"Motor writes: {written}/{self.stats['posted']} | Dropped: {self.stats['dropped']} | Errors: {self.stats['errors']} | Retries: {self.stats['retries']}"
+            f" | Latency: {mean_latency:.1f}ms (max {self.stats['latency_max']*1000:.1f}ms)"
+        )
+
+writer = MotorWriter()
+
+def start_writer() -> None:
+    """
+    Starts writing run_tank, run_steer, stop_all and timed move commands from the motor writer thread.
+    Don't mix this with direct run() or stop() calls, which still write from the caller's thread.
+    """
+    writer.start()
+
+def stop_writer() -> None:
+    """
+    Flushes and stops the motor writer thread, so commands are written directly again.
+    """
+    if writer.running:
+        writer.stop()
+
+def _write(command: tuple) -> None:
+    """
+    Writes a motor command to the motor driver.
+
+    Args:
+        command (tuple): ("tank", left_speed, right_speed) or ("stop", brake).
+    """
+    if command[0] == "tank":
+        throttles = _throttles([conf_tank["front_l"], conf_tank["back_l"]], command[1])
+        throttles.update(_throttles([conf_tank["front_r"], conf_tank["back_r"]], command[2]))
+    else:
+        throttles = {target: 0 if command[1] else None for target in range(4)}
+    _set_throttles(throttles)
+
+def _output(command: tuple, frame_id: int = None) -> None:
+    """
+    Posts a motor command to the writer thread if it is running, otherwise writes it now.
+    """
+    if writer.running:
+        writer.post(command, frame_id)
+    else:
+        _write(command)
+
+def _preempt_move() -> None:
+    """
+    Ends the running move without stopping the motors, because a newer motor command is about to be written.
+    """
+    with move_lock:
+        if current_move is not None:
+            _end_move(current_move, "preempted")
+
  
-def motor(num: int) -> adafruit_motor.motor.DCMotor:
+def motor(num: int) -> "adafruit_motor.motor.DCMotor":
     """
     Returns the motor object for a given number.
 
@@ -42,23 +423,33 @@ def motor(num: int) -> adafruit_motor.motor.DCMotor:
     else:
         raise ValueError("Motor number must be between 0 and 3")
 
-def run(targets: Union[int, List[int]], speed: float) -> None:
-    """
-    Run one motor or multiple motors at a given speed.
+pwm_batch = None
+if conf_batched_pwm:
+    try:
+        # Getting each motor makes MotorKit turn its enable channel fully on
+        for num in range(4):
+            motor(num)
+        pwm_batch = PWMBatch(kit._pca.i2c_device, conf_pwm_channels, conf_enable_channels)
+    except (AttributeError, OSError, ValueError) as e:
+        print(f"[MOTORS] Batched PWM writes unavailable, using per motor writes ({e})")
 
-    Args:
-        targets (Union[int, List[int]]): The motor number(s) (0-3).
-        speed (float): The speed to run the motor(s) at (-100 to 100).
+def _throttles(targets: List[int], speed: float) -> dict:
     """
+    Works out the throttle of each motor for a speed, using the offset and direction of each motor.
 
-    if isinstance(targets, int):
-        targets = [targets]
+    Args:
+        targets (List[int]): The motor numbers (0-3).
+        speed (float): The speed to run the motors at (-100 to 100).
 
+    Returns:
+        dict: The throttle (-1 to 1) of each motor number.
+    """
     if speed > 100:
         speed = 100
     elif speed < -100:
         speed = -100
 
+    throttles = {}
     for target in targets:
         offset_speed = 0
         if speed > 10: 
@@ -69,9 +460,40 @@ def run(targets: Union[int, List[int]], speed: float) -> None:
         if offset_speed > 100: offset_speed = 100
         elif offset_speed < -100: offset_speed = -100
 
-        motor(target).throttle = offset_speed / 100 * conf_directions[target]
+        throttles[target] = offset_speed / 100 * conf_directions[target]
+    return throttles
+
+def _set_throttles(throttles: dict) -> None:
+    """
+    Sets the throttle of each motor, in one block write if batched PWM writes are available.
+
+    Args:
+        throttles (dict): The throttle of each motor number (-1 to 1, 0 to brake, None to coast).
+    """
+    if pwm_batch is not None:
+        pwm_batch.write(throttles)
+    else:
+        # The library writes each channel separately, so hold the bus for all of them
+        def write():
+            for target, throttle in throttles.items():
+                motor(target).throttle = throttle
+        arbiter.run("pca9685", write, PRIORITY_MOTOR)
 
-def run_steer(base_speed: int, max_speed: int, offset: float = 0, skip_range: List[int] = [-15, 25], ramp=False) -> List[float]:
+def run(targets: Union[int, List[int]], speed: float) -> None:
+    """
+    Run one motor or multiple motors at a given speed.
+
+    Args:
+        targets (Union[int, List[int]]): The motor number(s) (0-3).
+        speed (float): The speed to run the motor(s) at (-100 to 100).
+    """
+
+    if isinstance(targets, int):
+        targets = [targets]
+
+    _set_throttles(_throttles(targets, speed))
+
+def run_steer(base_speed: int, max_speed: int, offset: float = 0, skip_range: List[int] = [-15, 25], ramp=False, frame_id: int = None) -> List[float]:
     """
     Run a steering drive at a given speed and offset.
 
@@ -80,6 +502,7 @@ def run_steer(base_speed: int, max_speed: int, offset: float = 0, skip_range: Li
         max_speed (int): The maximum speed to run the motors at (0-100).
         offset (float, optional): The offset to apply to the motors for steering (default 0)
         skip_range (List[int], optional): The range of speeds to skip when calculating an offset (default [-30, 30]) - Use False to disable
+        frame_id (int, optional): The frame the command was made from, reported by the motor writer (default None)
 
     Returns:
         List[float]: The final left and right speeds of the motors.
@@ -104,20 +527,21 @@ def run_steer(base_speed: int, max_speed: int, offset: float = 0, skip_range: Li
         left_speed = 40
     if ramp and right_speed < 30:
         right_speed = 40
-    run_tank(left_speed, right_speed)
+    run_tank(left_speed, right_speed, frame_id)
 
     return [left_speed, right_speed]
 
-def run_tank(left_speed: int, right_speed: int) -> None:
+def run_tank(left_speed: int, right_speed: int, frame_id: int = None) -> None:
     """
     Run a tank drive at a given speed.
 
     Args:
         left_speed (int): The speed to run the left motors at (-100 to 100).
         right_speed (int): The speed to run the right motors at (-100 to 100).
+        frame_id (int, optional): The frame the command was made from, reported by the motor writer.
     """
-    run([conf_tank["front_l"], conf_tank["back_l"]], left_speed)
-    run([conf_tank["front_r"], conf_tank["back_r"]], right_speed)
+    _preempt_move()
+    _output(("tank", left_speed, right_speed), frame_id)
 
 def run_tank_for_time(left_speed: int, right_speed: int, duration: float, brake: bool = True) -> None:
     """
@@ -130,9 +554,42 @@ def run_tank_for_time(left_speed: int, right_speed: int, duration: float, brake:
         brake (bool, optional): Whether to brake the motors (True) or just coast (False).
     """
     run_tank(left_speed, right_speed)
-    time.sleep(duration / 1000)
+    clock.sleep(duration / 1000)
     stop_all(brake)
 
+def run_tank_for_time_async(left_speed: int, right_speed: int, duration: float, brake: bool = True) -> TimedMove:
+    """
+    Run a tank drive at a given speed for a given duration, without waiting for it to finish.
+    The motors are stopped on a timer thread, unless another motor command (run_tank, run_steer, stop_all,
+    or another timed move) replaces it first.
+
+    Args:
+        left_speed (int): The speed to run the left motors at (-100 to 100).
+        right_speed (int): The speed to run the right motors at (-100 to 100).
+        duration (float): The duration to run the motors for (in milliseconds).
+        brake (bool, optional): Whether to brake the motors (True) or just coast (False) at the end.
+
+    Returns:
+        TimedMove: The move, which can be waited on or cancelled.
+    """
+    global current_move
+    run_tank(left_speed, right_speed)
+
+    move = TimedMove(left_speed, right_speed, duration, brake)
+    with move_lock:
+        current_move = move
+        move_stats["started"] += 1
+        move.timer.start()
+    return move
+
+def is_moving() -> bool:
+    """
+    Returns:
+        bool: Whether a timed move started by run_tank_for_time_async is still running.
+    """
+    move = current_move
+    return move is not None and not move.done()
+
 def stop(targets: Union[int, List[int]], brake: bool = False) -> None:
     """
     Stop one motor or multiple motors, either coasting or braking.
@@ -144,8 +601,7 @@ def stop(targets: Union[int, List[int]], brake: bool = False) -> None:
     if isinstance(targets, int):
         targets = [targets]
 
-    for target in targets:
-        motor(target).throttle = 0 if brake else None
+    _set_throttles({target: 0 if brake else None for target in targets})
 
 def stop_all(brake: bool = True) -> None:
     """
@@ -154,4 +610,5 @@ def stop_all(brake: bool = True) -> None:
     Args:
         brake (bool, optional): Whether to brake the motors (True) or just coast (False).
     """
-    stop([0, 1, 2, 3], brake)
+    _preempt_move()
+    _output(("stop", brake))
@@ -0,0 +1,205 @@
+from typing import Optional
+
+import helper_clock as clock
+from helper_cmps14 import CMPS14, CMPS14Sampler
+
+def bearing_error(target: float, current: float) -> float:
+    """
+    Returns:
+        float: The signed error from current to target bearing, wrapped to +-180. Positive means turn clockwise.
+    """
+    return (target - current + 180) % 360 - 180
+
+class RotationController:
+    """
+    Rotates the robot on the spot to a compass bearing, at a fixed control rate.
+
+    The rotation speed is proportional to the bearing error, minus a yaw rate term, so the robot slows down
+    (and brakes by reversing) as it approaches the target instead of overshooting. The robot has to stay
+    within tolerance for settle_cycles control cycles before the rotation counts as done.
+
+    When a CMPS14Sampler is running, the bearing and yaw rate come from its latest sample, so the loop doesn't read the bus itself.
+    """
+
+    def __init__(
+        self,
+        cmps: CMPS14,
+        motors,
+        sampler: Optional[CMPS14Sampler] = None,
+        rate: float = 50,
+        kp: float = 0.4,
+        kd: float = 0.05,
+        min_speed: int = 25,
+        max_speed: int = 50,
+        settle_cycles: int = 3,
+        log_interval: float = 0.25,
+    ) -> None:
+        """
+        Initialise the controller.
+
+        Args:
+            cmps (CMPS14): The compass.
+            motors: The motor module (helper_motorkit), used for run_tank and stop_all.
+            sampler (CMPS14Sampler, optional): The compass sampler, used while it is running. Defaults to None.
+            rate (float, optional): The control rate (Hz). Defaults to 50.
+            kp (float, optional): Speed per degree of error, added to min_speed. Defaults to 0.4.
+            kd (float, optional): Speed per degree/s of yaw rate, subtracted for damping. Defaults to 0.05.
+            min_speed (int, optional): The slowest speed that still turns the robot. Defaults to 25.
+            max_speed (int, optional): The fastest rotation speed. Defaults to 50.
+            settle_cycles (int, optional): Cycles in a row the error must be within tolerance to finish. Defaults to 3.
+            log_interval (float, optional): The shortest time between progress prints (s). Defaults to 0.25.
+        """
+        self.cmps = cmps
+        self.motors = motors
+        self.sampler = sampler
+        self.period = 1 / rate
+        self.kp = kp
+        self.kd = kd
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.settle_cycles = settle_cycles
+        self.log_interval = log_interval
+
+        self.history = []   # Report of each rotation, see rotate_to
+
+    def _read(self, last: Optional[tuple[float, float]]) -> tuple[float, float, float]:
+        """
+        Returns:
+            tuple[float, float, float]: The bearing, the yaw rate (degrees/s), and when the bearing was read.
+        """
+        if self.sampler is not None and self.sampler.running and self.sampler.count > 0:
+            sample = self.sampler.latest()
+            return sample["bearing"], sample["yaw_rate"], sample["time"]
+
+        bearing = self.cmps.read_bearing_16bit()
+        now = clock.now()
+        yaw_rate = 0
+        if last is not None and now > last[1]:
+            yaw_rate = bearing_error(bearing, last[0]) / (now - last[1])
+        return bearing, yaw_rate, now
+
+    def _speed(self, error: float, yaw_rate: float) -> int:
+        """
+        Returns:
+            int: The rotation speed, positive to turn clockwise.
+        """
+        command = self.kp * error - self.kd * yaw_rate
+        if command == 0:
+            return 0
+        speed = min(self.min_speed + abs(command), self.max_speed)
+        return round(speed if command > 0 else -speed)
+
+    def rotate_to(self, target_bearing: float, tolerance: float, timeout: float = 10, debug_prefix: str = "") -> bool:
+        """
+        Rotates to a bearing.
+
+        Args:
+            target_bearing (float): The bearing to rotate to.
+            tolerance (float): How close to the bearing counts as aligned (degrees).
+            timeout (float, optional): The longest time to rotate for (s). Defaults to 10.
+            debug_prefix (str, optional): The prefix of the progress prints. Defaults to "".
+
+        Returns:
+            bool: True if the robot settled within tolerance, False if it timed out.
+        """
+        target_bearing = target_bearing % 360
+
+        compass_reads = self.cmps.stats["snapshots"]
+        pwm_batch = getattr(self.motors, "pwm_batch", None)
+        motor_writes = pwm_batch.stats["transactions"] if pwm_batch is not None else 0
+        commands = 0
+
+        start_time = clock.now()
+        next_cycle = start_time
+        last_log = 0
+        last_reading = None
+        last_speed = None
+        start_error = None
+        direction = 0       # The sign of the rotation command the robot set off in, positive for clockwise
+        overshoot = 0
+        cycles = 0
+        settled_cycles = 0
+        settled = False
+
+        while clock.now() - start_time < timeout:
+            clock.sleep(max(0, next_cycle - clock.now()))
+            next_cycle += self.period
+            cycles += 1
+
+            bearing, yaw_rate, read_time = self._read(last_reading)
+            last_reading = (bearing, read_time)
+            error = bearing_error(target_bearing, bearing)
+            if start_error is None:
+                start_error = error
+            # How far past the target the robot has turned, against the direction it set off in.
+            # On a turn of about 180 degrees compass noise can flip the sign of the error (and the turn), so the direction
+            # is only fixed once the robot is within 90 degrees, and only errors within 90 degrees count
+            if error * direction < 0 and abs(error) <= 90:
+                overshoot = max(overshoot, abs(error))
+
+            if abs(error) < tolerance:
+                speed = 0
+                settled_cycles += 1
+                if settled_cycles >= self.settle_cycles:
+                    settled = True
+                    break
+            else:
+                speed = self._speed(error, yaw_rate)
+                settled_cycles = 0
+
+            # Only send a command when the speed changes, since every command is another I2C write
+            if speed != last_speed:
+                if speed == 0:
+                    self.motors.stop_all()
+                else:
+                    self.motors.run_tank(speed, -speed)
+                    if direction == 0 or abs(error) > 90:
+                        direction = 1 if speed > 0 else -1
+                last_speed = speed
+                commands += 1
+
+            if clock.now() - last_log > self.log_interval:
+                last_log = clock.now()
+                print(f"{debug_prefix}Bearing: {bearing}\tTarget: {target_bearing}\tError: {round(error, 1)}\tYaw rate: {round(yaw_rate)}\tSpeed: {speed}")
+
+        self.motors.stop_all()
+        commands += 1
+
+        report = {
+            "target": target_bearing,
+            "start_error": round(start_error or 0, 1),
+            "settled": settled,
+            "settle_time": round(clock.now() - start_time, 3),
+            "overshoot": round(overshoot, 1),
+            "cycles": cycles,
+            "compass_reads": self.cmps.stats["snapshots"] - compass_reads,
+            "motor_commands": commands,
+            "motor_writes": pwm_batch.stats["transactions"] - motor_writes if pwm_batch is not None else None,
+        }
+        self.history.append(report)
+
+        print(
+            f"{debug_prefix}{'FOUND' if settled else 'TIMEOUT'} Bearing: {bearing}\tTarget: {target_bearing}\tError: {round(error, 1)}"
+            f"\tTime: {report['settle_time']}s\tOvershoot: {report['overshoot']}\tCycles: {cycles}"
+            f"\tCompass reads: {report['compass_reads']}\tMotor commands: {commands}"
+        )
+        return settled
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The mean settle time, overshoot and bus use per rotation, for logging.
+        """
+        if len(self.history) == 0:
+            return "Rotations: 0"
+
+        count = len(self.history)
+        settled = sum(report["settled"] for report in self.history)
+        mean_time = sum(report["settle_time"] for report in self.history) / count
+        mean_overshoot = sum(report["overshoot"] for report in self.history) / count
+        mean_reads = sum(report["compass_reads"] for report in self.history) / count
+        mean_commands = sum(report["motor_commands"] for report in self.history) / count
+        return (
+            f"Rotations: {settled}/{count} settled | Time: {mean_time:.2f}s | Overshoot: {mean_overshoot:.1f}deg"
+            f" | Compass reads: {mean_reads:.0f} | Motor commands: {mean_commands:.0f}"
+        )
@@ -0,0 +1,268 @@
+import json
+import math
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple
+
+import helper_camerakit as ck
+
+FLOOR_COLOUR = (255, 255, 255)  # BGR
+LINE_COLOUR = (0, 0, 0)         # BGR
+
+class SimTrack:
+    """
+    A top-down track for the simulator: a floor texture, the centreline of the black line (for scoring),
+    and the walls and obstacles the ultrasonic sensors can see.
+
+    World coordinates are in mm, with x to the east and y to the north, and (0, 0) at the south west corner of the field.
+    Bearings are clockwise from north, like the compass.
+    """
+
+    def __init__(
+        self,
+        centreline: np.ndarray,
+        field_size: Tuple[float, float] = (1800, 1200),
+        line_width: float = 20,
+        obstacles: Optional[List[Tuple[float, float, float]]] = None,
+        mm_per_px: float = 1,
+        texture: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Args:
+            centreline (np.ndarray): The closed loop of the line, as an array of (x, y) points in mm, in driving order.
+            field_size (tuple[float, float], optional): The size of the walled field (mm). Defaults to (1800, 1200), 6x4 tiles.
+            line_width (float, optional): The width of the line (mm). Defaults to 20.
+            obstacles (list, optional): Round obstacles, as (x, y, radius) in mm. Defaults to None.
+            mm_per_px (float, optional): The texture resolution. Defaults to 1.
+            texture (np.ndarray, optional): A BGR floor texture covering the field at mm_per_px. Defaults to the line drawn on a white floor.
+        """
+        self.centreline = np.asarray(centreline, dtype=np.float64)
+        self.field_size = field_size
+        self.line_width = line_width
+        self.obstacles = [tuple(obstacle) for obstacle in (obstacles or [])]
+        self.mm_per_px = mm_per_px
+
+        # Segment start points, directions and lengths, for finding the nearest point on the line
+        self.segment_starts = self.centreline
+        self.segment_vectors = np.roll(self.centreline, -1, axis=0) - self.centreline
+        self.segment_lengths = np.linalg.norm(self.segment_vectors, axis=1)
+        self.segment_offsets = np.concatenate(([0], np.cumsum(self.segment_lengths)[:-1]))
+        self.length = self.segment_lengths.sum()
+
+        # Maps world points (x, y, 1) onto texture pixels (u, v, 1), with v going down from the north edge
+        self.world_to_texture = np.array([
+            [1 / mm_per_px, 0, 0],
+            [0, -1 / mm_per_px, field_size[1] / mm_per_px],
+            [0, 0, 1]
+        ])
+
+        if texture is None:
+            texture = np.full((int(round(field_size[1] / mm_per_px)), int(round(field_size[0] / mm_per_px)), 3), FLOOR_COLOUR, dtype=np.uint8)
+            self.draw_polyline(texture, self.centreline, line_width, LINE_COLOUR, closed=True)
+            for x, y, radius in self.obstacles:
+                cv2.circle(texture, self.to_texture((x, y)), int(round(radius / mm_per_px)), (30, 30, 30), -1)
+        self.texture = texture
+
+    @classmethod
+    def default(cls) -> "SimTrack":
+        """
+        Returns:
+            SimTrack: A rounded rectangle loop on a 6x4 tile field, with straights and 250mm radius corners.
+        """
+        return cls(rounded_rectangle((200, 200), (1600, 1000), 250))
+
+    @classmethod
+    def load(cls, path: str) -> "SimTrack":
+        """
+        Loads a track from a JSON file of {"centreline": [[x, y], ...], and optionally "field_size", "line_width", "obstacles",
+        "mm_per_px", and "texture" (the path of a top-down floor image covering the field)}.
+
+        Args:
+            path (str): The path of the JSON file.
+
+        Returns:
+            SimTrack: The track.
+        """
+        with open(path, "r") as json_file:
+            data = json.load(json_file)
+
+        texture = cv2.imread(data["texture"], cv2.IMREAD_COLOR) if "texture" in data else None
+        return cls(
+            data["centreline"],
+            field_size=tuple(data.get("field_size", (1800, 1200))),
+            line_width=data.get("line_width", 20),
+            obstacles=data.get("obstacles"),
+            mm_per_px=data.get("mm_per_px", 1),
+            texture=texture,
+        )
+
+    def to_texture(self, point: Tuple[float, float]) -> Tuple[int, int]:
+        u, v, _ = self.world_to_texture @ np.array([point[0], point[1], 1])
+        return int(round(u)), int(round(v))
+
+    def draw_polyline(self, texture: np.ndarray, points: np.ndarray, width: float, colour: Tuple[int, int, int], closed: bool = False) -> None:
+        """
+        Draws a line of a given width in mm onto a texture of this track.
+        """
+        pixels = np.array([self.to_texture(point) for point in points], dtype=np.int32)
+        cv2.polylines(texture, [pixels], closed, colour, max(1, int(round(width / self.mm_per_px))), cv2.LINE_AA)
+
+    def start_pose(self) -> Tuple[float, float, float]:
+        """
+        Returns:
+            tuple[float, float, float]: The x, y (mm) and bearing of the start of the line, facing along it.
+        """
+        dx, dy = self.segment_vectors[0]
+        return self.centreline[0][0], self.centreline[0][1], math.degrees(math.atan2(dx, dy)) % 360
+
+    def nearest(self, point: Tuple[float, float]) -> Tuple[float, float]:
+        """
+        Finds the nearest point on the centreline.
+
+        Args:
+            point (tuple[float, float]): The point (mm).
+
+        Returns:
+            float: The cross-track error (mm), positive when the point is to the right of the line.
+            float: How far along the line the nearest point is (mm), from the start.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        lengths_squared = np.maximum(self.segment_lengths ** 2, 1e-9)
+        t = np.clip(np.einsum("ij,ij->i", point - self.segment_starts, self.segment_vectors) / lengths_squared, 0, 1)
+        nearest = self.segment_starts + t[:, None] * self.segment_vectors
+        distances = np.linalg.norm(nearest - point, axis=1)
+        i = int(np.argmin(distances))
+
+        # The cross product is negative when the point is clockwise (to the right) of the segment direction
+        dx, dy = self.segment_vectors[i]
+        px, py = point - self.segment_starts[i]
+        side = -1 if dx * py - dy * px > 0 else 1
+        return side * distances[i], self.segment_offsets[i] + t[i] * self.segment_lengths[i]
+
+    def raycast(self, origin: Tuple[float, float], bearing: float, max_distance: float) -> float:
+        """
+        Finds the distance to the nearest wall or obstacle in a direction, like an ultrasonic sensor.
+
+        Args:
+            origin (tuple[float, float]): Where the ray starts (mm).
+            bearing (float): The direction of the ray, clockwise from north.
+            max_distance (float): The longest distance to look (mm).
+
+        Returns:
+            float: The distance to the first hit (mm), or max_distance if nothing is in range.
+        """
+        x, y = origin
+        dx, dy = math.sin(math.radians(bearing)), math.cos(math.radians(bearing))
+        hits = [max_distance]
+
+        # Walls of the field
+        width, height = self.field_size
+        if dx > 1e-9:
+            hits.append((width - x) / dx)
+        elif dx < -1e-9:
+            hits.append(-x / dx)
+        if dy > 1e-9:
+            hits.append((height - y) / dy)
+        elif dy < -1e-9:
+            hits.append(-y / dy)
+
+        # Round obstacles, from the nearest intersection of the ray and each circle
+        for ox, oy, radius in self.obstacles:
+            along = (ox - x) * dx + (oy - y) * dy
+            across_squared = (ox - x) ** 2 + (oy - y) ** 2 - along ** 2
+            if along > 0 and across_squared < radius ** 2:
+                hits.append(along - math.sqrt(radius ** 2 - across_squared))
+
+        return max(0, min(hits))
+
+    def image_to_world(self, pose: Tuple[float, float, float], cam_angle: float, camera_geometry: dict, camera_offset: float = 60, camera_height: Optional[float] = None) -> np.ndarray:
+        """
+        Args:
+            pose (tuple[float, float, float]): The robot's x, y (mm) and bearing.
+            cam_angle (float): The angle of the camera servo.
+            camera_geometry (dict): The camera_geometry section of config.json.
+            camera_offset (float, optional): How far the camera is in front of the wheel axle (mm). Defaults to 60.
+            camera_height (float, optional): The camera's height above the floor (mm). Defaults to height_mm from camera_geometry.
+
+        Returns:
+            np.ndarray: 3x3 homography from image pixels onto the floor in world coordinates (mm).
+        """
+        x, y, bearing = pose
+        sin_b, cos_b = math.sin(math.radians(bearing)), math.cos(math.radians(bearing))
+
+        # Image pixels -> floor relative to the camera (x right, y forwards) -> world
+        image_to_ground = ck.groundHomography(cam_angle, camera_geometry)
+        if camera_height is not None:
+            # Everything on the floor scales with the height of the camera
+            scale = camera_height / camera_geometry["height_mm"]
+            image_to_ground = np.diag([scale, scale, 1]) @ image_to_ground
+        ground_to_world = np.array([
+            [cos_b, sin_b, x + camera_offset * sin_b],
+            [-sin_b, cos_b, y + camera_offset * cos_b],
+            [0, 0, 1]
+        ])
+        return ground_to_world @ image_to_ground
+
+    def render_view(self, pose: Tuple[float, float, float], cam_angle: float, camera_geometry: dict, camera_offset: float = 60, size: Tuple[int, int] = (640, 480), camera_height: Optional[float] = None) -> np.ndarray:
+        """
+        Renders what the downward camera sees, by projecting the floor texture through the same pinhole model as ck.groundHomography.
+
+        Args:
+            pose (tuple[float, float, float]): The robot's x, y (mm) and bearing.
+            cam_angle (float): The angle of the camera servo.
+            camera_geometry (dict): The camera_geometry section of config.json.
+            camera_offset (float, optional): How far the camera is in front of the wheel axle (mm). Defaults to 60.
+            size (tuple[int, int], optional): The image size (width, height). Defaults to (640, 480).
+            camera_height (float, optional): The camera's height above the floor (mm). Defaults to height_mm from camera_geometry.
+
+        Returns:
+            np.ndarray: The BGR camera view.
+        """
+        image_to_texture = self.world_to_texture @ self.image_to_world(pose, cam_angle, camera_geometry, camera_offset, camera_height)
+        return cv2.warpPerspective(
+            self.texture, image_to_texture, size,
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=FLOOR_COLOUR,
+        )
+
+    def project(self, points: np.ndarray, pose: Tuple[float, float, float], cam_angle: float, camera_geometry: dict, camera_offset: float = 60) -> np.ndarray:
+        """
+        Projects world points on the floor into the camera view, e.g. to find where the line should be seen.
+
+        Args:
+            points (np.ndarray): World points as an array of (x, y) in mm.
+            pose, cam_angle, camera_geometry, camera_offset: As for render_view.
+
+        Returns:
+            np.ndarray: Image points as an array of (x, y). Points behind the camera are NaN.
+        """
+        world_to_image = np.linalg.inv(self.image_to_world(pose, cam_angle, camera_geometry, camera_offset))
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        projected = np.hstack((points, np.ones((len(points), 1)))) @ world_to_image.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            image_points = projected[:, :2] / projected[:, 2:]
+        image_points[projected[:, 2] <= 0] = np.nan
+        return image_points
+
+def rounded_rectangle(corner_a: Tuple[float, float], corner_b: Tuple[float, float], radius: float, step: float = 10) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: The points of a rounded rectangle loop (mm), clockwise from the middle of the west side, with arc points about step mm apart.
+    """
+    (x0, y0), (x1, y1) = corner_a, corner_b
+    # Corner centres and the bearing range of each arc, clockwise from the north west corner
+    corners = [
+        ((x0 + radius, y1 - radius), 270),
+        ((x1 - radius, y1 - radius), 0),
+        ((x1 - radius, y0 + radius), 90),
+        ((x0 + radius, y0 + radius), 180),
+    ]
+
+    # The straights are the segments between the arcs
+    points = [(x0, (y0 + y1) / 2)]
+    arc_steps = max(2, int(math.pi / 2 * radius / step))
+    for (cx, cy), start_bearing in corners:
+        for t in np.linspace(0, 1, arc_steps + 1):
+            angle = math.radians(start_bearing + 90 * t)
+            points.append((cx + radius * math.sin(angle), cy + radius * math.cos(angle)))
+    return np.array(points, dtype=np.float64)
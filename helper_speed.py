@@ -0,0 +1,140 @@
+import helper_clock as clock
+
+class SpeedScheduler:
+    """
+    Chooses the base speed of the line follower from how much the line ahead bends.
+
+    The speed is raised towards max_speed on straights, and lowered towards min_speed
+    when the line ahead curves, the robot is already rotating quickly, or an intersection is close,
+    while keeping within the configured acceleration limits.
+    """
+
+    def __init__(
+        self,
+        baseline_speed: float,
+        min_speed: float,
+        max_speed: float,
+        intersection_speed: float = None,
+        accel_limit: float = 40,
+        decel_limit: float = 150,
+        max_heading_change: float = 35,
+        max_yaw_rate: float = 90,
+    ) -> None:
+        """
+        Initialise the scheduler.
+
+        Args:
+            baseline_speed (float): The constant speed that would otherwise be used, shown in the summary for comparison.
+            min_speed (float): The speed used in the sharpest curves.
+            max_speed (float): The speed used on straights.
+            intersection_speed (float, optional): The highest speed allowed near intersections. Defaults to min_speed.
+            accel_limit (float, optional): Maximum speed increase per second. Defaults to 40.
+            decel_limit (float, optional): Maximum speed decrease per second. Defaults to 150.
+            max_heading_change (float, optional): Heading change between near and far scanlines (degrees) that counts as a full curve. Defaults to 35.
+            max_yaw_rate (float, optional): Yaw rate (degrees/s) that counts as a full curve. Defaults to 90.
+        """
+        self.baseline_speed = baseline_speed
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.intersection_speed = intersection_speed if intersection_speed is not None else min_speed
+        self.accel_limit = accel_limit
+        self.decel_limit = decel_limit
+        self.max_heading_change = max_heading_change
+        self.max_yaw_rate = max_yaw_rate
+
+        self.speed = min_speed
+        self.yaw_rate = 0
+        self.last_bearing = None
+        self.last_bearing_time = 0
+        self.last_update_time = None
+
+        # Integrated over time for the average speed
+        self.distance = 0
+        self.elapsed = 0
+
+    def observe_bearing(self, bearing: float, timestamp: float = None) -> None:
+        """
+        Updates the yaw rate estimate from a new compass bearing.
+
+        Args:
+            bearing (float): The compass bearing (0-359.9).
+            timestamp (float, optional): When the bearing was read. Defaults to now.
+        """
+        timestamp = timestamp if timestamp is not None else clock.now()
+        if self.last_bearing is not None and timestamp > self.last_bearing_time:
+            # Wrap the difference to +-180 so crossing north doesn't look like a fast spin
+            diff = (bearing - self.last_bearing + 180) % 360 - 180
+            rate = diff / (timestamp - self.last_bearing_time)
+            self.yaw_rate = 0.7 * self.yaw_rate + 0.3 * rate
+
+        self.last_bearing = bearing
+        self.last_bearing_time = timestamp
+
+    def set_yaw_rate(self, yaw_rate: float) -> None:
+        """
+        Sets the yaw rate directly, for when a filtered estimate is already available.
+
+        Args:
+            yaw_rate (float): Yaw rate in degrees per second.
+        """
+        self.yaw_rate = yaw_rate
+
+    def update(self, heading_change: float, intersection: bool = False, timestamp: float = None) -> float:
+        """
+        Calculates the base speed for this frame.
+
+        Args:
+            heading_change (float): Heading change between near and far scanlines (degrees), or None if unknown.
+            intersection (bool, optional): Whether an intersection or green turn is being handled. Defaults to False.
+            timestamp (float, optional): The time of this frame. Defaults to now.
+
+        Returns:
+            float: The base speed to drive at.
+        """
+        timestamp = timestamp if timestamp is not None else clock.now()
+        dt = timestamp - self.last_update_time if self.last_update_time is not None else 0
+        self.last_update_time = timestamp
+
+        # A long gap means the follower was paused (obstacles, red lines, etc.), so don't count it as driving
+        if dt > 0.5:
+            dt = 0
+            self.speed = self.min_speed
+
+        if heading_change is None:
+            severity = 1 # No look-ahead, so assume the worst
+        else:
+            severity = max(
+                min(abs(heading_change) / self.max_heading_change, 1),
+                min(abs(self.yaw_rate) / self.max_yaw_rate, 1),
+            )
+
+        target = self.max_speed - (self.max_speed - self.min_speed) * severity
+        if intersection:
+            target = min(target, self.intersection_speed)
+
+        if target > self.speed:
+            self.speed = min(target, self.speed + self.accel_limit * dt)
+        else:
+            self.speed = max(target, self.speed - self.decel_limit * dt)
+
+        self.distance += self.speed * dt
+        self.elapsed += dt
+        return float(self.speed)
+
+    def reset(self, speed: float = None) -> None:
+        """
+        Resets the current speed, for when another part of the program has taken control of the motors.
+
+        Args:
+            speed (float, optional): The speed to continue from. Defaults to min_speed.
+        """
+        self.speed = speed if speed is not None else self.min_speed
+        self.last_update_time = None
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: A summary of the scheduled driving for logging. Lap times are measured by the simulator (helper_devices.SimWorld).
+        """
+        average_speed = self.distance / self.elapsed if self.elapsed > 0 else 0
+        return f"Avg speed: {average_speed:.1f} (baseline {self.baseline_speed}) | Time: {self.elapsed:.1f}s"
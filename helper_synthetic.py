@@ -0,0 +1,506 @@
+import json
+import math
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple
+
+import helper_evac as evac
+from helper_simtrack import SimTrack
+
+# Frames are rendered at the camera's full size, but only the top VIEW_HEIGHT rows are used (see ck.processFrame)
+FRAME_SIZE = (640, 480)
+VIEW_HEIGHT = 429
+
+LINE_CAM_ANGLE = -64            # Camera servo angle while following the line
+EVAC_CAM_ANGLE = 7              # Camera servo angle in the evacuation zone
+
+LINE_WIDTH = 20                 # mm
+CAMERA_Y = 100                  # How far up the floor patch the camera is (mm), so it never sees past the edge
+MARKER_SIZE = 25                # Green markers and strips (mm)
+
+# Random room lighting on top of the vignette: the brightness, and the strength of the gradient across each axis
+BRIGHTNESS_RANGE = (0.85, 1.05)
+GRADIENT_RANGE = 0.12
+
+# Hues of the coloured things (OpenCV 0-180), narrowed to the hsv thresholds in config.json they should be found by
+RED_HUES = (0, 8)
+GREEN_HUES = (45, 70)
+OBSTACLE_HUES = (10, 22)
+
+LINE_KINDS = ["straight", "curve", "gap", "intersection", "red", "evac_entrance", "obstacle", "ramp"]
+KINDS = LINE_KINDS + ["evac"]
+
+class FrameGenerator:
+    """
+    Renders synthetic camera frames with ground truth, so the vision code can be benchmarked and checked without the robot or recorded frames.
+
+    Line frames are drawn top-down on a small patch of floor, then projected into the camera with SimTrack.render_view,
+    so they have the same perspective as the real camera. Evacuation zone frames are drawn straight into the image.
+    Every frame is lit by the same vignette (like the robot's own lights, which calibration_map removes) and a random
+    brightness and gradient (like room lighting, which it doesn't).
+
+    The same seed always gives the same frames.
+    """
+
+    def __init__(self, camera_geometry: dict, seed: int = 0, vignette: float = 0.3, noise: float = 2, hsv_thresholds: Optional[dict] = None) -> None:
+        """
+        Args:
+            camera_geometry (dict): The camera_geometry section of config.json.
+            seed (int, optional): The random seed. Defaults to 0.
+            vignette (float, optional): How much darker the corners are than the centre (0-1). Defaults to 0.3.
+            noise (float, optional): The standard deviation of the pixel noise. Defaults to 2.
+            hsv_thresholds (dict, optional): The hsv thresholds the colours are drawn inside, from load_hsv_thresholds. Defaults to those in config.json.
+        """
+        self.camera_geometry = camera_geometry
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+        self.hsv_thresholds = hsv_thresholds if hsv_thresholds is not None else load_hsv_thresholds()
+
+        # The darkest and brightest the lighting can make a pixel, so colours can be kept inside their thresholds
+        self.gain_range = ((1 - vignette) * BRIGHTNESS_RANGE[0] * (1 - 2 * GRADIENT_RANGE), BRIGHTNESS_RANGE[1] * (1 + 2 * GRADIENT_RANGE))
+
+        width, height = FRAME_SIZE
+        x, y = np.meshgrid(np.linspace(-1, 1, width), np.linspace(-1, 1, height))
+        self.gradient_x = x
+        self.gradient_y = y
+        self.vignette = 1 - vignette * (x ** 2 + y ** 2) / 2
+
+    # --------
+    # LIGHTING
+    # --------
+    def _light(self, image: np.ndarray, brightness: float, gradient: Tuple[float, float]) -> np.ndarray:
+        gain = self.vignette * brightness * (1 + gradient[0] * self.gradient_x + gradient[1] * self.gradient_y)
+        lit = image.astype(np.float32) * gain[:, :, None]
+        if self.noise > 0:
+            lit += self.rng.normal(0, self.noise, lit.shape).astype(np.float32)
+        return np.clip(lit, 0, 255).astype(np.uint8)
+
+    def calibration_data(self) -> dict:
+        """
+        Returns:
+            dict: A calibration.json for the generated frames: the white maps of a white floor under the vignette, as calibrate_white.py would measure them.
+        """
+        white = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), 255, dtype=np.uint8)
+        gray = cv2.cvtColor((white * self.vignette[:, :, None]).astype(np.uint8)[0:VIEW_HEIGHT], cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+        return {
+            "calibration_value_w": float(gray.mean()),
+            "calibration_map_w": gray.tolist(),
+            "calibration_value_rescue_w": float(gray.mean()),
+            "calibration_map_rescue_w": gray.tolist(),
+        }
+
+    # -----------
+    # LINE FRAMES
+    # -----------
+    def _floor(self) -> SimTrack:
+        """
+        Returns:
+            SimTrack: A blank 400mm square of floor. The line runs north up the middle (x = 200), and the camera starts CAMERA_Y up it.
+        """
+        tone = int(self.rng.integers(235, 256))
+        texture = np.full((1600, 1600, 3), tone, dtype=np.uint8)
+        return SimTrack(np.array([(200, 0), (200, 400)]), field_size=(400, 400), mm_per_px=0.25, texture=texture)
+
+    def _polygon(self, floor: SimTrack, points: List[Tuple[float, float]], colour: Tuple[int, int, int]) -> None:
+        pixels = np.array([floor.to_texture(point) for point in points], dtype=np.int32)
+        cv2.fillPoly(floor.texture, [pixels], colour, cv2.LINE_AA)
+
+    def _rectangle(self, floor: SimTrack, x0: float, y0: float, x1: float, y1: float, colour: Tuple[int, int, int]) -> None:
+        self._polygon(floor, [(x0, y0), (x1, y0), (x1, y1), (x0, y1)], colour)
+
+    def _black(self) -> Tuple[int, int, int]:
+        tone = int(self.rng.integers(10, 45))
+        return (tone, tone, tone)
+
+    def _colour(self, hues: Tuple[int, int], *thresholds: str) -> Tuple[int, int, int]:
+        """
+        Picks a colour that stays inside every one of the named hsv thresholds under any of the lighting,
+        so the frames test the detectors rather than the colour constants.
+
+        Args:
+            hues (tuple[int, int]): The range of hues to pick from.
+            thresholds (str): The names of the thresholds, from load_hsv_thresholds.
+
+        Returns:
+            tuple[int, int, int]: The BGR colour, before lighting.
+        """
+        lower = np.max([self.hsv_thresholds[name][0] for name in thresholds], axis=0)
+        upper = np.min([self.hsv_thresholds[name][1] for name in thresholds], axis=0)
+
+        # Lighting scales all the channels, so it changes the value but not the saturation (apart from noise)
+        s_margin = (upper[1] - lower[1]) * 0.2
+        v_low = (lower[2] + 5) / self.gain_range[0]
+        v_high = (upper[2] - 5) / self.gain_range[1]
+        if v_low > v_high:
+            v_low = v_high = (lower[2] + upper[2]) / 2
+
+        hsv = np.uint8([[[
+            self.rng.integers(max(hues[0], lower[0]), min(hues[1], upper[0]) + 1),
+            self.rng.uniform(lower[1] + s_margin, upper[1] - s_margin),
+            self.rng.uniform(v_low, v_high),
+        ]]])
+        return tuple(int(c) for c in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0, 0])
+
+    def _green(self, *thresholds: str) -> Tuple[int, int, int]:
+        return self._colour(GREEN_HUES, "green", *thresholds)
+
+    def _red(self, *thresholds: str) -> Tuple[int, int, int]:
+        return self._colour(RED_HUES, "red", *thresholds)
+
+    def _arc(self, start: Tuple[float, float], radius: float, direction: str, angle: float, step: float = 2) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The points of an arc starting north from start and turning left or right by angle (degrees).
+        """
+        sign = 1 if direction == "right" else -1
+        centre = (start[0] + sign * radius, start[1])
+        steps = max(2, int(math.radians(angle) * radius / step))
+        bearings = np.radians(np.linspace(0, angle, steps))
+        # The bearing along the arc goes from north, and the point is radius from the centre at right angles to it
+        return np.stack((centre[0] - sign * radius * np.cos(bearings), centre[1] + radius * np.sin(bearings)), axis=1)
+
+    def line_frame(self, kind: Optional[str] = None) -> Tuple[np.ndarray, dict]:
+        """
+        Renders a line following frame.
+
+        Args:
+            kind (str, optional): One of LINE_KINDS. Defaults to a random one.
+
+        Returns:
+            np.ndarray: The raw frame, as 4 channel RGBX like Picamera2's XBGR8888.
+            dict: The ground truth: {
+                kind: The kind of frame,
+                turn: What the robot should do: "straight", "left", "right", "u-turn", "stop" or "evac",
+                line_x: Where the followed line crosses the bottom row of the view (px), or None,
+                line_angle: The angle of the followed line at the bottom of the view, clockwise from vertical (degrees), or None,
+                cam_angle: The camera servo angle,
+                ...and the details of the kind (curve, gap, branches, green, strip, obstacle, ramp)
+            }
+        """
+        kind = kind if kind is not None else LINE_KINDS[self.rng.integers(len(LINE_KINDS))]
+        floor = self._floor()
+        truth = {"kind": kind, "turn": "straight"}
+
+        # The robot is near the line, facing roughly along it
+        offset = float(self.rng.uniform(-20, 20))
+        bearing = float(self.rng.uniform(-15, 15))
+        pose = (200 + offset, CAMERA_Y, bearing)
+        # Where the scene's feature is, 55-85mm ahead of the camera, inside the 11-120mm it sees
+        feature_y = CAMERA_Y + float(self.rng.uniform(55, 85))
+        line_colour = self._black()
+        path = np.array([(200, 0), (200, 400)], dtype=np.float64)
+
+        if kind == "straight":
+            floor.draw_polyline(floor.texture, path, LINE_WIDTH, line_colour)
+
+        elif kind == "curve":
+            direction = ["left", "right"][self.rng.integers(2)]
+            radius = float(self.rng.uniform(100, 300))
+            start_y = CAMERA_Y + float(self.rng.uniform(20, 70))
+            path = np.vstack(([(200, 0)], self._arc((200, start_y), radius, direction, 120)))
+            floor.draw_polyline(floor.texture, path, LINE_WIDTH, line_colour)
+            truth["curve"] = {"direction": direction, "radius": round(radius, 1)}
+
+        elif kind == "gap":
+            length = float(self.rng.uniform(30, 100))
+            floor.draw_polyline(floor.texture, np.array([(200, 0), (200, feature_y - length / 2)]), LINE_WIDTH, line_colour)
+            floor.draw_polyline(floor.texture, np.array([(200, feature_y + length / 2), (200, 400)]), LINE_WIDTH, line_colour)
+            truth["gap"] = {"length": round(length, 1)}
+
+        elif kind == "intersection":
+            shape = ["4-way", "3-way-left", "3-way-right", "T"][self.rng.integers(4)]
+            branches = {
+                "4-way": ["left", "right", "straight"],
+                "3-way-left": ["left", "straight"],
+                "3-way-right": ["right", "straight"],
+                "T": ["left", "right"],
+            }[shape]
+
+            floor.draw_polyline(floor.texture, np.array([(200, 0), (200, feature_y)]), LINE_WIDTH, line_colour)
+            if "straight" in branches:
+                floor.draw_polyline(floor.texture, np.array([(200, feature_y), (200, 400)]), LINE_WIDTH, line_colour)
+            if "left" in branches:
+                floor.draw_polyline(floor.texture, np.array([(200, feature_y), (0, feature_y)]), LINE_WIDTH, line_colour)
+            if "right" in branches:
+                floor.draw_polyline(floor.texture, np.array([(200, feature_y), (400, feature_y)]), LINE_WIDTH, line_colour)
+
+            # Markers before the crossing count, on the side of a branch. A T always has at least one
+            sides = [side for side in ["left", "right"] if side in branches]
+            markers = [side for side in sides if self.rng.random() < 0.5]
+            if shape == "T" and len(markers) == 0:
+                markers = [sides[self.rng.integers(2)]]
+            # Markers after the crossing don't count (they are for coming the other way)
+            distractors = [side for side in sides if "straight" in branches and self.rng.random() < 0.3]
+
+            gap = 2
+            near = LINE_WIDTH / 2 + gap
+            for side, after in [(side, False) for side in markers] + [(side, True) for side in distractors]:
+                sign = -1 if side == "left" else 1
+                x0 = 200 + sign * near
+                y0 = feature_y + (near if after else -near)
+                self._rectangle(floor, x0, y0, x0 + sign * MARKER_SIZE, y0 + (MARKER_SIZE if after else -MARKER_SIZE), self._green())
+
+            if len(markers) == 2:
+                truth["turn"] = "u-turn"
+            elif len(markers) == 1:
+                truth["turn"] = markers[0]
+            truth["intersection"] = {"shape": shape, "branches": branches, "green": markers, "green_after": distractors}
+            if truth["turn"] == "left":
+                path = np.array([(200, 0), (200, feature_y), (0, feature_y)])
+            elif truth["turn"] == "right":
+                path = np.array([(200, 0), (200, feature_y), (400, feature_y)])
+
+        elif kind == "red":
+            floor.draw_polyline(floor.texture, np.array([(200, 0), (200, feature_y)]), LINE_WIDTH, line_colour)
+            self._rectangle(floor, 0, feature_y - MARKER_SIZE / 2, 400, feature_y + MARKER_SIZE / 2, self._red())
+            truth["turn"] = "stop"
+
+        elif kind == "evac_entrance":
+            strip = ["silver", "black"][self.rng.integers(2)]
+            floor.draw_polyline(floor.texture, np.array([(200, 0), (200, feature_y)]), LINE_WIDTH, line_colour)
+            if strip == "silver":
+                # Reflective tape: bright, with streaks from the reflections
+                self._rectangle(floor, 0, feature_y - MARKER_SIZE / 2, 400, feature_y + MARKER_SIZE / 2, (185, 185, 190))
+                for _ in range(6):
+                    streak_x = float(self.rng.uniform(0, 400))
+                    tone = int(self.rng.integers(120, 250))
+                    self._rectangle(floor, streak_x, feature_y - MARKER_SIZE / 2, streak_x + 8, feature_y + MARKER_SIZE / 2, (tone, tone, tone))
+            else:
+                self._rectangle(floor, 0, feature_y - MARKER_SIZE / 2, 400, feature_y + MARKER_SIZE / 2, line_colour)
+            truth["turn"] = "evac"
+            truth["strip"] = strip
+
+        elif kind == "obstacle":
+            floor.draw_polyline(floor.texture, path, LINE_WIDTH, line_colour)
+            size = float(self.rng.uniform(50, 100))
+            obstacle_y = feature_y + 20
+            colour = self._colour(OBSTACLE_HUES, "obstacle")
+            self._rectangle(floor, 200 - size / 2, obstacle_y, 200 + size / 2, obstacle_y + size, colour)
+            truth["obstacle"] = {"distance": round(obstacle_y - CAMERA_Y, 1), "size": round(size, 1)}
+
+        elif kind == "ramp":
+            floor.draw_polyline(floor.texture, path, LINE_WIDTH, line_colour)
+            truth["ramp"] = {"direction": ["up", "down"][self.rng.integers(2)], "angle": int(self.rng.integers(10, 26)), "distance": round(feature_y - CAMERA_Y, 1)}
+
+        else:
+            raise ValueError(f"Unknown line frame kind '{kind}'")
+
+        view = floor.render_view(pose, LINE_CAM_ANGLE, self.camera_geometry, camera_offset=0, size=FRAME_SIZE)
+        if kind == "ramp":
+            view = self._ramp_view(floor, pose, truth["ramp"], view)
+
+        truth.update(self._line_position(floor, path, pose))
+        truth["cam_angle"] = LINE_CAM_ANGLE
+        return self._finish(view, truth)
+
+    def _ramp_view(self, floor: SimTrack, pose: Tuple[float, float, float], ramp: dict, view: np.ndarray) -> np.ndarray:
+        """
+        Renders the floor beyond the bottom of the ramp tilted, and puts it above the flat floor in the view.
+        """
+        distance = ramp["distance"]
+        angle = math.radians(ramp["angle"] if ramp["direction"] == "up" else -ramp["angle"])
+        height = self.camera_geometry["height_mm"]
+        # The camera's height above the ramp surface, and where the point below it is along the surface from the bottom of the ramp
+        ramp_height = height * math.cos(angle) + distance * math.sin(angle)
+        foot = -distance * math.cos(angle) + height * math.sin(angle)
+
+        sin_b, cos_b = math.sin(math.radians(pose[2])), math.cos(math.radians(pose[2]))
+        ramp_start = (pose[0] + distance * sin_b, pose[1] + distance * cos_b)
+        ramp_pose = (ramp_start[0] + foot * sin_b, ramp_start[1] + foot * cos_b, pose[2])
+        ramp_view = floor.render_view(ramp_pose, LINE_CAM_ANGLE - round(math.degrees(angle)), self.camera_geometry, camera_offset=0, size=FRAME_SIZE, camera_height=ramp_height)
+
+        # The bottom of the ramp is a horizontal row in the image, since the camera doesn't roll
+        edge_row = int(np.clip(floor.project([ramp_start], pose, LINE_CAM_ANGLE, self.camera_geometry, camera_offset=0)[0][1], 0, FRAME_SIZE[1]))
+        view[:edge_row] = ramp_view[:edge_row]
+        return view
+
+    def _line_position(self, floor: SimTrack, path: np.ndarray, pose: Tuple[float, float, float]) -> dict:
+        """
+        Returns:
+            dict: {line_x, line_angle} of the followed path at the bottom of the view, from projecting it into the image.
+        """
+        # Resample the path densely, so the bottom row falls between two close points
+        dense = []
+        for a, b in zip(path[:-1], path[1:]):
+            steps = max(2, int(np.linalg.norm(b - a)))
+            dense.extend(a + (b - a) * t for t in np.linspace(0, 1, steps, endpoint=False))
+        dense.append(path[-1])
+        points = floor.project(np.array(dense), pose, LINE_CAM_ANGLE, self.camera_geometry, camera_offset=0)
+
+        bottom = VIEW_HEIGHT - 1
+        for a, b in zip(points[:-1], points[1:]):
+            if np.isnan(a).any() or np.isnan(b).any():
+                continue
+            if a[1] >= bottom >= b[1] and a[1] != b[1]:
+                t = (a[1] - bottom) / (a[1] - b[1])
+                x = a[0] + (b[0] - a[0]) * t
+                if 0 <= x < FRAME_SIZE[0]:
+                    return {"line_x": round(float(x), 1), "line_angle": round(math.degrees(math.atan2(b[0] - a[0], a[1] - b[1])), 1)}
+        return {"line_x": None, "line_angle": None}
+
+    # -----------
+    # EVAC FRAMES
+    # -----------
+    def evac_frame(self) -> Tuple[np.ndarray, dict]:
+        """
+        Renders a frame inside the evacuation zone: the room above the walls, the walls, the floor, victims and rescue blocks.
+
+        Returns:
+            np.ndarray: The raw frame, as 4 channel RGBX like Picamera2's XBGR8888.
+            dict: The ground truth: {
+                kind: "evac",
+                victims: [{x, y, radius, kind ("silver" or "black")}] in view pixels,
+                blocks: [{rect (x, y, w, h), colour ("red" or "green")}] in view pixels,
+                wall_bottom: The row of the bottom of the walls, at each 40px column of the view,
+                cam_angle: The camera servo angle
+            }
+        """
+        width, height = FRAME_SIZE
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+
+        # The room outside the zone, then the walls, whose bottom edge slopes like a corner seen in perspective
+        room_tone = int(self.rng.integers(40, 120))
+        image[:] = (room_tone, room_tone, room_tone)
+        for _ in range(8):
+            x, y = int(self.rng.integers(0, width)), int(self.rng.integers(0, 80))
+            tone = int(self.rng.integers(0, 200))
+            cv2.rectangle(image, (x, y), (x + int(self.rng.integers(20, 120)), y + int(self.rng.integers(10, 60))), (tone, tone, tone), -1)
+
+        wall_top = int(self.rng.integers(40, 90))
+        wall_bottom_left, wall_bottom_right = int(self.rng.integers(110, 190)), int(self.rng.integers(110, 190))
+        wall_tone = int(self.rng.integers(215, 245))
+        floor_tone = int(self.rng.integers(225, 256))
+        columns = np.arange(width)
+        wall_bottom = np.interp(columns, [0, width - 1], [wall_bottom_left, wall_bottom_right]).astype(int)
+        rows = np.arange(height)[:, None]
+        image[(rows >= wall_top) & (rows < wall_bottom[None, :])] = (wall_tone, wall_tone, wall_tone)
+        image[rows >= wall_bottom[None, :]] = (floor_tone, floor_tone, floor_tone)
+        # The corner between the walls and the floor is a little darker
+        cv2.polylines(image, [np.stack((columns, wall_bottom), axis=1).astype(np.int32)], False, (wall_tone - 40,) * 3, 2)
+
+        blocks = []
+        for colour in [colour for colour in ["red", "green"] if self.rng.random() < 0.4]:
+            block_width, block_height = int(self.rng.integers(110, 220)), int(self.rng.integers(90, 160))
+            x = 0 if colour == "red" else width - block_width
+            y = int(self.rng.integers(wall_bottom.max() - 20, VIEW_HEIGHT - block_height))
+            bgr = self._red("rescue_block") if colour == "red" else self._green("rescue_block")
+            cv2.rectangle(image, (x, y), (x + block_width - 1, y + block_height - 1), bgr, -1)
+            blocks.append({"rect": [x, y, block_width, block_height], "colour": colour})
+
+        # Victims are bigger the closer (lower) they are, like the height bars in helper_evac
+        victims = []
+        bar_lines = evac.height_bar_lines(VIEW_HEIGHT)
+        for _ in range(int(self.rng.integers(1, 5))):
+            for _attempt in range(20):
+                y = int(self.rng.integers(wall_bottom.max() + 15, VIEW_HEIGHT - 10))
+                bar = next(i for i, top in enumerate(bar_lines) if y >= top)
+                radius = int(evac.HEIGHT_BAR_MIN_RADIUS[bar] + self.rng.integers(6, 14))
+                x = int(self.rng.integers(radius, width - radius))
+                overlaps = any(math.hypot(x - v["x"], y - v["y"]) < radius + v["radius"] + 10 for v in victims)
+                overlaps = overlaps or any(b["rect"][0] - radius < x < b["rect"][0] + b["rect"][2] + radius for b in blocks)
+                if not overlaps and y - radius > wall_bottom[x]:
+                    break
+            else:
+                continue
+
+            kind = "silver" if self.rng.random() < 0.5 else "black"
+            self._ball(image, (x, y), radius, kind)
+            victims.append({"x": x, "y": y, "radius": radius, "kind": kind})
+
+        truth = {
+            "kind": "evac",
+            "victims": victims,
+            "blocks": blocks,
+            "wall_bottom": [int(wall_bottom[x:x + 40].max()) for x in range(0, width, 40)],
+            "cam_angle": EVAC_CAM_ANGLE,
+        }
+        return self._finish(image, truth)
+
+    def _ball(self, image: np.ndarray, centre: Tuple[int, int], radius: int, kind: str) -> None:
+        """
+        Draws a victim: a black ball with a small highlight, or a silver ball with a bright highlight and a dark reflection of the floor's edge.
+        """
+        x, y = centre
+        # A soft shadow on the floor
+        cv2.ellipse(image, (x, y + int(radius * 0.9)), (radius, max(2, radius // 4)), 0, 0, 360, (150, 150, 150), -1, cv2.LINE_AA)
+        if kind == "black":
+            cv2.circle(image, centre, radius, self._black(), -1, cv2.LINE_AA)
+            cv2.circle(image, (x - radius // 3, y - radius // 3), max(1, radius // 6), (120, 120, 120), -1, cv2.LINE_AA)
+        else:
+            yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+            distance = np.sqrt(xx ** 2 + yy ** 2) / radius
+            mask = distance <= 1
+            # Bright in the middle, darker towards the rim, with a dark band where it reflects the ground
+            shade = 230 - 110 * distance ** 2
+            shade[(yy > radius * 0.2) & (yy < radius * 0.45)] -= 70
+            y0, x0 = y - radius, x - radius
+            region = image[max(0, y0):y + radius + 1, max(0, x0):x + radius + 1]
+            patch_mask = mask[max(0, -y0):max(0, -y0) + region.shape[0], max(0, -x0):max(0, -x0) + region.shape[1]]
+            patch_shade = shade[max(0, -y0):max(0, -y0) + region.shape[0], max(0, -x0):max(0, -x0) + region.shape[1]]
+            region[patch_mask] = np.clip(patch_shade[patch_mask], 0, 255)[:, None].astype(np.uint8)
+            cv2.circle(image, centre, radius, (70, 70, 70), 2, cv2.LINE_AA)
+            cv2.circle(image, (x - radius // 3, y - radius // 3), max(1, radius // 5), (255, 255, 255), -1, cv2.LINE_AA)
+
+    # ------
+    # FRAMES
+    # ------
+    def _finish(self, view: np.ndarray, truth: dict) -> Tuple[np.ndarray, dict]:
+        brightness = float(self.rng.uniform(*BRIGHTNESS_RANGE))
+        gradient = (float(self.rng.uniform(-GRADIENT_RANGE, GRADIENT_RANGE)), float(self.rng.uniform(-GRADIENT_RANGE, GRADIENT_RANGE)))
+        truth["lighting"] = {"brightness": round(brightness, 3), "gradient": [round(g, 3) for g in gradient]}
+        lit = self._light(view, brightness, gradient)
+        return cv2.cvtColor(lit, cv2.COLOR_BGR2RGBA), truth
+
+    def frame(self, kind: Optional[str] = None) -> Tuple[np.ndarray, dict]:
+        """
+        Args:
+            kind (str, optional): One of KINDS. Defaults to a random one.
+
+        Returns:
+            np.ndarray: The raw frame, as 4 channel RGBX like Picamera2's XBGR8888.
+            dict: The ground truth, see line_frame and evac_frame.
+        """
+        kind = kind if kind is not None else KINDS[self.rng.integers(len(KINDS))]
+        return self.evac_frame() if kind == "evac" else self.line_frame(kind)
+
+    def corpus(self, count: int, kinds: Optional[List[str]] = None) -> List[Tuple[str, np.ndarray, dict]]:
+        """
+        Renders a fixed set of frames, cycling through the kinds so every kind is covered.
+
+        Args:
+            count (int): The number of frames.
+            kinds (list[str], optional): The kinds to render. Defaults to KINDS.
+
+        Returns:
+            list[tuple[str, np.ndarray, dict]]: The name, raw frame and ground truth of each frame.
+        """
+        kinds = kinds if kinds is not None else KINDS
+        frames = []
+        for i in range(count):
+            kind = kinds[i % len(kinds)]
+            frame, truth = self.frame(kind)
+            frames.append((f"{i:05d}_{kind}", frame, truth))
+        return frames
+
+def load_camera_geometry(path: str = "config.json") -> dict:
+    """
+    Returns:
+        dict: The camera_geometry section of config.json.
+    """
+    with open(path, "r") as json_file:
+        return json.load(json_file)["camera_geometry"]
+
+def load_hsv_thresholds(path: str = "config.json") -> dict:
+    """
+    Returns:
+        dict: The red, green, obstacle and rescue_block hsv thresholds of config.json, as [lower, upper].
+    """
+    with open(path, "r") as json_file:
+        config_data = json.load(json_file)
+    return {
+        "red": config_data["red_hsv_threshold"],
+        "green": config_data["green_turn_hsv_threshold"],
+        "obstacle": config_data["obstacle_hsv_threshold"],
+        "rescue_block": config_data["rescue_block_hsv_threshold"],
+    }
@@ -0,0 +1,171 @@
+import time
+import threading
+import numpy as np
+import pigpio
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+# Speed of sound, as cm per microsecond of echo pulse (there and back)
+CM_PER_US = 0.0343 / 2
+
+class UltrasonicService:
+    """
+    Measures every ultrasonic sensor from one background thread, using pigpio edge callbacks to time the echo pulses
+    with microsecond ticks instead of busy-waiting.
+
+    The sensors are triggered one at a time on a fixed schedule, so one sensor's ping can't be heard by another.
+    Each sensor's latest distances are median filtered and published with a timestamp, so reading a distance never waits.
+    """
+
+    def __init__(self, sensors: Dict[str, Tuple[int, int]], interval: float = 0.03, max_distance: float = 100, window: int = 5, stale_after: float = 0.25, pi: Optional[pigpio.pi] = None) -> None:
+        """
+        Initialise the service and start measuring.
+
+        Args:
+            sensors (dict): The (trigger, echo) GPIO pins of each sensor, by name.
+            interval (float, optional): The time between pings (s). Each sensor is pinged every interval * number of sensors.
+                                        Must be longer than the echo from max_distance. Defaults to 0.03.
+            max_distance (float, optional): The distance reported when there is no echo (cm). Defaults to 100.
+            window (int, optional): The number of readings in the median filter. Defaults to 5.
+            stale_after (float, optional): A reading older than this is stale (s). Defaults to 0.25.
+            pi (pigpio.pi, optional): The pigpio connection to use. Defaults to a new connection to the local daemon.
+        """
+        self.own_pi = pi is None
+        self.pi = pigpio.pi() if pi is None else pi
+        if not self.pi.connected:
+            raise RuntimeError("Could not connect to the pigpio daemon (is pigpiod running?)")
+
+        self.sensors = sensors
+        self.interval = interval
+        self.max_distance = max_distance
+        self.stale_after = stale_after
+
+        self.history = {name: deque(maxlen=window) for name in sensors}
+        self.rise_ticks = {name: None for name in sensors}
+        self.pending = {name: False for name in sensors}    # Waiting for the echo of a ping
+        # Replaced as a whole so readers always see a matching distance and timestamp
+        self.readings = {name: {"distance": None, "raw": None, "time": 0} for name in sensors}
+        self.new_reading = threading.Condition()
+
+        self.callbacks = []
+        for name, (trigger, echo) in sensors.items():
+            self.pi.set_mode(trigger, pigpio.OUTPUT)
+            self.pi.write(trigger, 0)
+            self.pi.set_mode(echo, pigpio.INPUT)
+            self.callbacks.append(self.pi.callback(echo, pigpio.EITHER_EDGE, lambda gpio, level, tick, name=name: self._edge(name, level, tick)))
+
+        self.stats = {name: {"pings": 0, "echoes": 0, "timeouts": 0} for name in sensors}
+
+        self.running = True
+        self.thread = threading.Thread(target=self.update, args=(), daemon=True)
+        self.thread.start()
+
+    def _edge(self, name: str, level: int, tick: int) -> None:
+        """
+        Called by pigpio on each edge of an echo pin, with the tick (us) of the edge.
+        """
+        if level == 1:
+            self.rise_ticks[name] = tick
+        elif level == 0 and self.rise_ticks[name] is not None and self.pending[name]:
+            pulse = pigpio.tickDiff(self.rise_ticks[name], tick)
+            self.rise_ticks[name] = None
+            self.pending[name] = False
+            self.stats[name]["echoes"] += 1
+            self._publish(name, min(pulse * CM_PER_US, self.max_distance))
+
+    def _publish(self, name: str, distance: float) -> None:
+        history = self.history[name]
+        history.append(distance)
+        with self.new_reading:
+            self.readings[name] = {
+                "distance": float(np.median(history)),
+                "raw": distance,
+                "time": time.time(),
+            }
+            self.new_reading.notify_all()
+
+    def update(self) -> None:
+        next_ping_time = time.time()
+
+        while self.running:
+            for name, (trigger, _) in self.sensors.items():
+                if not self.running:
+                    return
+                time.sleep(max(0, next_ping_time - time.time()))
+                next_ping_time = max(next_ping_time + self.interval, time.time())
+
+                # The last ping of this sensor never got an echo back
+                if self.pending[name]:
+                    self.stats[name]["timeouts"] += 1
+                    self._publish(name, self.max_distance)
+
+                self.rise_ticks[name] = None
+                self.pending[name] = True
+                self.stats[name]["pings"] += 1
+                self.pi.gpio_trigger(trigger, 10, 1)
+
+    def reading(self, name: str) -> dict:
+        """
+        Args:
+            name (str): The name of the sensor.
+
+        Returns:
+            dict: The latest reading, as {distance (median filtered, cm), raw (cm), time, age (s), stale}.
+                  distance is None before the first reading.
+        """
+        reading = self.readings[name]
+        age = time.time() - reading["time"]
+        return {**reading, "age": age, "stale": reading["distance"] is None or age > self.stale_after}
+
+    def distance(self, name: str) -> float:
+        """
+        Args:
+            name (str): The name of the sensor.
+
+        Returns:
+            float: The median filtered distance (cm), or max_distance if there is no fresh reading.
+        """
+        reading = self.reading(name)
+        return self.max_distance if reading["stale"] else reading["distance"]
+
+    def wait_for_reading(self, name: str, timeout: float) -> dict:
+        """
+        Waits for a reading taken after this was called.
+
+        Args:
+            name (str): The name of the sensor.
+            timeout (float): The longest time to wait (s).
+
+        Returns:
+            dict: The latest reading, as from reading(), which may be old if it timed out.
+        """
+        start_time = time.time()
+        with self.new_reading:
+            while self.running and self.readings[name]["time"] <= start_time and time.time() - start_time < timeout:
+                self.new_reading.wait(timeout - (time.time() - start_time))
+        return self.reading(name)
+
+    def stop(self) -> None:
+        """
+        Stops measuring and releases the pins.
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.thread.join(1)
+        for callback in self.callbacks:
+            callback.cancel()
+        if self.own_pi:
+            self.pi.stop()
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The latest distance, age and timeouts of each sensor for logging.
+        """
+        parts = []
+        for name in self.sensors:
+            reading = self.reading(name)
+            distance = f"{reading['distance']:.1f}cm" if reading["distance"] is not None else "-"
+            parts.append(f"{name}: {distance} ({reading['age']*1000:.0f}ms, {self.stats[name]['timeouts']}/{self.stats[name]['pings']} timeouts)")
+        return "USS: " + " | ".join(parts)
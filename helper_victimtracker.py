@@ -0,0 +1,315 @@
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+import helper_evac as evac
+
+# Type aliases
+Rect = Tuple[int, int, int, int]
+
+class VictimTrack:
+    """
+    A single victim, tracked with a constant velocity alpha-beta filter on its (x, y, r).
+    """
+
+    def __init__(self, track_id: int, detection: np.ndarray) -> None:
+        """
+        Start a track from a detection.
+
+        Args:
+            track_id (int): The unique ID of the track.
+            detection (np.ndarray): The detection as (x, y, r, bar).
+        """
+        self.id = track_id
+        self.state = detection[:3].astype(float)    # [x, y, r]
+        self.velocity = np.zeros(3)                 # Change of [x, y, r] per frame
+        self.bar = int(detection[3])                # Height bar of the last detection
+        self.last_seen = detection[:3].astype(float)
+        self.hits = 1
+        self.misses = 0                             # Frames in a row without a detection
+
+    def predict(self) -> None:
+        """
+        Moves the track forward one frame.
+        """
+        self.state = self.state + self.velocity
+
+    def correct(self, detection: np.ndarray, alpha: float, beta: float) -> None:
+        """
+        Corrects the predicted state with a detection.
+
+        Args:
+            detection (np.ndarray): The detection as (x, y, r, bar).
+            alpha (float): Position correction gain.
+            beta (float): Velocity correction gain.
+        """
+        residual = detection[:3] - self.state
+        self.state = self.state + alpha * residual
+        self.velocity = self.velocity + beta * residual
+        self.bar = int(detection[3])
+        self.last_seen = detection[:3].astype(float)
+        self.hits += 1
+        self.misses = 0
+
+    def circle(self) -> List[int]:
+        """
+        Returns:
+            list[int]: The tracked circle as [x, y, r, bar], in the same format as evac.filter_victims_by_height.
+        """
+        x, y, r = np.round(self.state).astype(int)
+        return [int(x), int(y), int(r), self.bar]
+
+class VictimTracker:
+    """
+    Tracks victims across frames, so a victim isn't lost the first frame the detector misses it.
+
+    Once a victim is confirmed, detection only runs in a small window around each predicted track,
+    with a full-frame search every full_search_interval frames (or when a window finds nothing) to pick up new victims.
+    A new victim keeps the full-frame search going until it is confirmed or dropped.
+    """
+
+    def __init__(
+        self,
+        gate: int = 60,
+        max_misses: int = 8,
+        confirm_hits: int = 2,
+        window_margin: int = 40,
+        full_search_interval: int = 10,
+        alpha: float = 0.7,
+        beta: float = 0.3,
+    ) -> None:
+        """
+        Initialise the tracker.
+
+        Args:
+            gate (int, optional): The furthest (px) a detection can be from a predicted track to be associated with it. Defaults to 60.
+            max_misses (int, optional): Frames in a row a confirmed track can go undetected before it is dropped. Defaults to 8.
+            confirm_hits (int, optional): Detections needed before a track is used for steering. Defaults to 2.
+            window_margin (int, optional): Padding (px) added around a predicted victim when searching its window. Defaults to 40.
+            full_search_interval (int, optional): Force a full-frame search after this many windowed frames. Defaults to 10.
+            alpha (float, optional): Position correction gain. Defaults to 0.7.
+            beta (float, optional): Velocity correction gain. Defaults to 0.3.
+        """
+        self.gate = gate
+        self.max_misses = max_misses
+        self.confirm_hits = confirm_hits
+        self.window_margin = window_margin
+        self.full_search_interval = full_search_interval
+        self.alpha = alpha
+        self.beta = beta
+
+        self.tracks: List[VictimTrack] = []
+        self.next_id = 0
+        self.frames_since_full = 0
+        self.frames_since_reset = 0
+        self.force_full = True
+
+        self.stats = {
+            "frames": 0,
+            "full_searches": 0,
+            "window_searches": 0,
+            "pixels_total": 0,
+            "pixels_saved": 0,
+            "tracks_created": 0,
+        }
+
+    def reset(self) -> None:
+        """
+        Forget all tracks, for when the robot has moved too far for them to be predicted (e.g. rotating or approaching).
+        """
+        self.tracks = []
+        self.frames_since_reset = 0
+        self.force_full = True
+
+    def confirmed_tracks(self) -> List[VictimTrack]:
+        """
+        Returns:
+            list[VictimTrack]: The tracks with enough detections to be trusted.
+        """
+        return [track for track in self.tracks if track.hits >= self.confirm_hits]
+
+    def tentative_tracks(self) -> List[VictimTrack]:
+        """
+        Returns:
+            list[VictimTrack]: The tracks that were detected last frame, but haven't been detected enough times to be trusted yet.
+        """
+        return [track for track in self.tracks if track.hits < self.confirm_hits]
+
+    def windows(self, shape: Tuple[int, int]) -> List[Rect]:
+        """
+        Predicts where each confirmed victim will be searched for in the next frame.
+
+        Args:
+            shape (tuple[int, int]): The shape of the image. (height, width)
+
+        Returns:
+            list[Rect]: The windows as (x, y, w, h).
+        """
+        windows = []
+        for track in self.confirmed_tracks():
+            x, y, r = track.state
+            dx, dy, dr = track.velocity
+            pad = r + abs(dr) + self.window_margin
+
+            x0 = int(max(0, x + dx - pad - abs(dx)))
+            y0 = int(max(0, y + dy - pad - abs(dy)))
+            x1 = int(min(shape[1], x + dx + pad + abs(dx)))
+            y1 = int(min(shape[0], y + dy + pad + abs(dy)))
+            if x1 > x0 and y1 > y0:
+                windows.append((x0, y0, x1 - x0, y1 - y0))
+        return windows
+
+    def detect(self, images: Dict[str, np.ndarray], find_victims: Callable[[Dict[str, np.ndarray]], np.ndarray]) -> Tuple[np.ndarray, Optional[List[Rect]]]:
+        """
+        Runs the victim detector, only in the windows around the predicted victims when possible.
+
+        Args:
+            images (dict): The images from evac.preprocess.
+            find_victims (Callable): Finds victims in a dict of images, returning an array of (x, y, r).
+
+        Returns:
+            detections: The circles found, as an array of (x, y, r) in full-frame coordinates.
+            windows: The windows that were searched, or None if the full frame was searched.
+        """
+        shape = images["binary_rescue"].shape
+        full_pixels = shape[0] * shape[1]
+        self.stats["frames"] += 1
+        self.stats["pixels_total"] += full_pixels
+
+        windows = None
+        if not self.force_full and self.frames_since_full < self.full_search_interval:
+            windows = self.windows(shape)
+
+        if windows:
+            detections = []
+            for x, y, w, h in windows:
+                window_images = {name: image[y:y+h, x:x+w] for name, image in images.items() if image is not None}
+                circles = find_victims(window_images)
+                detections.append(circles + np.array([x, y, 0]))
+            detections = self._merge_duplicates(np.concatenate(detections))
+
+            self.frames_since_full += 1
+            self.stats["window_searches"] += 1
+            self.stats["pixels_saved"] += full_pixels - sum(w * h for _, _, w, h in windows)
+            return detections, windows
+
+        self.frames_since_full = 0
+        self.force_full = False
+        self.stats["full_searches"] += 1
+        return find_victims(images), None
+
+    def update(self, detections: np.ndarray, windowed: bool = False) -> List[VictimTrack]:
+        """
+        Predicts every track forward a frame, then associates the detections with them.
+        Detections are matched to the nearest predicted track within the gate, closest pairs first.
+
+        Args:
+            detections (np.ndarray): The valid victims this frame, as an array of (x, y, r, bar).
+            windowed (bool, optional): Whether the detections came from a windowed search.
+                                       New victims can't be found outside the windows, so no tracks are started. Defaults to False.
+
+        Returns:
+            list[VictimTrack]: The confirmed tracks.
+        """
+        self.frames_since_reset += 1
+        for track in self.tracks:
+            track.predict()
+
+        matched_tracks = set()
+        matched_detections = set()
+        if len(self.tracks) > 0 and len(detections) > 0:
+            predicted = np.array([track.state[:2] for track in self.tracks])
+            distances = np.linalg.norm(predicted[:, None, :] - detections[None, :, :2], axis=2)
+
+            for index in np.argsort(distances, axis=None):
+                t, d = np.unravel_index(index, distances.shape)
+                if distances[t, d] > self.gate:
+                    break
+                if t in matched_tracks or d in matched_detections:
+                    continue
+                self.tracks[t].correct(detections[d], self.alpha, self.beta)
+                matched_tracks.add(t)
+                matched_detections.add(d)
+
+        for t, track in enumerate(self.tracks):
+            # Windows are only searched around confirmed tracks, so a tentative track can't be missed by a windowed search
+            if t not in matched_tracks and not (windowed and track.hits < self.confirm_hits):
+                track.misses += 1
+        # A track that misses before it is confirmed was probably noise, so it is dropped straight away
+        self.tracks = [track for track in self.tracks if track.misses <= (self.max_misses if track.hits >= self.confirm_hits else 0)]
+
+        # A window that lost its victim might mean it moved further than predicted, so look everywhere next frame
+        if windowed and len(matched_tracks) < len(self.confirmed_tracks()):
+            self.force_full = True
+
+        if not windowed:
+            for d, detection in enumerate(detections):
+                if d not in matched_detections:
+                    self.tracks.append(VictimTrack(self.next_id, detection))
+                    self.next_id += 1
+                    self.stats["tracks_created"] += 1
+                    # Search the full frame again next frame, so the new victim can be confirmed
+                    self.force_full = True
+
+        return self.confirmed_tracks()
+
+    def step(self, images: Dict[str, np.ndarray], circle_conf: dict, minradius_offset: int) -> Tuple[Optional[VictimTrack], np.ndarray]:
+        """
+        Detects and tracks victims for one frame.
+
+        Args:
+            images (dict): The images from evac.preprocess.
+            circle_conf (dict): rescue_circle_conf from config.json.
+            minradius_offset (int): How much larger than the minimum radius a circle can be.
+
+        Returns:
+            target: The victim to go to, or None if no victim is being tracked.
+            detections: The circles found this frame (before the height filter), for drawing.
+        """
+        detections, windows = self.detect(images, lambda window_images: evac.find_victims(window_images, circle_conf))
+        valid = evac.filter_victims_by_height(detections, images["binary_rescue"].shape[0], minradius_offset)
+        tracks = self.update(valid, windowed=windows is not None)
+        return self.target(tracks), detections
+
+    def target(self, tracks: List[VictimTrack]) -> Optional[VictimTrack]:
+        """
+        Chooses the victim to go to, in the same order as evac.filter_victims_by_height: closest height bar, then leftmost.
+
+        Args:
+            tracks (list[VictimTrack]): The confirmed tracks.
+
+        Returns:
+            Optional[VictimTrack]: The target, or None if there are no tracks.
+        """
+        if len(tracks) == 0:
+            return None
+        return min(tracks, key=lambda track: (track.bar, track.state[0]))
+
+    def _merge_duplicates(self, detections: np.ndarray) -> np.ndarray:
+        """
+        Removes detections of the same victim from overlapping windows.
+
+        Args:
+            detections (np.ndarray): The circles as an array of (x, y, r).
+
+        Returns:
+            np.ndarray: The circles, keeping the first of any that are within half a radius of each other.
+        """
+        kept = []
+        for detection in detections:
+            if all(np.hypot(*(detection[:2] - other[:2])) > other[2] / 2 for other in kept):
+                kept.append(detection)
+        return np.array(kept, dtype=int).reshape(-1, 3)
+
+    def saved_fraction(self) -> float:
+        """
+        Returns:
+            float: The fraction of pixels that did not need to be searched for victims (0-1).
+        """
+        return self.stats["pixels_saved"] / self.stats["pixels_total"] if self.stats["pixels_total"] > 0 else 0
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: A summary of the tracking for logging.
+        """
+        return f"Tracks: {len(self.confirmed_tracks())}/{len(self.tracks)} | Full searches: {self.stats['full_searches']}/{self.stats['frames']} | Saved: {int(self.saved_fraction()*100)}%"
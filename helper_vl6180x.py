@@ -0,0 +1,197 @@
+import threading
+import helper_clock as clock
+import helper_devices as devices
+from typing import Optional
+from helper_i2c import arbiter
+
+class VL6180XSampler:
+    """
+    Reads a VL6180X in a background thread, using the sensor's continuous ranging mode,
+    and publishes the latest timestamped range and lux readings.
+
+    Readers never wait on the I2C bus: latest() returns immediately, and wait_for_range()
+    wakes as soon as a new range sample crosses the threshold.
+    """
+
+    def __init__(self, sensor, period_ms: int = 20, lux_interval: float = 0.25, lux_gain: int = devices.VL6180X_ALS_GAIN_1) -> None:
+        """
+        Initialise the sampler.
+
+        Args:
+            sensor (adafruit_vl6180x.VL6180X): The sensor to read, from helper_devices.vl6180x.
+            period_ms (int, optional): The continuous ranging period (ms). The sensor's minimum is 20. Defaults to 20.
+            lux_interval (float, optional): How often to take a lux reading (s), or 0 to never read lux. Defaults to 0.25.
+            lux_gain (int, optional): The ALS gain used for lux readings (see test_tof.py). Defaults to ALS_GAIN_1.
+        """
+        self.sensor = sensor
+        self.period_ms = max(20, period_ms)
+        self.lux_interval = lux_interval
+        self.lux_gain = lux_gain
+
+        # Replaced as a whole so readers always see a matching value and timestamp
+        self.reading = {
+            "range": None,
+            "range_time": 0,
+            "lux": None,
+            "lux_time": 0,
+        }
+        self.new_sample = threading.Condition()
+
+        self.thread = None
+        self.running = False
+        self.continuous = False
+
+        self.stats = {
+            "samples": 0,
+            "lux_samples": 0,
+            "errors": 0,
+            "read_time_total": 0,
+            "read_time_max": 0,
+            "start_time": 0,
+        }
+
+    def start(self) -> None:
+        """
+        Starts continuous ranging and the sampler thread. Does nothing if it is already running.
+        """
+        if self.running:
+            return
+
+        # Older versions of the library don't support continuous mode, so fall back to single shot readings
+        try:
+            arbiter.run("vl6180x", lambda: self.sensor.start_range_continuous(self.period_ms))
+            self.continuous = True
+        except (AttributeError, OSError) as e:
+            print(f"[VL6180X] Continuous mode unavailable, using single shot readings ({e})")
+            self.continuous = False
+
+        self.running = True
+        self.stats["start_time"] = clock.now()
+        self.thread = threading.Thread(target=self.update, args=(), daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the sampler thread and continuous ranging, so the sensor can be used directly again.
+        """
+        if not self.running:
+            return
+
+        self.running = False
+        self.thread.join(1)
+        if self.continuous:
+            try:
+                arbiter.run("vl6180x", self.sensor.stop_range_continuous)
+            except OSError:
+                print("[WARN] OSError while stopping VL6180X continuous ranging.")
+        self.continuous = False
+
+    def update(self) -> None:
+        last_lux_time = 0
+        next_sample_time = clock.now()
+
+        while self.running:
+            # The library polls the sensor until a sample is ready, so wait out most of the period first to keep the bus free
+            clock.sleep(max(0, next_sample_time - clock.now()))
+            next_sample_time = clock.now() + self.period_ms / 1000 * 0.9
+
+            try:
+                start = clock.now()
+                range_mm = arbiter.run("vl6180x", lambda: self.sensor.range, key="range")
+                read_time = clock.now() - start
+            except OSError:
+                self.stats["errors"] += 1
+                continue
+
+            self.stats["samples"] += 1
+            self.stats["read_time_total"] += read_time
+            self.stats["read_time_max"] = max(self.stats["read_time_max"], read_time)
+
+            reading = dict(self.reading)
+            reading["range"] = range_mm
+            reading["range_time"] = clock.now()
+
+            if self.lux_interval > 0 and clock.now() - last_lux_time > self.lux_interval:
+                last_lux_time = clock.now()
+                try:
+                    reading["lux"] = arbiter.run("vl6180x", lambda: self.sensor.read_lux(self.lux_gain), key="lux")
+                    reading["lux_time"] = clock.now()
+                    self.stats["lux_samples"] += 1
+                except OSError:
+                    self.stats["errors"] += 1
+
+            with self.new_sample:
+                self.reading = reading
+                clock.notify(self.new_sample)
+
+    def latest(self) -> dict:
+        """
+        Returns:
+            dict: The latest reading, as {range, range_time, lux, lux_time}. Values are None until the first sample.
+        """
+        return self.reading
+
+    def wait_for_range(self, max_range: int, timeout: float) -> bool:
+        """
+        Waits until a new range sample is at or below max_range.
+
+        Args:
+            max_range (int): The range to wait for (mm).
+            timeout (float): The longest time to wait (s).
+
+        Returns:
+            bool: True if the range was reached, False if it timed out (or the sampler isn't running).
+        """
+        end_time = clock.now() + timeout
+        with self.new_sample:
+            while self.running and clock.now() < end_time:
+                reading = self.reading
+                if reading["range"] is not None and reading["range"] <= max_range and reading["range_time"] > end_time - timeout:
+                    return True
+                clock.wait(self.new_sample, end_time - clock.now())
+        return False
+
+    def wait_for_sample(self, timeout: float) -> dict:
+        """
+        Waits for a range sample taken after this was called, e.g. to read the sensor after the claw has closed.
+
+        Args:
+            timeout (float): The longest time to wait (s).
+
+        Returns:
+            dict: The latest reading, which may be old if it timed out.
+        """
+        start_time = clock.now()
+        with self.new_sample:
+            while self.running and self.reading["range_time"] <= start_time and clock.now() - start_time < timeout:
+                clock.wait(self.new_sample, timeout - (clock.now() - start_time))
+        return self.reading
+
+    def age(self) -> Optional[float]:
+        """
+        Returns:
+            Optional[float]: How old the latest range reading is (s), or None if there hasn't been one.
+        """
+        if self.reading["range"] is None:
+            return None
+        return clock.now() - self.reading["range_time"]
+
+    def get_rate(self) -> float:
+        """
+        Returns:
+            float: The range sample rate since the sampler started (Hz).
+        """
+        elapsed = clock.now() - self.stats["start_time"]
+        return self.stats["samples"] / elapsed if self.stats["start_time"] > 0 and elapsed > 0 else 0
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: The sample rate and latency for logging.
+        """
+        mean_read = self.stats["read_time_total"] / self.stats["samples"] * 1000 if self.stats["samples"] > 0 else 0
+        age = self.age()
+        return (
+            f"ToF: {self.get_rate():.0f}Hz | Read: {mean_read:.1f}ms (max {self.stats['read_time_max']*1000:.1f}ms)"
+            f" | Age: {age*1000 if age is not None else 0:.0f}ms | Errors: {self.stats['errors']}"
+        )
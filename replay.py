@@ -0,0 +1,496 @@
+import os
+import sys
+import glob
+import json
+import time
+import cv2
+import numpy as np
+import helper_camerakit as ck
+import helper_evac as evac
+
+# Replays recorded camera frames through the vision code, to compare and time detectors off the robot.
+#
+# Usage:
+#   python3 replay.py record <frames dir> [num frames]   (on the robot) Save raw camera frames
+#   python3 replay.py synth <frames dir> [num frames]    Generate synthetic frames, with labels.json and a matching calibration.json
+#   python3 replay.py <command> <frames dir>             Run a comparison on saved frames
+#
+# Commands:
+#   bands   Compare the projection profile red stop / evac entrance detectors against the contour based checks
+#   green   Benchmark the ROI bounded green turn mask against the full frame version, and check they are identical
+#   victims Benchmark the contour victim detector against HoughCircles, using the Hough victims as the reference for recall
+#   blocks  Compare the downscaled connected component block detector against the full resolution contour version
+
+def load_config(frames_dir: str = None) -> tuple[dict, dict]:
+    """
+    Loads the calibration and config files, in the same way as follower.py.
+    A calibration.json in the frames directory (e.g. from synth) is used before the robot's own.
+    If there is neither, a flat calibration map is used.
+
+    Args:
+        frames_dir (str, optional): The directory of saved frames. Defaults to None.
+
+    Returns:
+        dict: The processing configuration for ck.processFrame.
+        dict: The config values, plus the rescue calibration map.
+    """
+    calibration_path = "calibration.json"
+    if frames_dir is not None and os.path.exists(os.path.join(frames_dir, "calibration.json")):
+        calibration_path = os.path.join(frames_dir, "calibration.json")
+
+    try:
+        with open(calibration_path, "r") as json_file:
+            calibration_data = json.load(json_file)
+        calibration_map = 255 / np.array(calibration_data["calibration_map_w"])
+        calibration_map_rescue = 255 / np.array(calibration_data["calibration_map_rescue_w"])
+    except FileNotFoundError:
+        print("[REPLAY] No calibration.json found, using a flat calibration map")
+        calibration_map = np.ones((429, 640))
+        calibration_map_rescue = np.ones((429, 640))
+
+    with open("config.json", "r") as json_file:
+        config_data = json.load(json_file)
+
+    config_values = {
+        "black_line_threshold": config_data["black_line_threshold"],
+        "black_rescue_threshold": config_data["black_rescue_threshold"],
+        "rescue_circle_conf": config_data["rescue_circle_conf"],
+        "green_turn_hsv_threshold": [np.array(bound) for bound in config_data["green_turn_hsv_threshold"]],
+        "red_hsv_threshold": [np.array(bound) for bound in config_data["red_hsv_threshold"]],
+        "obstacle_hsv_threshold": [np.array(bound) for bound in config_data["obstacle_hsv_threshold"]],
+        "rescue_block_hsv_threshold": [np.array(bound) for bound in config_data["rescue_block_hsv_threshold"]],
+        "rescue_circle_minradius_offset": config_data["rescue_circle_minradius_offset"],
+        "rescue_binary_gray_scale_multiplier": config_data["rescue_binary_gray_scale_multiplier"],
+        "camera_geometry": config_data["camera_geometry"],
+        "calibration_map_rescue": calibration_map_rescue,
+    }
+
+    processing_conf = {
+        "calibration_map": calibration_map,
+        "black_line_threshold": config_values["black_line_threshold"],
+        "green_turn_hsv_threshold": config_values["green_turn_hsv_threshold"],
+        "red_hsv_threshold": config_values["red_hsv_threshold"],
+    }
+    return processing_conf, config_values
+
+def load_frames(frames_dir: str):
+    """
+    Loads saved frames in name order.
+
+    Args:
+        frames_dir (str): The directory of saved frames.
+
+    Yields:
+        tuple[str, np.ndarray]: The name and raw frame.
+    """
+    paths = sorted(glob.glob(os.path.join(frames_dir, "*.png")))
+    if len(paths) == 0:
+        print(f"[REPLAY] No frames found in {frames_dir}")
+    for path in paths:
+        yield os.path.basename(path), cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+def load_labels(frames_dir: str) -> dict:
+    """
+    Loads the ground truth of synthetic frames, written by synth.
+
+    Returns:
+        dict: The ground truth of each frame name, or None if the frames have no labels.json.
+    """
+    try:
+        with open(os.path.join(frames_dir, "labels.json"), "r") as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return None
+
+def time_call(func, *args) -> tuple[object, float]:
+    """
+    Calls a function and times it.
+
+    Returns:
+        object: The return value of the function.
+        float: The time taken in microseconds.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1e6
+
+def record(frames_dir: str, num_frames: int = 500) -> None:
+    """
+    Saves raw frames from the camera stream. Must be run on the robot.
+
+    Args:
+        frames_dir (str): The directory to save frames to.
+        num_frames (int, optional): The number of frames to save. Defaults to 500.
+    """
+    import helper_camera
+
+    os.makedirs(frames_dir, exist_ok=True)
+    cam = helper_camera.CameraStream()
+    cam.start_stream()
+    time.sleep(1)
+
+    last_frame = None
+    saved = 0
+    while saved < num_frames:
+        frame = cam.read_stream()
+        if frame is None or frame is last_frame:
+            time.sleep(0.001)
+            continue
+        last_frame = frame
+        cv2.imwrite(os.path.join(frames_dir, f"{saved:05d}.png"), frame)
+        saved += 1
+        print(f"[REPLAY] Saved frame {saved}/{num_frames}", end="\r")
+
+    cam.stop()
+    print()
+
+def synth(frames_dir: str, num_frames: int = 200, seed: int = 0) -> None:
+    """
+    Saves synthetic frames from helper_synthetic, with their ground truth in labels.json,
+    and the calibration.json that matches their lighting.
+
+    Args:
+        frames_dir (str): The directory to save frames to.
+        num_frames (int, optional): The number of frames to save. Defaults to 200.
+        seed (int, optional): The random seed, so the same frames can be made again. Defaults to 0.
+    """
+    import helper_synthetic
+
+    os.makedirs(frames_dir, exist_ok=True)
+    generator = helper_synthetic.FrameGenerator(helper_synthetic.load_camera_geometry(), seed=seed)
+
+    labels = {}
+    for i, (name, frame, truth) in enumerate(generator.corpus(num_frames)):
+        cv2.imwrite(os.path.join(frames_dir, f"{name}.png"), frame)
+        labels[f"{name}.png"] = truth
+        print(f"[REPLAY] Generated frame {i + 1}/{num_frames}", end="\r")
+    print()
+
+    with open(os.path.join(frames_dir, "labels.json"), "w") as json_file:
+        json.dump(labels, json_file, indent=1)
+    with open(os.path.join(frames_dir, "calibration.json"), "w") as json_file:
+        json.dump(generator.calibration_data(), json_file)
+
+def evac_entrance_contour(line: np.ndarray) -> bool:
+    """
+    The contour based evac entrance check from follower.py, without the rest of the 3-way intersection handling:
+    a white contour touching the left, right and top, and the first black contour touching the bottom, left and right.
+    """
+    white_contours = cv2.findContours(line, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+    white_contours = [c for c in white_contours if cv2.contourArea(c) > 500]
+    if len(white_contours) != 3:
+        return False
+    if not any(sorted(ck.getTouchingEdges(ck.simplifiedContourPoints(c, 0.03), line.shape)) == ["left", "right", "top"] for c in white_contours):
+        return False
+
+    black_contours = cv2.findContours(cv2.bitwise_not(line), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+    return len(black_contours) >= 1 and sorted(ck.getTouchingEdges(ck.simplifiedContourPoints(black_contours[0], 0.03), line.shape)) == ["bottom", "left", "right"]
+
+def compare_bands(frames_dir: str) -> None:
+    """
+    Compares the projection profile detectors to the contour based checks they replace,
+    and to the ground truth for synthetic frames ("stop" for red, "evac" for the entrance).
+    """
+    processing_conf, config_values = load_config(frames_dir)
+    labels = load_labels(frames_dir)
+    truth_turns = {"red": "stop", "evac": "evac"}
+
+    results = {
+        "red": {"agree": 0, "disagree": [], "time_contour": [], "time_profile": [], "truth": []},
+        "evac": {"agree": 0, "disagree": [], "time_contour": [], "time_profile": [], "truth": []},
+    }
+
+    for name, frame in load_frames(frames_dir):
+        processed = ck.processFrame(frame, processing_conf)
+
+        (red_contour, _), t_contour = time_call(ck.findRedStopContour, processed["hsv"], config_values["red_hsv_threshold"])
+        (red_profile, _), t_profile = time_call(ck.findRedStopBand, processed["hsv"], config_values["red_hsv_threshold"])
+        results["red"]["time_contour"].append(t_contour)
+        results["red"]["time_profile"].append(t_profile)
+        if labels is not None:
+            results["red"]["truth"].append((labels[name].get("turn") == truth_turns["red"], red_contour, red_profile))
+        if red_contour == red_profile:
+            results["red"]["agree"] += 1
+        else:
+            results["red"]["disagree"].append(f"{name} (contour={red_contour}, profile={red_profile})")
+
+        evac_contour, t_contour = time_call(evac_entrance_contour, processed["line"])
+        (evac_profile, _), t_profile = time_call(ck.findEvacEntranceBand, processed["line"])
+        results["evac"]["time_contour"].append(t_contour)
+        results["evac"]["time_profile"].append(t_profile)
+        if labels is not None:
+            results["evac"]["truth"].append((labels[name].get("turn") == truth_turns["evac"], evac_contour, evac_profile))
+        if evac_contour == evac_profile:
+            results["evac"]["agree"] += 1
+        else:
+            results["evac"]["disagree"].append(f"{name} (contour={evac_contour}, profile={evac_profile})")
+
+    for check, result in results.items():
+        total = result["agree"] + len(result["disagree"])
+        if total == 0:
+            continue
+        print(f"[{check.upper()}] Agreement: {result['agree']}/{total} ({result['agree']/total*100:.1f}%)")
+        print(f"[{check.upper()}] Contour: {np.mean(result['time_contour']):.0f}us \tProfile: {np.mean(result['time_profile']):.0f}us")
+        if len(result["truth"]) > 0:
+            truth = np.array(result["truth"], dtype=bool)
+            positives = np.count_nonzero(truth[:, 0])
+            for i, detector in [(1, "Contour"), (2, "Profile")]:
+                found = np.count_nonzero(truth[:, 0] & truth[:, i])
+                false_positives = np.count_nonzero(~truth[:, 0] & truth[:, i])
+                print(f"[{check.upper()}] {detector} against labels: found {found}/{positives} \tFalse positives: {false_positives}")
+        for disagreement in result["disagree"]:
+            print(f"[{check.upper()}]     {disagreement}")
+
+def followable_green_contours(processed: dict) -> list:
+    """
+    Finds the white contours that contain a green marker and touch the bottom of the image, as follower.py does.
+
+    Returns:
+        list: The white contours that could be followed for a green turn.
+    """
+    if np.count_nonzero(processed["green"] == 0) <= 4000:
+        return []
+
+    white_contours = cv2.findContours(processed["line"], cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+    white_contours = [c for c in white_contours if cv2.contourArea(c) > 500]
+    green_contours = cv2.findContours(cv2.bitwise_not(processed["green"]), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[0]
+    green_contours = [c for c in green_contours if cv2.contourArea(c) > 1000]
+
+    followable = []
+    for g_contour in green_contours:
+        for w_contour in white_contours:
+            if cv2.pointPolygonTest(w_contour, ck.centerOfContour(g_contour), False) > 0:
+                x, y, w, h = cv2.boundingRect(w_contour)
+                if y + h >= processed["line"].shape[0] - 3:
+                    followable.append(w_contour)
+                break
+    return followable
+
+def green_turn_contours(line: np.ndarray, white_contour, use_roi: bool) -> list:
+    """
+    Builds the green turn line mask and finds its contours, as follower.py does.
+    """
+    new_line, (x, y, w, h) = ck.greenTurnLineMask(line, white_contour, use_roi=use_roi)
+    contours = cv2.findContours(new_line[y:y+h, x:x+w], cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))[0]
+    return new_line, contours, w * h
+
+def compare_green(frames_dir: str) -> None:
+    """
+    Benchmarks the ROI bounded green turn mask against the full frame version, on frames with a followable green marker.
+    """
+    processing_conf, config_values = load_config(frames_dir)
+
+    identical = 0
+    different = []
+    time_full = []
+    time_roi = []
+    roi_fraction = []
+
+    for name, frame in load_frames(frames_dir):
+        processed = ck.processFrame(frame, processing_conf)
+        line = processed["line"]
+
+        for white_contour in followable_green_contours(processed):
+            (full_line, full_contours, _), t_full = time_call(green_turn_contours, line, white_contour, False)
+            (roi_line, roi_contours, roi_pixels), t_roi = time_call(green_turn_contours, line, white_contour, True)
+            time_full.append(t_full)
+            time_roi.append(t_roi)
+            roi_fraction.append(roi_pixels / (line.shape[0] * line.shape[1]))
+
+            if (
+                np.array_equal(full_line, roi_line)
+                and len(full_contours) == len(roi_contours)
+                and all(np.array_equal(a, b) for a, b in zip(full_contours, roi_contours))
+            ):
+                identical += 1
+            else:
+                different.append(name)
+
+    total = identical + len(different)
+    if total == 0:
+        print("[GREEN] No followable green found in any frame")
+        return
+
+    print(f"[GREEN] Identical output: {identical}/{total}")
+    print(f"[GREEN] Full: {np.mean(time_full):.0f}us \tROI: {np.mean(time_roi):.0f}us \tSpeedup: {np.mean(time_full)/np.mean(time_roi):.2f}x")
+    print(f"[GREEN] Pixels processed: {np.mean(roi_fraction)*100:.1f}% of the frame")
+    for name in different:
+        print(f"[GREEN]     Different output: {name}")
+
+def match_circles(reference: np.ndarray, found: np.ndarray) -> int:
+    """
+    Counts the reference circles that have a found circle within half their radius.
+
+    Args:
+        reference (np.ndarray): The reference circles as an array of (x, y, r, ...).
+        found (np.ndarray): The found circles as an array of (x, y, r, ...).
+
+    Returns:
+        int: The number of reference circles that were found.
+    """
+    if len(reference) == 0 or len(found) == 0:
+        return 0
+    distances = np.linalg.norm(reference[:, None, :2] - found[None, :, :2], axis=2)
+    return int(np.count_nonzero(np.min(distances, axis=1) <= reference[:, 2] / 2))
+
+def compare_victims(frames_dir: str) -> None:
+    """
+    Benchmarks the contour victim detector against HoughCircles, after the height bar filter.
+    The Hough victims are treated as the reference, so check the listed frames by eye before trusting either.
+    For synthetic frames, both are also scored against the ground truth victims, by kind.
+    """
+    processing_conf, config_values = load_config(frames_dir)
+    labels = load_labels(frames_dir)
+    truth_results = {"hough": {}, "contour": {}}     # Kind -> [found, total], plus the centre and radius errors of matches
+    errors = {"hough": [], "contour": []}
+    circle_conf = config_values["rescue_circle_conf"]
+    minradius_offset = config_values["rescue_circle_minradius_offset"]
+
+    time_preprocess = []
+    time_hough = []
+    time_contour = []
+    hough_total = 0
+    contour_total = 0
+    matched = 0
+    different = []
+
+    for name, frame in load_frames(frames_dir):
+        processed = ck.processFrame(frame, processing_conf)
+        images, t_preprocess = time_call(evac.preprocess, processed["gray"], config_values["calibration_map_rescue"], config_values["black_rescue_threshold"])
+        time_preprocess.append(t_preprocess)
+
+        hough, t_hough = time_call(evac.find_victims_hough, images["blurred"], circle_conf)
+        contour, t_contour = time_call(evac.find_victims_contour, images["gray_rescue"], circle_conf)
+        time_hough.append(t_hough)
+        time_contour.append(t_contour)
+
+        hough = evac.filter_victims_by_height(hough, processed["gray"].shape[0], minradius_offset)
+        contour = evac.filter_victims_by_height(contour, processed["gray"].shape[0], minradius_offset)
+        found = match_circles(hough, contour)
+
+        if labels is not None and labels[name]["kind"] == "evac":
+            for detector, circles in [("hough", hough), ("contour", contour)]:
+                for victim in labels[name]["victims"]:
+                    reference = np.array([[victim["x"], victim["y"], victim["radius"]]])
+                    counts = truth_results[detector].setdefault(victim["kind"], [0, 0])
+                    counts[1] += 1
+                    if match_circles(reference, circles) > 0:
+                        counts[0] += 1
+                        nearest = circles[np.argmin(np.linalg.norm(circles[:, :2] - reference[:, :2], axis=1))]
+                        errors[detector].append(nearest[:3] - reference[0])
+
+        hough_total += len(hough)
+        contour_total += len(contour)
+        matched += found
+        if found != len(hough) or len(contour) != len(hough):
+            different.append(f"{name} (hough={len(hough)}, contour={len(contour)}, matched={found})")
+
+    if len(time_hough) == 0:
+        return
+
+    print(f"[VICTIMS] Preprocess: {np.mean(time_preprocess):.0f}us")
+    print(f"[VICTIMS] Hough: {np.mean(time_hough):.0f}us \tContour: {np.mean(time_contour):.0f}us \tSpeedup: {np.mean(time_hough)/np.mean(time_contour):.2f}x")
+    if hough_total > 0:
+        print(f"[VICTIMS] Recall against Hough: {matched}/{hough_total} ({matched/hough_total*100:.1f}%)")
+    print(f"[VICTIMS] Victims found: Hough {hough_total} \tContour {contour_total}")
+    for detector, kinds in truth_results.items():
+        if len(kinds) == 0:
+            continue
+        recall = " \t".join(f"{kind} {found}/{total}" for kind, (found, total) in sorted(kinds.items()))
+        bias = np.mean(errors[detector], axis=0) if len(errors[detector]) > 0 else np.zeros(3)
+        print(f"[VICTIMS] {detector.capitalize()} against labels: {recall} \tBias: x {bias[0]:+.1f} y {bias[1]:+.1f} r {bias[2]:+.1f}px")
+    for difference in different:
+        print(f"[VICTIMS]     {difference}")
+
+def blocks_contour(hsv: np.ndarray, binary_rescue: np.ndarray, hsv_threshold: list[np.ndarray]) -> list[dict]:
+    """
+    The full resolution contour based block detection that evac.find_blocks replaces.
+    """
+    block_mask = cv2.inRange(hsv, hsv_threshold[0], hsv_threshold[1])
+    block_mask = cv2.bitwise_and(cv2.bitwise_not(binary_rescue), block_mask)
+    block_mask = cv2.morphologyEx(block_mask, cv2.MORPH_OPEN, np.ones((13,13),np.uint8))
+
+    blocks = []
+    for contour in cv2.findContours(block_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+        x, y, w, h = cv2.boundingRect(contour)
+        block = {"contourArea": cv2.contourArea(contour), "boundingRect": (x, y, w, h), "touching_sides": [], "near_sides": []}
+        for kind, threshold in zip(["touching_sides", "near_sides"], [10, 50]):
+            if x < threshold: block[kind].append("left")
+            if y < threshold: block[kind].append("top")
+            if x + w > hsv.shape[1] - threshold: block[kind].append("right")
+            if y + h > hsv.shape[0] - threshold: block[kind].append("bottom")
+        blocks.append(block)
+
+    blocks = [b for b in blocks if b["contourArea"] > 10000 and "top" not in b["touching_sides"]]
+    return sorted(blocks, key=lambda b: b["contourArea"], reverse=True)
+
+def rect_iou(a: tuple, b: tuple) -> float:
+    """
+    Returns:
+        float: The intersection over union of two (x, y, w, h) rects.
+    """
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0
+
+def compare_blocks(frames_dir: str) -> None:
+    """
+    Compares the block that would be steered to by each detector: its touching sides and bounding rect.
+    """
+    processing_conf, config_values = load_config(frames_dir)
+    threshold = config_values["rescue_block_hsv_threshold"]
+
+    agree = 0
+    disagree = []
+    time_contour = []
+    time_components = []
+    ious = []
+
+    for name, frame in load_frames(frames_dir):
+        processed = ck.processFrame(frame, processing_conf)
+        images = evac.preprocess(processed["gray"], config_values["calibration_map_rescue"], config_values["black_rescue_threshold"], blur=False)
+
+        contour, t_contour = time_call(blocks_contour, processed["hsv"], images["binary_rescue"], threshold)
+        components, t_components = time_call(evac.find_blocks, processed["hsv"], images["binary_rescue"], threshold)
+        time_contour.append(t_contour)
+        time_components.append(t_components)
+
+        if len(contour) == 0 and len(components) == 0:
+            agree += 1
+        elif len(contour) > 0 and len(components) > 0 and contour[0]["touching_sides"] == components[0]["touching_sides"]:
+            agree += 1
+            ious.append(rect_iou(contour[0]["boundingRect"], components[0]["boundingRect"]))
+        else:
+            disagree.append(f"{name} (contour={contour[0]['touching_sides'] if contour else None}, components={components[0]['touching_sides'] if components else None})")
+
+    total = agree + len(disagree)
+    if total == 0:
+        return
+
+    print(f"[BLOCKS] Agreement: {agree}/{total} ({agree/total*100:.1f}%)")
+    if len(ious) > 0:
+        print(f"[BLOCKS] Mean bounding rect IoU: {np.mean(ious):.2f}")
+    print(f"[BLOCKS] Contour: {np.mean(time_contour):.0f}us \tComponents: {np.mean(time_components):.0f}us \tSpeedup: {np.mean(time_contour)/np.mean(time_components):.2f}x")
+    for disagreement in disagree:
+        print(f"[BLOCKS]     {disagreement}")
+
+COMMANDS = {
+    "bands": compare_bands,
+    "green": compare_green,
+    "victims": compare_victims,
+    "blocks": compare_blocks,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or (sys.argv[1] not in ("record", "synth") and sys.argv[1] not in COMMANDS):
+        print(f"Usage: python3 replay.py <record|synth|{'|'.join(COMMANDS.keys())}> <frames dir>")
+        sys.exit()
+
+    if sys.argv[1] == "record":
+        record(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 500)
+    elif sys.argv[1] == "synth":
+        synth(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 200)
+    else:
+        COMMANDS[sys.argv[1]](sys.argv[2])
@@ -1,10 +1,10 @@
-import RPi.GPIO as GPIO
 import time
 import os
 import sys
 import signal
 import subprocess
 import helper_motorkit as m
+import helper_devices as devices
 from git import Repo
 from colorama import init
 
@@ -13,8 +13,7 @@ init()
 RUN_PIN = 21
 ENABLE_GIT = False
 
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(RUN_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+run_switch = devices.digital_input(RUN_PIN, pull_up=True) # value is 1 when the switch pulls the pin low
 
 print("\033[1;33m[RUNNER]\033[1;m \033[1;37mStarting CatBot...")
 
@@ -43,14 +42,14 @@ def pushToGit():
         print("\033[1;33m[RUNNER]\033[1;m \033[1;31mFailed to save to git\033[1;37m")
         print(e)
 
-if GPIO.input(RUN_PIN):
+if not run_switch.value:
     print("\033[1;33m[RUNNER]\033[1;m \033[1;37mFollower is disabled, waiting to start...")
 p = None
 state = 0
 
 while True:
     try:
-        input_state = not GPIO.input(RUN_PIN)
+        input_state = bool(run_switch.value)
         if p is not None:
             process_state = p.poll()
             if input_state == True and process_state is not None: